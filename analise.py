@@ -0,0 +1,315 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import cv2
+
+from estatisticas_roi import estatisticas_volume, tabela_integral
+from imagem_ct import como_ct
+
+# Análise das imagens do objeto simulador, sem dependência do Streamlit
+# (usada pela página "Qualidade da Imagem" e pela análise em lote).
+
+NOMES_ROIS = ["1", "2", "3", "4", "5"]  # Centro, 3h, 6h, 9h, 12h
+
+# Limites de tolerância da IN 93/2021
+LIMITE_RUIDO = 15
+LIMITE_UNIFORMIDADE = 5
+
+# Material: (limite de exatidão em ±HU, CT médio de referência)
+LIMITES_EXATIDAO = {
+    "Água": (5, 0),     # Para Água, o CT médio de referência é 0 (e intervalo de ±5)
+    "Ar": (10, 1000),   # Para Ar, o CT médio de referência será 1000 (e intervalo de ±10)
+}
+
+# ---------------- Funções ----------------
+def circular_mask(h, w, center=None, radius=None):
+    if center is None:
+        center = (w // 2, h // 2)
+    if radius is None:
+        radius = min(center[0], center[1], w - center[0], h - center[1])
+    Y, X = np.ogrid[:h, :w]
+    return (X - center[0])**2 + (Y - center[1])**2 <= radius**2
+
+def crop_rois(img, centers, size=50):
+    rois = []
+    r = size // 2
+    for x, y in centers:
+        x0, y0 = max(x - r, 0), max(y - r, 0)
+        roi = np.array(img[y0:y0 + size, x0:x0 + size])  # Em HU; de uma `ImagemCT`, só o recorte é convertido
+        h_roi, w_roi = roi.shape
+        mask = circular_mask(h_roi, w_roi, radius=min(r, h_roi // 2, w_roi // 2))
+        rois.append(roi[mask].flatten())
+    return rois
+
+# Lado (em pixels) do nível reduzido da pirâmide usado na busca grosseira do phantom
+LADO_BUSCA_GROSSEIRA = 256
+
+# Círculos já detectados, indexados pelo hash do conteúdo da imagem
+_CIRCULOS = OrderedDict()
+_TRAVA_CIRCULOS = threading.Lock()
+_MAX_CIRCULOS = 512
+
+def _hough(img8, min_raio, max_raio, min_dist):
+    circles = cv2.HoughCircles(
+        img8,
+        cv2.HOUGH_GRADIENT,
+        dp=1.2,
+        minDist=min_dist,
+        param1=50,
+        param2=30,
+        minRadius=min_raio,
+        maxRadius=max_raio
+    )
+    if circles is None:
+        return None
+    return circles[0][0]
+
+def _detecta_circulo(img):
+    # Normalização em float32 para qualquer tipo de entrada (valores armazenados ou HU)
+    img8 = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_32F).astype(np.uint8)
+    h, w = img8.shape
+    min_raio, max_raio = int(min(h, w) / 6), int(min(h, w) / 2)
+
+    # Busca grosseira em um nível reduzido da pirâmide
+    fator = max(1.0, min(h, w) / LADO_BUSCA_GROSSEIRA)
+    if fator > 1:
+        reduzida = cv2.resize(img8, (round(w / fator), round(h / fator)), interpolation=cv2.INTER_AREA)
+    else:
+        reduzida = img8
+    circulo = _hough(
+        cv2.medianBlur(reduzida, 5),
+        int(min_raio / fator), int(max_raio / fator), 100 / fator
+    )
+    if circulo is None:
+        return None
+    if fator == 1:
+        return circulo
+
+    # Refinamento em resolução total, numa janela ao redor do círculo encontrado
+    x, y, r = circulo * fator
+    margem = int(3 * fator) + 5
+    x0, y0 = max(int(x - r) - margem, 0), max(int(y - r) - margem, 0)
+    x1, y1 = min(int(x + r) + margem + 1, w), min(int(y + r) + margem + 1, h)
+    janela = cv2.medianBlur(np.ascontiguousarray(img8[y0:y1, x0:x1]), 5)
+    refinado = _hough(janela, max(int(r - 2 * fator), 1), int(r + 2 * fator) + 1, max(h, w))
+    if refinado is None:
+        return circulo * fator
+    return refinado + (x0, y0, 0)
+
+def detectar_centro_phantom(img):
+    """Detecta o centro do phantom circular usando transformada de Hough (busca grosseira e refinamento).
+
+    A normalização para 8 bits não depende da reta de conversão (crescente) para
+    HU, então uma `ImagemCT` é analisada direto nos valores armazenados.
+    """
+    img = np.ascontiguousarray(como_ct(img).bruta)
+    chave = (img.shape, img.dtype.str, hashlib.sha256(img).digest())
+    with _TRAVA_CIRCULOS:
+        if chave in _CIRCULOS:
+            _CIRCULOS.move_to_end(chave)
+            return _CIRCULOS[chave]
+
+    circulo = _detecta_circulo(img)
+    if circulo is not None:
+        x, y, r = (int(v) for v in np.around(circulo))
+    else:
+        h, w = img.shape
+        x, y, r = (w // 2, h // 2, min(h, w) // 3)
+
+    with _TRAVA_CIRCULOS:
+        _CIRCULOS[chave] = (x, y, r)
+        while len(_CIRCULOS) > _MAX_CIRCULOS:
+            _CIRCULOS.popitem(last=False)
+    return (x, y, r)
+
+def geometria_rois(circulo, fator_raio=1.0, fracao_desloc=0.75, radius_roi=None):
+    """Posiciona as cinco ROIs (centro, 3h, 6h, 9h, 12h) a partir do círculo do phantom."""
+    x_c, y_c, r_c = circulo
+    r_c_ajustado = int(r_c * fator_raio)
+
+    desloc = int(r_c_ajustado * fracao_desloc)
+    if radius_roi is None:
+        radius_roi = int(25 * fator_raio)
+
+    centers = [
+        (x_c, y_c),            # Centro
+        (x_c + desloc, y_c),   # 3h
+        (x_c, y_c + desloc),   # 6h
+        (x_c - desloc, y_c),   # 9h
+        (x_c, y_c - desloc)    # 12h
+    ]
+    return r_c_ajustado, centers, radius_roi
+
+def avalia_conformidade(ct_medios, desvios, material="Água"):
+    """Calcula exatidão, ruído e uniformidade e compara com os limites da IN 93/2021."""
+    limite_exatidao, ct_medio_ref = LIMITES_EXATIDAO[material]
+
+    # --- Ruído individual (desvio padrão dividido por 1000, multiplicado por 100) ---
+    ruido_percent = [(d / 1000) * 100 for d in desvios]
+
+    # --- Uniformidade (diferença do valor médio entre o centro e as periferias) ---
+    ct_central = ct_medios[0]
+    delta_ct_perifericos = [ct_medios[i] - ct_central for i in range(1, 5)]
+    uniformidade = max(abs(np.array(delta_ct_perifericos)))
+
+    # Avaliações de conformidade para exatidão (verificando se o CT médio está dentro do intervalo permitido)
+    # Para "Água", verifica-se o intervalo de -5 a +5 (referência 0)
+    # Para "Ar", verifica-se o intervalo de 990 a 1010 (referência 1000)
+    exatidao_ok = all(ct_medio_ref - limite_exatidao <= ct <= ct_medio_ref + limite_exatidao for ct in ct_medios)
+
+    ruido_ok = all(r <= LIMITE_RUIDO for r in ruido_percent)
+    uniformidade_ok = uniformidade <= LIMITE_UNIFORMIDADE
+
+    return {
+        "material": material,
+        "limite_exatidao": limite_exatidao,
+        "ct_medios": ct_medios,
+        "desvios": desvios,
+        "ruido_percent": ruido_percent,
+        "delta_ct_perifericos": delta_ct_perifericos,
+        "uniformidade": uniformidade,
+        "exatidao_ok": exatidao_ok,
+        "ruido_ok": ruido_ok,
+        "uniformidade_ok": uniformidade_ok,
+        "conforme": all([exatidao_ok, uniformidade_ok, ruido_ok]),
+    }
+
+def avalia_imagem(img, fator_raio=1.0, material="Água", circulo=None):
+    """Executa a análise completa de uma imagem: localização do phantom, ROIs e conformidade."""
+    if circulo is None:
+        circulo = detectar_centro_phantom(img)
+    r_c_ajustado, centers, radius_roi = geometria_rois(circulo, fator_raio)
+
+    # Mesmas ROIs de `crop_rois`, calculadas pela tabela integral do corte
+    medias, desvios, _ = tabela_integral(img).estatisticas(centers, int(radius_roi * 2))
+
+    # --- Exatidão individual (média dos pixels de cada ROI) ---
+    ct_medios = list(medias)  # média dos pixels (HU) de cada ROI
+    desvios = list(desvios)
+
+    resultado = avalia_conformidade(ct_medios, desvios, material)
+    resultado.update({
+        "circulo": circulo,
+        "r_c_ajustado": r_c_ajustado,
+        "centers": centers,
+        "radius_roi": radius_roi,
+    })
+    return resultado
+
+def avalia_volume(volume, fator_raio=1.0, material="Água", circulo=None):
+    """Analisa todos os cortes de um volume (n, h, w) com operações vetorizadas.
+
+    As cinco ROIs são as mesmas em todos os cortes, posicionadas pelo círculo do
+    phantom (detectado na projeção de intensidade máxima, se não for informado).
+    Retorna um dicionário de matrizes com um valor (ou uma linha) por corte.
+    """
+    if circulo is None:
+        circulo = detectar_centro_phantom(como_ct(volume).max(axis=0))
+    r_c_ajustado, centers, radius_roi = geometria_rois(circulo, fator_raio)
+    limite_exatidao, ct_medio_ref = LIMITES_EXATIDAO[material]
+
+    ct_medios, desvios = estatisticas_volume(volume, centers, int(radius_roi * 2))
+    ruido_percent = desvios / 1000 * 100
+    delta_ct_perifericos = ct_medios[:, 1:] - ct_medios[:, :1]
+    uniformidade = np.abs(delta_ct_perifericos).max(axis=1)
+
+    exatidao_ok = (np.abs(ct_medios - ct_medio_ref) <= limite_exatidao).all(axis=1)
+    ruido_ok = (ruido_percent <= LIMITE_RUIDO).all(axis=1)
+    uniformidade_ok = uniformidade <= LIMITE_UNIFORMIDADE
+
+    return {
+        "material": material,
+        "circulo": circulo,
+        "r_c_ajustado": r_c_ajustado,
+        "centers": centers,
+        "radius_roi": radius_roi,
+        "ct_medios": ct_medios,
+        "desvios": desvios,
+        "ruido_percent": ruido_percent,
+        "delta_ct_perifericos": delta_ct_perifericos,
+        "uniformidade": uniformidade,
+        "exatidao_ok": exatidao_ok,
+        "ruido_ok": ruido_ok,
+        "uniformidade_ok": uniformidade_ok,
+        "conforme": exatidao_ok & ruido_ok & uniformidade_ok,
+    }
+
+def varredura_rois(img, circulo, raios_roi, fracoes_desloc, material="Água"):
+    """Avalia a sensibilidade dos resultados ao tamanho e ao deslocamento das ROIs.
+
+    Todas as combinações de raio e deslocamento são calculadas em uma única
+    consulta à tabela integral. Retorna uma lista de linhas (dicionários).
+    """
+    combinacoes = [(raio, fracao) for raio in raios_roi for fracao in fracoes_desloc]
+    centros, tamanhos = [], []
+    for raio, fracao in combinacoes:
+        _, centers, _ = geometria_rois(circulo, fracao_desloc=fracao, radius_roi=raio)
+        centros.extend(centers)
+        tamanhos.extend([int(raio * 2)] * len(centers))
+
+    medias, desvios, _ = tabela_integral(img).estatisticas(centros, tamanhos)
+    medias = medias.reshape(len(combinacoes), 5)
+    desvios = desvios.reshape(len(combinacoes), 5)
+
+    linhas = []
+    for (raio, fracao), ct_medios, dp in zip(combinacoes, medias, desvios):
+        resultado = avalia_conformidade(list(ct_medios), list(dp), material)
+        linhas.append({
+            "Raio da ROI (px)": raio,
+            "Deslocamento (% do raio)": round(fracao * 100),
+            "Uniformidade (HU)": float(resultado["uniformidade"]),
+            "Ruído máximo (%)": float(max(resultado["ruido_percent"])),
+            "Conforme IN 93/2021": "Sim" if resultado["conforme"] else "Não",
+        })
+    return linhas
+
+def tabelas_resultado(resultado):
+    """Tabelas de exatidão, ruído e uniformidade (por ROI) de um resultado de `avalia_imagem`."""
+    limite_exatidao = resultado["limite_exatidao"]
+    ct_medios = resultado["ct_medios"]
+    ruido_percent = resultado["ruido_percent"]
+    delta_ct_perifericos = resultado["delta_ct_perifericos"]
+
+    resultados_exatidao = pd.DataFrame({
+        "ROI": NOMES_ROIS,
+        "CT médio (HU)": ct_medios,
+        "Limite (±HU)": [limite_exatidao] * 5,
+        "Status": ["OK" if abs(ct) <= limite_exatidao else "Fora" for ct in ct_medios]
+    })
+
+    resultados_ruido = pd.DataFrame({
+        "ROI": NOMES_ROIS,
+        "Ruído (%)": ruido_percent,
+        "Limite (%)": [LIMITE_RUIDO] * 5,
+        "Status": ["OK" if r <= LIMITE_RUIDO else "Fora" for r in ruido_percent]
+    })
+
+    resultados_uniformidade = pd.DataFrame({
+        "ROI": NOMES_ROIS[1:],  # Não inclui o centro na tabela de uniformidade
+        "Uniformidade (HU)": delta_ct_perifericos,
+        "Limite (±HU)": [LIMITE_UNIFORMIDADE] * 4,
+        "Status": ["OK" if abs(u) <= LIMITE_UNIFORMIDADE else "Fora" for u in delta_ct_perifericos]
+    })
+    return resultados_exatidao, resultados_ruido, resultados_uniformidade
+
+def resultado_em_linha(resultado):
+    """Converte o resultado de `avalia_imagem` em uma linha de tabela (uma coluna por ROI)."""
+    x_c, y_c, r_c = resultado["circulo"]
+    linha = {
+        "Material": resultado["material"],
+        "Centro X": int(x_c),
+        "Centro Y": int(y_c),
+        "Raio do phantom": int(r_c),
+    }
+    for nome, ct, ruido in zip(NOMES_ROIS, resultado["ct_medios"], resultado["ruido_percent"]):
+        linha[f"CT médio ROI {nome} (HU)"] = float(ct)
+        linha[f"Ruído ROI {nome} (%)"] = float(ruido)
+    linha["Uniformidade (HU)"] = float(resultado["uniformidade"])
+    linha["Exatidão"] = "OK" if resultado["exatidao_ok"] else "Fora"
+    linha["Ruído"] = "OK" if resultado["ruido_ok"] else "Fora"
+    linha["Uniformidade"] = "OK" if resultado["uniformidade_ok"] else "Fora"
+    linha["Conforme IN 93/2021"] = "Sim" if resultado["conforme"] else "Não"
+    return linha
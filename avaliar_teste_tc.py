@@ -1,27 +1,37 @@
-import numpy as np
-import pydicom as dicom
-import matplotlib.pyplot as plt
 import pandas as pd
 import streamlit as st
-import cv2
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Table, TableStyle
+import os
 from datetime import datetime
-import tempfile  # Tempfile para gerar um diretório temporário compatível com qualquer sistema operacional
+from analise import (
+    NOMES_ROIS, LIMITE_RUIDO, LIMITE_UNIFORMIDADE,
+    detectar_centro_phantom, avalia_imagem, avalia_volume, varredura_rois,
+    tabelas_resultado
+)
+from cache_disco import abre_cache_disco
+from cache_imagens import CACHE, UsoCache
+from corte_central import pontua_cortes
+from serie_dicom import SerieDicom
+from globais import carrega_ini, carrega_parametro
+from ingestao import abre_arquivos, expande_uploads
+from fila_tarefas import FILA, chave_tarefa
+from instrumentacao import cronometro, registra
+from lote import analisa_conteudos
+from mtf import calcula_mtf, resumo_mtf
+from nps import calcula_nps, espacamento_pixel, resumo_nps
+from paginas import acompanha_tarefa
+from receptor_dicom import arquivos_serie, pasta_recebidas, series_recebidas
+from relatorio import gera_relatorio_pdf
+from renderizacao import janela_para_uint8, renderiza_img
 
 # ---------------- Funções ----------------
-def circular_mask(h, w, center=None, radius=None):
-    if center is None:
-        center = (w // 2, h // 2)
-    if radius is None:
-        radius = min(center[0], center[1], w - center[0], h - center[1])
-    Y, X = np.ogrid[:h, :w]
-    return (X - center[0])**2 + (Y - center[1])**2 <= radius**2
-
 def plot_img(img, name, rois=None, radius=25, phantom_circle=None):
-    """Plota imagem em HU (sem normalização)."""
+    """Plota imagem em HU (sem normalização).
+
+    Figura vetorial do matplotlib, para exportações que precisem dela; a página
+    exibe a imagem por `renderizacao.renderiza_img`. Feche a figura com plt.close.
+    """
+    import matplotlib.pyplot as plt  # Só carregado quando a figura é pedida
+
     fig, ax = plt.subplots()
     ax.imshow(img, cmap='gray')
     
@@ -41,73 +51,144 @@ def plot_img(img, name, rois=None, radius=25, phantom_circle=None):
     ax.set_title(name, fontsize=10)
     return fig
 
-def crop_rois(img, centers, size=50):
-    rois = []
-    r = size // 2
-    for x, y in centers:
-        x0, y0 = max(x - r, 0), max(y - r, 0)
-        roi = img[y0:y0 + size, x0:x0 + size].copy()
-        h_roi, w_roi = roi.shape
-        mask = circular_mask(h_roi, w_roi, radius=min(r, h_roi // 2, w_roi // 2))
-        rois.append(roi[mask].flatten())
-    return rois
-
-def detectar_centro_phantom(img):
-    """Detecta o centro do phantom circular usando transformada de Hough."""
-    img8 = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-    blur = cv2.medianBlur(img8, 5)
-    circles = cv2.HoughCircles(
-        blur,
-        cv2.HOUGH_GRADIENT,
-        dp=1.2,
-        minDist=100,
-        param1=50,
-        param2=30,
-        minRadius=int(min(img.shape) / 6),
-        maxRadius=int(min(img.shape) / 2)
-    )
-    if circles is not None:
-        circles = np.uint16(np.around(circles))
-        x, y, r = circles[0][0]
-        return (x, y, r)
-    else:
-        h, w = img.shape
-        return (w // 2, h // 2, min(h, w) // 3)
+def tabela_resumo(resumos):
+    """Uma coluna por curva com as linhas (grandeza, valor) de `resumo_nps`/`resumo_mtf`.
+
+    Os valores misturam números e textos ("9 (1)"), então todos vão como texto:
+    o Streamlit não converte colunas com tipos mistos para Arrow.
+    """
+    return pd.DataFrame({
+        nome: {grandeza: f"{valor:.3f}" if isinstance(valor, float) else str(valor) for grandeza, valor in resumo}
+        for nome, resumo in resumos.items()
+    })
+
+def submete_analise(serie, material="Água", fator_raio=1.0, repete_falha=False):
+    """Tarefa da análise automática da série inteira; a mesma série com os mesmos parâmetros reaproveita a tarefa.
+
+    A análise é submetida se ainda não está na fila ou se já foi descartada dela
+    (as tarefas concluídas mais antigas são removidas); uma tarefa que falhou (ou
+    foi cancelada) só é submetida de novo com `repete_falha`.
+    """
+    chave = chave_tarefa("analise_serie", serie.hashes, material, fator_raio)
+    tarefa = FILA.obtem(chave)
+    if tarefa is None or (repete_falha and tarefa.falhou):
+        tarefa = FILA.submete(chave, analisa_conteudos, [arquivo.getvalue() for arquivo in serie.arquivos],
+                              material=material, fator_raio=fator_raio,
+                              descricao=f"Análise automática ({len(serie)} imagens, {material}, raio ×{fator_raio:.2f})")
+    return tarefa
 
 # ---------------- App Streamlit ----------------
 def app():
     st.title("Avaliação da Qualidade das Imagens")
     st.write("Carregue as imagens DICOM e use as setas para navegar entre elas e escolher a imagem central do objeto simulador. Depois, selecione o material em análise: Água ou Ar.")
 
-    uploads = st.file_uploader("Escolha imagens DICOM", accept_multiple_files=True)
-    if not uploads:
+    uploads = st.file_uploader("Escolha imagens DICOM (ou o arquivo ZIP exportado do PACS)", accept_multiple_files=True)
+
+    # Séries enviadas pelo tomógrafo ou pelo PACS ao receptor DICOM (receptor_dicom.py)
+    _, _, _, pasta_sala_imagens, _ = carrega_ini()
+    recebidas = series_recebidas(pasta_recebidas(pasta_sala_imagens))
+    recebida = None
+    if recebidas and not uploads:
+        recebida = st.selectbox(
+            "Ou escolha uma série recebida do tomógrafo/PACS", [None] + recebidas,
+            format_func=lambda info: "—" if info is None else
+            f"{info['Concluída em']} - {info['SeriesInstanceUID']} ({info['Nº de imagens']} imagens)"
+        )
+    if not uploads and recebida is None:
         st.warning("Nenhuma imagem selecionada!")
         return
-
-    imagens_dict = {}
-
-    for upload in uploads:
-        try:
-            ds = dicom.dcmread(upload, force=True)
-            img = ds.pixel_array.astype(np.float32)
-
-            # --- Conversão para HU ---
-            if hasattr(ds, "RescaleSlope") and hasattr(ds, "RescaleIntercept"):
-                img = img * float(ds.RescaleSlope) + float(ds.RescaleIntercept)
-
-            imagens_dict[upload.name] = img
-
-        except Exception as e:
-            st.error(f"Erro ao ler {upload.name}: {e}")
-            continue
-
-    if not imagens_dict:
+    if recebida is not None and recebida["Resultado"]:
+        automatico = recebida["Resultado"]
+        st.info(f"Análise automática do corte {automatico.get('Imagem analisada', '-')}: "
+                f"{automatico.get('Erro') or 'conforme IN 93/2021: ' + automatico['Conforme IN 93/2021']}")
+
+    # Limite de memória do cache de imagens decodificadas (parametros.ini)
+    CACHE.ajusta_limite(int(carrega_parametro("cache", "memoria_mb", 1024)) * 1024**2)
+
+    # Cabeçalhos são lidos uma única vez por conjunto de arquivos; os pixels,
+    # apenas da imagem exibida (e das vizinhas, em segundo plano)
+    if recebida is not None:
+        caminhos_recebidos = arquivos_serie(recebida["Pasta"])
+        chave_uploads = tuple(caminhos_recebidos)
+    else:
+        chave_uploads = tuple(getattr(upload, "file_id", upload.name) for upload in uploads)
+    if st.session_state.get("serie_chave") != chave_uploads:
+        if recebida is not None:
+            uploads = abre_arquivos(caminhos_recebidos)
+        else:
+            # Um ZIP (com ou sem DICOMDIR) é lido entrada por entrada, sem extração
+            uploads = expande_uploads(uploads)
+        # Volumes de séries já analisadas ficam em pasta_sala_imagens (parametros.ini)
+        cache_disco = abre_cache_disco(
+            os.path.join(pasta_sala_imagens, "cache_hu"),
+            int(carrega_parametro("cache", "disco_mb", 10240)) * 1024**2
+        )
+        # Imagens vistas por esta sessão ficam fixadas no cache compartilhado entre as
+        # sessões: vários usuários abrindo a mesma série usam uma única cópia
+        if "uso_cache" not in st.session_state:
+            st.session_state.uso_cache = UsoCache(CACHE)
+        st.session_state.uso_cache.libera()  # A série anterior deixa de ser usada por esta sessão
+        with cronometro("Imagem: leitura dos cabeçalhos"):
+            st.session_state.serie = SerieDicom(uploads, cache_disco=cache_disco, uso=st.session_state.uso_cache)
+        st.session_state.serie_chave = chave_uploads
+        st.session_state.pop("pontuacao_cortes", None)
+    serie = st.session_state.serie
+
+    for nome, e in serie.erros:
+        st.error(f"Erro ao ler {nome}: {e}")
+
+    if not len(serie):
         st.warning("Nenhuma imagem válida foi carregada.")
         return
 
-    nomes = list(imagens_dict.keys())
+    with st.expander("Cache de imagens decodificadas"):
+        st.dataframe(pd.DataFrame([CACHE.estatisticas()]).style.format({
+            "Memória usada (MB)": "{:.1f}",
+            "Limite (MB)": "{:.0f}",
+            "Memória em uso (MB)": "{:.1f}",
+        }), hide_index=True)
+        if serie.cache_disco is not None:
+            st.dataframe(pd.DataFrame([serie.cache_disco.estatisticas()]).style.format({
+                "Espaço usado (MB)": "{:.1f}",
+                "Limite (MB)": "{:.0f}",
+            }), hide_index=True)
+
+    nomes = serie.nomes
+
+    # ---------- Análise automática (fila de tarefas) ----------
+    # Corte central, ROIs e relatório da série inteira calculados em segundo plano,
+    # com o material e o ajuste do raio escolhidos abaixo (o estado da sessão já
+    # traz os valores atuais dos widgets); a tarefa é procurada a cada reexecução e
+    # volta à fila se tiver sido descartada
+    material_auto = st.session_state.get("material", "Água")
+    fator_raio_auto = st.session_state.get("fator_raio", 1.0)
+    tarefa = submete_analise(serie, material_auto, fator_raio_auto)
+    automatica = None
+    if not tarefa.pronta:
+        acompanha_tarefa(tarefa.chave, "Análise automática da série em segundo plano")
+    elif tarefa.falhou:
+        st.warning(f"A análise automática não pôde ser concluída: {tarefa.erro() or tarefa.estado}")
+        if st.button("🔄 Repetir a análise automática"):
+            submete_analise(serie, material_auto, fator_raio_auto, repete_falha=True)
+            st.rerun()
+    else:
+        automatica = tarefa.resultado()
+        if st.session_state.get("tarefa_registrada") != tarefa.chave:
+            st.session_state.tarefa_registrada = tarefa.chave
+            registra("Imagem: análise automática (segundo plano)", tarefa.duracao())
+    if automatica is not None:
+        nome_automatico = nomes[automatica["indice"]]
+        conforme = "conforme" if automatica["resultado"]["conforme"] else "fora de conformidade"
+        st.info(f"Análise automática ({material_auto}, raio ×{fator_raio_auto:.2f}): corte central "
+                f"{nome_automatico}, {conforme} com a IN 93/2021.")
+        if st.button("➕ Adicionar a análise automática ao relatório"):
+            estudos_relatorio = st.session_state.setdefault("estudos_relatorio", [])
+            estudos_relatorio[:] = [e for e in estudos_relatorio if e["titulo"] != nome_automatico]
+            estudos_relatorio.append(dict(automatica["estudo"], titulo=nome_automatico))
+
     if "img_index" not in st.session_state:
         st.session_state.img_index = 0
+    st.session_state.img_index = min(st.session_state.img_index, len(nomes) - 1)
 
     col1, col2, col3 = st.columns([1, 6, 1])
     with col1:
@@ -116,202 +197,267 @@ def app():
     with col3:
         if st.button("➡️"):
             st.session_state.img_index = min(len(nomes) - 1, st.session_state.img_index + 1)
+    with col2:
+        if len(nomes) > 1 and st.button("🎯 Selecionar o corte central automaticamente"):
+            if automatica is not None:
+                # Já calculado em segundo plano
+                st.session_state.pontuacao_cortes = automatica["pontuacao"]
+                st.session_state.img_index = automatica["indice"]
+            else:
+                with cronometro("Imagem: decodificação do volume"):
+                    volume, erros = serie.volume(
+                        n_workers=int(carrega_parametro("decodificacao", "workers", 0)),
+                        modo=carrega_parametro("decodificacao", "modo", "processos")
+                    )
+                for nome, e in erros:
+                    st.error(f"Erro ao ler {nome}: {e}")
+                if volume is not None:
+                    with cronometro("Imagem: escolha do corte central"):
+                        pontuacao = pontua_cortes(volume, fator_raio_auto)
+                    st.session_state.pontuacao_cortes = pontuacao
+                    st.session_state.img_index = pontuacao["indice"]
+
+    if "pontuacao_cortes" in st.session_state:
+        pontuacao = st.session_state.pontuacao_cortes
+        with st.expander(f"Corte central sugerido: {nomes[pontuacao['indice']]}"):
+            st.line_chart(pd.DataFrame({
+                "Presença do phantom": pontuacao["presenca"],
+                "Uniformidade (HU)": pontuacao["uniformidade"],
+            }, index=pd.Index(range(1, len(nomes) + 1), name="Corte")))
 
     nome_escolhido = nomes[st.session_state.img_index]
-    img = imagens_dict[nome_escolhido]
+    try:
+        with cronometro("Imagem: decodificação"):
+            img = serie.imagem(st.session_state.img_index)
+    except Exception as e:
+        st.error(f"Erro ao ler {nome_escolhido}: {e}")
+        return
 
     # ---------- Localiza o centro do phantom ----------
-    x_c, y_c, r_c = detectar_centro_phantom(img)
+    with cronometro("Imagem: detecção do phantom (Hough)"):
+        x_c, y_c, r_c = detectar_centro_phantom(img)
 
     # ---------- Ajuste manual ----------
     st.subheader("Ajuste opcional do raio externo (azul)")
-    fator_raio = st.slider(" ", 0.5, 1.5, 1.0, 0.01, label_visibility="collapsed")
-    r_c_ajustado = int(r_c * fator_raio)
-
-    # ---------- ROIs ----------
-    desloc = int(r_c_ajustado * 0.75)
-    radius_roi = int(25 * fator_raio)
-
-    centers = [
-        (x_c, y_c),            # Centro
-        (x_c + desloc, y_c),   # 3h
-        (x_c, y_c + desloc),   # 6h
-        (x_c - desloc, y_c),   # 9h
-        (x_c, y_c - desloc)    # 12h
-    ]
-
-    rois = crop_rois(img, centers, size=int(radius_roi * 2))
-
-    # --- Exatidão individual (média dos pixels de cada ROI) ---
-    nomes_rois = ["1", "2", "3", "4", "5"]
-    ct_medios = [np.mean(r) for r in rois]  # média dos pixels (HU) de cada ROI
-
-    # --- Ruído individual (desvio padrão dividido por 1000, multiplicado por 100) ---
-    desvios = [np.std(r) for r in rois]
-    ruido_percent = [(d / 1000) * 100 for d in desvios]
-
-    # --- Uniformidade (diferença do valor médio entre o centro e as periferias) ---
-    ct_central = ct_medios[0]
-    delta_ct_perifericos = [ct_medios[i] - ct_central for i in range(1, 5)]
-    uniformidade = max(abs(np.array(delta_ct_perifericos)))
+    fator_raio = st.slider(" ", 0.5, 1.5, 1.0, 0.01, label_visibility="collapsed", key="fator_raio")
 
     # Seleção do material (Água ou Ar) para ajustar os limites de exatidão
-    material = st.selectbox("Selecione o material:", ["Água", "Ar"])
-
-    if material == "Água":
-        limite_exatidao = 5
-        ct_medio_ref = 0  # Para Água, o CT médio de referência é 0 (e intervalo de ±5)
-    else:  # Quando for "Ar"
-        limite_exatidao = 10  # Limite de exatidão é ±10
-        ct_medio_ref = 1000  # Para Ar, o CT médio de referência será 1000 (e intervalo de ±10)
-
-    # Limites de tolerância
-    limite_ruido = 15
-    limite_uniformidade = 5
+    material = st.selectbox("Selecione o material:", ["Água", "Ar"], key="material")
 
-    # Avaliações de conformidade para exatidão (verificando se o CT médio está dentro do intervalo permitido)
-    # Para "Água", verifica-se o intervalo de -5 a +5 (referência 0)
-    # Para "Ar", verifica-se o intervalo de 990 a 1010 (referência 1000)
-    exatidao_ok = all(ct_medio_ref - limite_exatidao <= ct <= ct_medio_ref + limite_exatidao for ct in ct_medios)
+    # ---------- ROIs, exatidão, ruído e uniformidade ----------
+    with cronometro("Imagem: estatísticas das ROIs"):
+        resultado = avalia_imagem(img, fator_raio, material, circulo=(x_c, y_c, r_c))
+    r_c_ajustado = resultado["r_c_ajustado"]
+    centers = resultado["centers"]
+    radius_roi = resultado["radius_roi"]
 
-    ruido_ok = all(r <= limite_ruido for r in ruido_percent)
-    uniformidade_ok = uniformidade <= limite_uniformidade
+    nomes_rois = NOMES_ROIS
+    ct_medios = resultado["ct_medios"]
+    ruido_percent = resultado["ruido_percent"]
+    delta_ct_perifericos = resultado["delta_ct_perifericos"]
+    uniformidade = resultado["uniformidade"]
 
+    limite_exatidao = resultado["limite_exatidao"]
+    limite_ruido = LIMITE_RUIDO
+    limite_uniformidade = LIMITE_UNIFORMIDADE
 
+    exatidao_ok = resultado["exatidao_ok"]
+    ruido_ok = resultado["ruido_ok"]
+    uniformidade_ok = resultado["uniformidade_ok"]
 
     # ---------- Exibição ----------
-    fig_img = plot_img(
-        img,
-        nome_escolhido,
-        rois=centers,
-        radius=radius_roi,
-        phantom_circle=(x_c, y_c, r_c_ajustado)
-    )
-    fig_img.set_size_inches(5, 5)
-    st.pyplot(fig_img)
+    # Imagem anotada com cv2 e guardada em cache pela geometria (sem figura do matplotlib)
+    with cronometro("Imagem: renderização"):
+        png_img = renderiza_img(
+            img,
+            rois=centers,
+            radius=radius_roi,
+            phantom_circle=(x_c, y_c, r_c_ajustado)
+        )
+        st.image(png_img, caption=nome_escolhido, width=500)
 
     # ---------- Tabelas ----------
-    resultados_exatidao = pd.DataFrame({
-        "ROI": nomes_rois,
-        "CT médio (HU)": ct_medios,
-        "Limite (±HU)": [limite_exatidao] * 5,
-        "Status": ["OK" if abs(ct) <= limite_exatidao else "Fora" for ct in ct_medios]
-    })
-
-    resultados_ruido = pd.DataFrame({
-        "ROI": nomes_rois,
-        "Ruído (%)": ruido_percent,
-        "Limite (%)": [limite_ruido] * 5,
-        "Status": ["OK" if r <= limite_ruido else "Fora" for r in ruido_percent]
-    })
-
-    resultados_uniformidade = pd.DataFrame({
-        "ROI": nomes_rois[1:],  # Não inclui o centro na tabela de uniformidade
-        "Uniformidade (HU)": delta_ct_perifericos,
-        "Limite (±HU)": [limite_uniformidade] * 4,
-        "Status": ["OK" if abs(u) <= limite_uniformidade else "Fora" for u in delta_ct_perifericos]
-    })
-
-    resultados_geral = pd.DataFrame({
-        "Métrica": ["Uniformidade (HU)", "Ruído (%)"],
-        "Valor": [uniformidade, max(ruido_percent)],
-        "Limite": [f"≤{limite_uniformidade} HU", f"≤{limite_ruido}%"],
-        "Status": ["OK" if uniformidade_ok else "Fora",
-                   "OK" if ruido_ok else "Fora"]
-    })
-
-    def highlight_status(row):
-        color_map = {'OK': '#90ee90', 'Fora': '#f08080'}
-        return [f'background-color: {color_map.get(row["Status"], "")}'] * len(row)
-
-    st.subheader("Exatidão")
-    st.dataframe(resultados_exatidao.style.format({'CT médio (HU)': '{:.2f}'}).apply(highlight_status, axis=1))
+    with cronometro("Imagem: tabelas e estilos"):
+        resultados_exatidao, resultados_ruido, resultados_uniformidade = tabelas_resultado(resultado)
+
+        resultados_geral = pd.DataFrame({
+            "Métrica": ["Uniformidade (HU)", "Ruído (%)"],
+            "Valor": [uniformidade, max(ruido_percent)],
+            "Limite": [f"≤{limite_uniformidade} HU", f"≤{limite_ruido}%"],
+            "Status": ["OK" if uniformidade_ok else "Fora",
+                       "OK" if ruido_ok else "Fora"]
+        })
+
+        def highlight_status(row):
+            color_map = {'OK': '#90ee90', 'Fora': '#f08080'}
+            return [f'background-color: {color_map.get(row["Status"], "")}'] * len(row)
+
+        st.subheader("Exatidão")
+        st.dataframe(resultados_exatidao.style.format({'CT médio (HU)': '{:.2f}'}).apply(highlight_status, axis=1))
     
-    st.subheader("Ruído")
-    st.dataframe(resultados_ruido.style.format({'Ruído (%)': '{:.2f}'}).apply(highlight_status, axis=1))
+        st.subheader("Ruído")
+        st.dataframe(resultados_ruido.style.format({'Ruído (%)': '{:.2f}'}).apply(highlight_status, axis=1))
 
-    st.subheader("Uniformidade")
-    st.dataframe(resultados_uniformidade.style.format({'Uniformidade (HU)': '{:.2f}'}).apply(highlight_status, axis=1))
+        st.subheader("Uniformidade")
+        st.dataframe(resultados_uniformidade.style.format({'Uniformidade (HU)': '{:.2f}'}).apply(highlight_status, axis=1))
 
     if all([exatidao_ok, uniformidade_ok, ruido_ok]):
         st.success("✅ Equipamento conforme os limites da IN 93/2021.")
     else:
         st.error("❌ Equipamento fora de conformidade — verificar calibração e parâmetros de aquisição.")
 
-    # ---------- Baixar PDF com as tabelas ----------------
-    if st.button("💾 Baixar PDF com as tabelas e a imagem"):
-        # Criar o PDF em memória
-        buffer_pdf = BytesIO()
-        c = canvas.Canvas(buffer_pdf, pagesize=letter)
-
-        # Cabeçalho e data
-        c.setFont("Helvetica-Bold", 13)
-        c.drawString(30, 760, "Relatório do Teste Semanal de Tomografia Computadorizada")
-        c.setFont("Helvetica", 10)
-        c.drawString(30, 745, f"Data e hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-        c.line(30, 740, 580, 740)
-
-        # Salvar imagem temporária e inserir no PDF
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_img_file:
-            fig_img.savefig(tmp_img_file.name)
-            c.drawImage(tmp_img_file.name, 60, 420, width=300, height=300)
-
-                # --- Função auxiliar para desenhar tabelas ---
-        def desenhar_tabela(c, df, titulo, y_pos):
-            """Desenha uma tabela formatada a partir de um DataFrame."""
-            from reportlab.lib import colors
-            from reportlab.platypus import Table, TableStyle
-
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(30, y_pos + 20, titulo)
-            c.setFont("Helvetica", 9)
-
-            # Formatar os valores para garantir que apareçam com 2 casas decimais
-            # Verificar se o valor é numérico antes de aplicar a formatação
-            data = [df.columns.tolist()] + [
-                [f'{value:.2f}' if isinstance(value, (int, float)) else value for value in row] 
-                for row in df.values.tolist()
-            ]
-
-            tabela = Table(data, colWidths=[80, 100, 100, 80])
-
-            tabela.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-                ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONT', (0, 1), (-1, -1), 'Helvetica'),
-                ('TEXTCOLOR', (-1, 1), (-1, -1), colors.black),
-            ]))
-
-            tabela.wrapOn(c, 30, y_pos)
-            tabela.drawOn(c, 30, y_pos)
-
-
-        # --- Inserir tabelas no PDF ---
-        y_pos = 260
-        desenhar_tabela(c, resultados_exatidao, "", y_pos + 30)
-
-        y_pos -= 120
-        desenhar_tabela(c, resultados_ruido, "", y_pos + 30)
-
-        y_pos -= 100
-        desenhar_tabela(c, resultados_uniformidade, "", y_pos + 30)
-
-        # Rodapé
-        c.setFont("Helvetica-Oblique", 8)
-        c.drawString(30, 30, "Gerado automaticamente pelo aplicativo SEMANAL TC")
-
-        # Salvar o PDF em memória
-        c.save()
-        buffer_pdf.seek(0)
-
-        # Botão de download do PDF
+    # ---------- Sensibilidade ao posicionamento das ROIs ----------
+    with st.expander("Sensibilidade ao tamanho e à posição das ROIs"):
+        varredura = pd.DataFrame(varredura_rois(
+            img,
+            (x_c, y_c, r_c_ajustado),
+            raios_roi=[15, 20, 25, 30, 35],
+            fracoes_desloc=[0.65, 0.70, 0.75, 0.80, 0.85],
+            material=material
+        ))
+        st.write("Uniformidade (HU) para cada combinação de raio da ROI e deslocamento das ROIs periféricas:")
+        st.dataframe(varredura.pivot(
+            index="Deslocamento (% do raio)",
+            columns="Raio da ROI (px)",
+            values="Uniformidade (HU)"
+        ).style.format("{:.2f}"))
+
+    # ---------- Espectro de potência do ruído (NPS) ----------
+    with st.expander("Espectro de potência do ruído (NPS)"):
+        with cronometro("Imagem: NPS"):
+            nps_corte = calcula_nps(
+                img, (x_c, y_c, r_c_ajustado),
+                espacamento=espacamento_pixel(serie.cabecalhos[st.session_state.img_index])
+            )
+        # NPS de todos os cortes com o phantom, calculado junto com a análise automática
+        nps_serie = automatica.get("nps") if automatica is not None else None
+        curvas = {nome: nps for nome, nps in [("Corte atual", nps_corte), ("Série", nps_serie)] if nps is not None}
+        if not curvas:
+            st.warning("O phantom é pequeno demais para as ROIs do NPS.")
+        else:
+            unidade = next(iter(curvas.values()))["unidade"]
+            st.write(f"NPS radial (HU²·{unidade}²) por frequência espacial (1/{unidade}):")
+            st.line_chart(pd.DataFrame({
+                nome: pd.Series(nps["nps_radial"], index=nps["frequencias"]) for nome, nps in curvas.items()
+            }))
+            st.dataframe(tabela_resumo({nome: resumo_nps(nps) for nome, nps in curvas.items()}))
+            nome_2d = list(curvas)[-1]  # O da série, com mais ROIs, quando disponível
+            st.image(janela_para_uint8(curvas[nome_2d]["nps_2d"]), caption=f"NPS 2D ({nome_2d})", width=200)
+
+    # ---------- Resolução espacial (MTF) ----------
+    with st.expander("Resolução espacial (MTF)"):
+        with cronometro("Imagem: MTF"):
+            # Borda física do phantom: o raio detectado, sem o ajuste das ROIs
+            mtf_corte = calcula_mtf(
+                img, (x_c, y_c, r_c),
+                espacamento=espacamento_pixel(serie.cabecalhos[st.session_state.img_index])
+            )
+        mtf_serie = automatica.get("mtf") if automatica is not None else None
+        curvas = {nome: mtf for nome, mtf in [("Corte atual", mtf_corte), ("Série", mtf_serie)]
+                  if mtf is not None and len(mtf["mtf"])}
+        unidade = mtf_corte["unidade"]
+        st.write(f"MTF da borda do phantom por frequência espacial (1/{unidade}), média dos cortes:")
+        st.line_chart(pd.DataFrame({
+            nome: pd.Series(mtf["mtf"].mean(axis=0), index=mtf["frequencias"]) for nome, mtf in curvas.items()
+        }))
+        st.dataframe(tabela_resumo({nome: resumo_mtf(mtf) for nome, mtf in curvas.items()}))
+        if "Série" in curvas:
+            st.write(f"MTF50 e MTF10 (1/{mtf_serie['unidade']}) em cada corte da série:")
+            st.line_chart(pd.DataFrame({
+                "MTF50": mtf_serie["mtf50"],
+                "MTF10": mtf_serie["mtf10"],
+            }, index=pd.Index(mtf_serie["cortes"] + 1, name="Corte")))
+
+    # ---------- Modo volume: todos os cortes da série ----------
+    if len(nomes) > 1 and st.toggle("Modo volume: analisar todos os cortes da série"):
+        with cronometro("Imagem: decodificação do volume"):
+            volume, erros = serie.volume(
+                n_workers=int(carrega_parametro("decodificacao", "workers", 0)),
+                modo=carrega_parametro("decodificacao", "modo", "processos")
+            )
+        for nome, e in erros:
+            st.error(f"Erro ao ler {nome}: {e}")
+        if volume is not None:
+            with cronometro("Imagem: análise do volume"):
+                res_volume = avalia_volume(volume, fator_raio, material)
+            cortes = pd.Index(range(1, len(nomes) + 1), name="Corte")
+            colunas_rois = [f"ROI {n}" for n in nomes_rois]
+
+            st.subheader("Perfis ao longo do eixo z")
+            st.write("CT médio (HU)")
+            st.line_chart(pd.DataFrame(res_volume["ct_medios"], index=cortes, columns=colunas_rois))
+            st.write("Ruído (%)")
+            st.line_chart(pd.DataFrame(res_volume["ruido_percent"], index=cortes, columns=colunas_rois))
+            st.write("Uniformidade (HU)")
+            st.line_chart(pd.DataFrame({"Uniformidade (HU)": res_volume["uniformidade"]}, index=cortes))
+
+            def status(ok):
+                return ["OK" if v else "Fora" for v in ok]
+
+            resultados_volume = pd.DataFrame(
+                res_volume["ct_medios"], index=cortes,
+                columns=[f"CT médio ROI {n} (HU)" for n in nomes_rois]
+            )
+            resultados_volume.insert(0, "Imagem", nomes)
+            resultados_volume["Ruído máximo (%)"] = res_volume["ruido_percent"].max(axis=1)
+            resultados_volume["Uniformidade (HU)"] = res_volume["uniformidade"]
+            resultados_volume["Exatidão"] = status(res_volume["exatidao_ok"])
+            resultados_volume["Ruído"] = status(res_volume["ruido_ok"])
+            resultados_volume["Uniformidade"] = status(res_volume["uniformidade_ok"])
+            resultados_volume["Status"] = status(res_volume["conforme"])
+
+            st.subheader("Conformidade por corte")
+            st.dataframe(resultados_volume.style.format(precision=2).apply(highlight_status, axis=1))
+            fora = int((~res_volume["conforme"]).sum())
+            if fora:
+                st.error(f"❌ {fora} de {len(nomes)} cortes fora dos limites da IN 93/2021.")
+            else:
+                st.success(f"✅ Todos os {len(nomes)} cortes conformes com a IN 93/2021.")
+
+    # ---------- Relatório em PDF (gerado em memória, somente no clique) ----------------
+    estudo = {"titulo": nome_escolhido, "resultado": resultado, "nps": nps_serie or nps_corte,
+              "mtf": mtf_serie or mtf_corte}
+
+    def relatorio_pdf(estudos):
+        with cronometro("Imagem: geração do PDF"):
+            return gera_relatorio_pdf(estudos)
+
+    def imagem_relatorio():
+        return renderiza_img(
+            img,
+            rois=centers,
+            radius=radius_roi,
+            phantom_circle=(x_c, y_c, r_c_ajustado),
+            formato="jpg"
+        )
+
+    st.download_button(
+        label="💾 Baixar PDF com as tabelas e a imagem",
+        data=lambda: relatorio_pdf([dict(estudo, imagem=imagem_relatorio())]),
+        file_name=f"relatorio_teste_TC_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+        mime="application/pdf"
+    )
+
+    # Relatório com vários estudos (por exemplo, todos os equipamentos da semana)
+    if "estudos_relatorio" not in st.session_state:
+        st.session_state.estudos_relatorio = []
+    estudos_relatorio = st.session_state.estudos_relatorio
+
+    col_adiciona, col_limpa = st.columns(2)
+    with col_adiciona:
+        if st.button("➕ Adicionar este estudo ao relatório"):
+            # Reanálise da mesma imagem substitui a página anterior
+            estudos_relatorio[:] = [e for e in estudos_relatorio if e["titulo"] != nome_escolhido]
+            estudos_relatorio.append(dict(estudo, imagem=imagem_relatorio()))
+    with col_limpa:
+        if estudos_relatorio and st.button("🗑️ Limpar relatório"):
+            estudos_relatorio.clear()
+
+    if estudos_relatorio:
         st.download_button(
-            label="📄 Baixar relatório em PDF",
-            data=buffer_pdf,
-            file_name=f"relatorio_teste_TC_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+            label=f"📄 Baixar relatório com {len(estudos_relatorio)} estudo(s)",
+            data=lambda: relatorio_pdf(list(estudos_relatorio)),
+            file_name=f"relatorio_semanal_TC_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
             mime="application/pdf"
         )
 
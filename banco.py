@@ -0,0 +1,17 @@
+import sqlite3
+from contextlib import contextmanager
+
+# Acesso aos bancos SQLite locais (histórico de doses, registro dos testes)
+
+# ---------------- Funções ----------------
+
+@contextmanager
+def conecta(caminho):
+    """Conexão com o banco, confirmando a transação ao sair (ou desfazendo, em caso de erro)."""
+    conexao = sqlite3.connect(caminho, timeout=30)
+    try:
+        conexao.execute("PRAGMA journal_mode=WAL")  # Leitores não bloqueiam a gravação
+        with conexao:
+            yield conexao
+    finally:
+        conexao.close()
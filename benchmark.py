@@ -0,0 +1,209 @@
+"""Benchmark da análise de qualidade de imagem com phantoms sintéticos.
+
+Gera cilindros de água sintéticos com ruído, deslocamento e não uniformidade
+conhecidos, em matrizes de 512², 768² e 1024² e em sintaxes de transferência
+sem e com compressão. Mede cada etapa separadamente e confere os resultados
+com os valores verdadeiros, para que uma otimização não altere os números
+sem ser percebida.
+
+Uso:
+    python benchmark.py [-n 5] [--lados 512 768 1024] [-o benchmark.csv]
+"""
+import argparse
+import statistics
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, JPEG2000Lossless, RLELossless, generate_uid
+
+import analise
+import renderizacao
+from analise import avalia_conformidade, crop_rois, detectar_centro_phantom, geometria_rois
+from cache_imagens import decodifica_ct
+from estatisticas_roi import TabelaIntegral
+from relatorio import gera_relatorio_pdf
+
+SINTAXES = {
+    "Sem compressão": ExplicitVRLittleEndian,
+    "RLE": RLELossless,
+    "JPEG 2000 sem perdas": JPEG2000Lossless,
+}
+
+# Tolerâncias da conferência com os valores verdadeiros
+# Posição e raio: a resolução do acumulador de Hough cresce com a matriz (1% do raio, mínimo de 2 px)
+TOLERANCIA_CIRCULO_PX = 2
+TOLERANCIA_CIRCULO_RELATIVA = 0.01
+TOLERANCIA_CT_HU = 1.0
+TOLERANCIA_RUIDO_RELATIVA = 0.05
+TOLERANCIA_UNIFORMIDADE_HU = 1.0
+
+# ---------------- Funções ----------------
+
+def phantom_sintetico(lado, ruido=10.0, desloc=(0, 0), nao_uniformidade=4.0, seed=0):
+    """Cilindro de água (0 HU) em ar (-1000 HU), com ruído gaussiano e realce radial.
+
+    A não uniformidade soma `nao_uniformidade` * (r/R)² HU dentro do phantom, de modo que
+    as ROIs periféricas ficam mais altas que a central. Retorna (imagem em HU, verdade),
+    em que a verdade traz o círculo e os resultados esperados calculados sem ruído.
+    """
+    raio = int(lado * 0.35)
+    cx, cy = lado // 2 + desloc[0], lado // 2 + desloc[1]
+    Y, X = np.ogrid[:lado, :lado]
+    r2 = ((X - cx) ** 2 + (Y - cy) ** 2) / raio**2
+    sem_ruido = np.where(r2 <= 1, nao_uniformidade * r2, -1000.0).astype(np.float32)
+
+    rng = np.random.default_rng(seed)
+    img = sem_ruido + rng.normal(0, ruido, sem_ruido.shape).astype(np.float32)
+
+    circulo = (cx, cy, raio)
+    _, centers, radius_roi = geometria_rois(circulo)
+    ct_medios = [float(roi.mean()) for roi in crop_rois(sem_ruido, centers, int(radius_roi * 2))]
+    verdade = avalia_conformidade(ct_medios, [ruido] * 5)
+    verdade["circulo"] = circulo
+    return img, verdade
+
+def dicom_sintetico(img, sintaxe):
+    """Arquivo DICOM (bytes) de TC com a imagem em HU, na sintaxe de transferência pedida."""
+    bruto = np.clip(np.round(img + 1024), 0, 4095).astype(np.uint16)
+
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = CTImageStorage
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID = generate_uid()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.SOPClassUID = CTImageStorage
+    ds.Modality = "CT"
+    ds.Rows, ds.Columns = bruto.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 12, 11
+    ds.PixelRepresentation = 0
+    ds.RescaleSlope, ds.RescaleIntercept = 1, -1024
+    ds.PixelData = bruto.tobytes()
+    if sintaxe != ExplicitVRLittleEndian:
+        ds.compress(sintaxe)
+
+    arquivo = BytesIO()
+    ds.save_as(arquivo, enforce_file_format=True)
+    return arquivo.getvalue()
+
+def cronometra(funcao, repeticoes, preparo=None):
+    """Mediana (ms) do tempo de `funcao` em `repeticoes` execuções; retorna (ms, último resultado)."""
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        if preparo is not None:
+            preparo()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1000, resultado
+
+def confere(resultado, verdade, img_decodificada, img_original):
+    """Lista das divergências entre o resultado e os valores verdadeiros (vazia se tudo confere)."""
+    erros = []
+    # O arquivo guarda inteiros de 12 bits: a imagem decodificada deve ser o original arredondado e limitado
+    esperada = np.clip(np.round(img_original + 1024), 0, 4095) - 1024
+    if np.abs(np.asarray(img_decodificada) - esperada).max() > 0:
+        erros.append("decodificação difere da imagem original")
+
+    tolerancia_circulo = max(TOLERANCIA_CIRCULO_PX, TOLERANCIA_CIRCULO_RELATIVA * verdade["circulo"][2])
+    if max(abs(a - b) for a, b in zip(resultado["circulo"], verdade["circulo"])) > tolerancia_circulo:
+        erros.append(f"círculo {resultado['circulo']} ≠ {verdade['circulo']}")
+    for i, (ct, ct_ref) in enumerate(zip(resultado["ct_medios"], verdade["ct_medios"])):
+        if abs(ct - ct_ref) > TOLERANCIA_CT_HU:
+            erros.append(f"CT médio ROI {i + 1}: {ct:.2f} ≠ {ct_ref:.2f} HU")
+    for i, (r, r_ref) in enumerate(zip(resultado["ruido_percent"], verdade["ruido_percent"])):
+        if abs(r - r_ref) > TOLERANCIA_RUIDO_RELATIVA * r_ref:
+            erros.append(f"ruído ROI {i + 1}: {r:.3f} ≠ {r_ref:.3f} %")
+    if abs(resultado["uniformidade"] - verdade["uniformidade"]) > TOLERANCIA_UNIFORMIDADE_HU:
+        erros.append(f"uniformidade: {resultado['uniformidade']:.2f} ≠ {verdade['uniformidade']:.2f} HU")
+    if resultado["conforme"] != verdade["conforme"]:
+        erros.append("parecer de conformidade diferente do esperado")
+    return erros
+
+def limpa_memorias():
+    """Esvazia as memorizações entre repetições, para medir o custo real de cada etapa."""
+    analise._CIRCULOS.clear()
+    renderizacao._RENDERIZADAS.clear()
+
+def executa_caso(lado, nome_sintaxe, sintaxe, repeticoes, ruido, desloc, nao_uniformidade):
+    """Mede todas as etapas de um caso (matriz × sintaxe); retorna a linha da tabela de resultados."""
+    from avaliar_teste_tc import plot_img  # Importa o Streamlit; só é necessário aqui
+    import matplotlib.pyplot as plt
+
+    img_original, verdade = phantom_sintetico(lado, ruido, desloc, nao_uniformidade)
+    conteudo = dicom_sintetico(img_original, sintaxe)
+    linha = {"Matriz": f"{lado}²", "Sintaxe": nome_sintaxe, "Tamanho (KB)": len(conteudo) / 1024}
+
+    linha["Decodificação (ms)"], img = cronometra(lambda: decodifica_ct(BytesIO(conteudo)), repeticoes)
+    linha["Detecção do phantom (ms)"], circulo = cronometra(
+        lambda: detectar_centro_phantom(img), repeticoes, preparo=limpa_memorias
+    )
+    _, centers, radius_roi = geometria_rois(circulo)
+    tamanho_roi = int(radius_roi * 2)
+    linha["crop_rois (ms)"], _ = cronometra(lambda: crop_rois(img, centers, tamanho_roi), repeticoes)
+    linha["Estatísticas (ms)"], (medias, desvios, _) = cronometra(
+        lambda: TabelaIntegral(img).estatisticas(centers, tamanho_roi), repeticoes
+    )
+
+    resultado = avalia_conformidade(list(medias), list(desvios))
+    resultado.update({"circulo": circulo, "r_c_ajustado": circulo[2], "centers": centers, "radius_roi": radius_roi})
+
+    def figura():
+        fig = plot_img(img, "benchmark", rois=centers, radius=radius_roi, phantom_circle=circulo)
+        fig.savefig(BytesIO(), format="png")
+        plt.close(fig)
+
+    linha["plot_img (ms)"], _ = cronometra(figura, repeticoes)
+    linha["renderiza_img (ms)"], _ = cronometra(
+        lambda: renderizacao.renderiza_img(img, rois=centers, radius=radius_roi, phantom_circle=circulo),
+        repeticoes, preparo=limpa_memorias
+    )
+    linha["PDF (ms)"], _ = cronometra(
+        lambda: gera_relatorio_pdf([{"titulo": "benchmark", "resultado": resultado, "img": img}], n_workers=1),
+        repeticoes, preparo=limpa_memorias
+    )
+
+    erros = confere(resultado, verdade, img, img_original)
+    linha["Confere"] = "sim" if not erros else "NÃO: " + "; ".join(erros)
+    return linha
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da análise de qualidade de imagem com phantoms sintéticos.")
+    parser.add_argument("-n", "--repeticoes", type=int, default=5, help="Repetições de cada etapa (mediana)")
+    parser.add_argument("--lados", type=int, nargs="+", default=[512, 768, 1024], help="Tamanhos da matriz")
+    parser.add_argument("--ruido", type=float, default=10.0, help="Desvio padrão do ruído (HU)")
+    parser.add_argument("--desloc", type=int, nargs=2, default=[12, -8], help="Deslocamento do phantom (px)")
+    parser.add_argument("--nao-uniformidade", type=float, default=4.0, help="Realce radial na borda (HU)")
+    parser.add_argument("-o", "--saida", help="Grava a tabela de tempos em .csv, para comparar versões")
+    args = parser.parse_args(argv)
+
+    linhas = []
+    for lado in args.lados:
+        for nome_sintaxe, sintaxe in SINTAXES.items():
+            try:
+                linha = executa_caso(lado, nome_sintaxe, sintaxe, args.repeticoes,
+                                     args.ruido, args.desloc, args.nao_uniformidade)
+            except (RuntimeError, NotImplementedError) as e:
+                # Codificador da sintaxe não instalado (por exemplo, JPEG 2000 sem o pylibjpeg-openjpeg)
+                print(f"{lado}² / {nome_sintaxe}: ignorado ({str(e).splitlines()[0]})", file=sys.stderr)
+                continue
+            linhas.append(linha)
+            print(f"{lado}² / {nome_sintaxe}: {linha['Confere']}")
+
+    df = pd.DataFrame(linhas)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.precision", 1):
+        print(df.drop(columns="Confere"))
+    if args.saida:
+        df.to_csv(args.saida, sep=";", index=False, encoding="utf-8")
+
+    return 0 if (df["Confere"] == "sim").all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from imagem_ct import ImagemCT, como_ct
+
+# ---------------- Cache persistente de volumes ----------------
+
+class CacheDisco:
+    """Volumes gravados como .npy (um por série) e reabertos por mmap, sem decodificar.
+
+    Cada volume é identificado pelo SeriesInstanceUID e pelo hash do conteúdo dos
+    arquivos da série e fica nos valores armazenados do DICOM; a reta de conversão
+    para HU vai no arquivo `indice.json`, que guarda também o tamanho e o último
+    acesso de cada volume, usados para remover os menos recentes quando o limite
+    é excedido. Volumes gravados em HU por versões anteriores têm a reta identidade.
+    """
+
+    NOME_INDICE = "indice.json"
+
+    def __init__(self, pasta, limite_bytes):
+        self.pasta = pasta
+        self.limite_bytes = limite_bytes
+        self._trava = threading.Lock()
+        self._gravando = set()  # Chaves sendo gravadas por alguma sessão
+        os.makedirs(pasta, exist_ok=True)
+        self._indice = self._le_indice()
+
+    @staticmethod
+    def chave(series_uid, chaves_conteudo):
+        """Chave de uma série: UID seguido do hash das chaves de conteúdo dos cortes, em ordem."""
+        resumo = hashlib.blake2b("".join(chaves_conteudo).encode(), digest_size=10).hexdigest()
+        uid = re.sub(r"[^0-9A-Za-z.]", "_", str(series_uid)) or "sem_uid"
+        return f"{uid}_{resumo}"
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, f"{chave}.npy")
+
+    def _le_indice(self):
+        try:
+            with open(os.path.join(self.pasta, self.NOME_INDICE), encoding="utf-8") as arquivo:
+                indice = json.load(arquivo)
+        except (OSError, ValueError):
+            indice = {}
+        # Descarta entradas cujo arquivo foi apagado
+        return {chave: item for chave, item in indice.items() if os.path.isfile(self._caminho(chave))}
+
+    def _grava_atomico(self, caminho, grava):
+        """Grava por `grava(arquivo)` (binário) em um temporário único da pasta e o troca pelo destino.
+
+        Repassa o OSError (disco cheio, destino aberto por mmap no Windows...) sem
+        deixar o temporário para trás.
+        """
+        descritor, temporario = tempfile.mkstemp(suffix=".tmp", dir=self.pasta)
+        try:
+            with os.fdopen(descritor, "wb") as arquivo:
+                grava(arquivo)
+            os.replace(temporario, caminho)
+        except BaseException:
+            try:
+                os.remove(temporario)
+            except OSError:
+                pass
+            raise
+
+    def _grava_indice(self):
+        # O índice é refeito a cada alteração: uma gravação que falha só perde os acessos recentes
+        try:
+            self._grava_atomico(os.path.join(self.pasta, self.NOME_INDICE),
+                                lambda arquivo: arquivo.write(json.dumps(self._indice, indent=1).encode("utf-8")))
+        except OSError:
+            pass
+
+    def obter(self, chave):
+        """Abre o volume da série por mmap (somente leitura, `ImagemCT`); None se não estiver no cache."""
+        with self._trava:
+            if chave not in self._indice:
+                return None
+            try:
+                volume = np.load(self._caminho(chave), mmap_mode="r")
+            except (OSError, ValueError):
+                self._indice.pop(chave, None)
+                self._grava_indice()
+                return None
+            item = self._indice[chave]
+            item["ultimo_acesso"] = time.time()
+            self._grava_indice()
+            return ImagemCT(volume, item.get("inclinacao", 1.0), item.get("intercepto", 0.0))
+
+    def gravar(self, chave, volume):
+        """Grava o volume da série e remove os volumes usados há mais tempo, se necessário.
+
+        Não faz nada se a série já está no cache ou sendo gravada por outra sessão.
+        Falhas de gravação são ignoradas: o volume continua em memória.
+        """
+        volume = como_ct(volume)
+        bruta = np.ascontiguousarray(volume.bruta)
+        if bruta.nbytes > self.limite_bytes:
+            return
+        with self._trava:
+            if chave in self._indice or chave in self._gravando:
+                return
+            self._gravando.add(chave)
+        caminho = self._caminho(chave)
+        try:
+            self._grava_atomico(caminho, lambda arquivo: np.save(arquivo, bruta))
+            tamanho = os.path.getsize(caminho)
+        except OSError:
+            with self._trava:
+                self._gravando.discard(chave)
+            return
+
+        with self._trava:
+            self._gravando.discard(chave)
+            self._indice[chave] = {
+                "bytes": tamanho,
+                "cortes": int(bruta.shape[0]),
+                "inclinacao": volume.inclinacao,
+                "intercepto": volume.intercepto,
+                "ultimo_acesso": time.time(),
+            }
+            self._remove_excedente()
+            self._grava_indice()
+
+    def ajusta_limite(self, limite_bytes):
+        with self._trava:
+            self.limite_bytes = limite_bytes
+            self._remove_excedente()
+            self._grava_indice()
+
+    def _remove_excedente(self):
+        total = sum(item["bytes"] for item in self._indice.values())
+        for chave in sorted(self._indice, key=lambda c: self._indice[c]["ultimo_acesso"]):
+            if total <= self.limite_bytes:
+                break
+            try:
+                os.remove(self._caminho(chave))
+            except OSError:
+                continue  # Ainda aberto por mmap (Windows); tenta de novo na próxima limpeza
+            total -= self._indice.pop(chave)["bytes"]
+
+    def estatisticas(self):
+        with self._trava:
+            return {
+                "Séries em disco": len(self._indice),
+                "Espaço usado (MB)": sum(item["bytes"] for item in self._indice.values()) / 1024**2,
+                "Limite (MB)": self.limite_bytes / 1024**2,
+            }
+
+
+# Uma instância por pasta, compartilhada entre as sessões
+_CACHES = {}
+_TRAVA_CACHES = threading.Lock()
+
+
+def abre_cache_disco(pasta, limite_bytes):
+    """Retorna o cache em disco da pasta, criando-o na primeira chamada."""
+    with _TRAVA_CACHES:
+        cache = _CACHES.get(pasta)
+        if cache is None:
+            cache = _CACHES[pasta] = CacheDisco(pasta, limite_bytes)
+    if cache.limite_bytes != limite_bytes:
+        cache.ajusta_limite(limite_bytes)
+    return cache
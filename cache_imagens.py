@@ -0,0 +1,195 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from io import BytesIO
+
+import pydicom as dicom
+
+from imagem_ct import imagem_do_dataset
+
+# ---------------- Cache de imagens decodificadas ----------------
+
+class CacheImagens:
+    """Cache LRU de imagens (`ImagemCT`), compartilhado por todas as sessões e limitado por memória.
+
+    As chaves combinam o SOPInstanceUID e o hash do conteúdo (`chave_imagem`), de modo
+    que várias sessões abrindo a mesma série usam uma única cópia (somente leitura) de
+    cada corte. As imagens fixadas por alguma sessão (`UsoCache`) não são removidas
+    enquanto estiverem em uso; as demais saem por ordem de uso até caber no limite.
+    O limite vale para todas as sessões juntas: com ele ocupado só por imagens em
+    uso, as novas são decodificadas mas não ficam no cache.
+    """
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._referencias = {}  # chave -> número de sessões usando a imagem
+        self._sessoes = weakref.WeakSet()
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+    def obter(self, chave):
+        with self._trava:
+            img = self._itens.get(chave)
+            if img is None:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return img
+
+    def inserir(self, chave, img):
+        tamanho = img.nbytes
+        with self._trava:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                return
+            # Uma imagem maior que o limite inteiro não é armazenada
+            if tamanho > self.limite_bytes:
+                return
+            self._itens[chave] = img
+            self._bytes += tamanho
+            self._remove_excedente()
+
+    def ajusta_limite(self, limite_bytes):
+        with self._trava:
+            self.limite_bytes = limite_bytes
+            self._remove_excedente()
+
+    def _remove_excedente(self):
+        # Remove as imagens usadas há mais tempo até caber no limite; as que estão
+        # em uso continuam na memória de qualquer forma e não são removidas
+        if self._bytes <= self.limite_bytes:
+            return
+        for chave in list(self._itens):
+            if self._bytes <= self.limite_bytes:
+                break
+            if chave in self._referencias:
+                continue
+            self._bytes -= self._itens.pop(chave).nbytes
+            self.remocoes += 1
+
+    def fixar(self, chave, uso):
+        """Marca a imagem como em uso pela sessão de `uso` (uma referência por sessão)."""
+        with self._trava:
+            if chave in uso._chaves or chave not in self._itens:
+                return
+            uso._chaves.add(chave)
+            self._referencias[chave] = self._referencias.get(chave, 0) + 1
+            self._sessoes.add(uso)
+
+    def _libera(self, chaves):
+        # Chamado por UsoCache.libera e pelo finalizador, quando a sessão termina
+        with self._trava:
+            for chave in chaves:
+                restantes = self._referencias.get(chave, 0) - 1
+                if restantes > 0:
+                    self._referencias[chave] = restantes
+                else:
+                    self._referencias.pop(chave, None)
+            chaves.clear()
+            self._remove_excedente()
+
+    def limpa(self):
+        with self._trava:
+            self._itens.clear()
+            self._bytes = 0
+            self._referencias.clear()
+
+    def estatisticas(self):
+        with self._trava:
+            return {
+                "Imagens em cache": len(self._itens),
+                "Memória usada (MB)": self._bytes / 1024**2,
+                "Limite (MB)": self.limite_bytes / 1024**2,
+                "Acertos": self.acertos,
+                "Falhas": self.falhas,
+                "Remoções": self.remocoes,
+                "Imagens em uso": len(self._referencias),
+                "Memória em uso (MB)": sum(self._itens[c].nbytes for c in self._referencias if c in self._itens) / 1024**2,
+                "Sessões": len(self._sessoes),
+            }
+
+
+class UsoCache:
+    """Imagens do cache em uso por uma sessão do Streamlit (guardado em st.session_state).
+
+    Enquanto o objeto existir, as imagens fixadas por ele ficam no cache; quando a
+    sessão termina e o objeto é coletado, as referências são devolvidas.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._chaves = set()
+        # O finalizador não pode guardar referência ao próprio objeto
+        self._finalizador = weakref.finalize(self, cache._libera, self._chaves)
+
+    def libera(self):
+        """Devolve todas as imagens fixadas (por exemplo, ao trocar de série)."""
+        self._cache._libera(self._chaves)
+
+    def __len__(self):
+        return len(self._chaves)
+
+
+# Instância única, compartilhada entre as reexecuções do Streamlit
+CACHE = CacheImagens(limite_bytes=1024 * 1024**2)
+
+
+# ---------------- Funções ----------------
+
+def chave_conteudo(arquivo):
+    """Calcula o hash do conteúdo de um arquivo enviado, sem alterar a posição de leitura."""
+    if hasattr(arquivo, "getbuffer"):
+        return hashlib.blake2b(arquivo.getbuffer(), digest_size=20).hexdigest()
+    posicao = arquivo.tell()
+    conteudo = arquivo.read()
+    arquivo.seek(posicao)
+    return hashlib.blake2b(conteudo, digest_size=20).hexdigest()
+
+
+def decodifica_ct(arquivo):
+    """Lê o arquivo DICOM: pixels no tipo armazenado (em geral 16 bits) e a reta de conversão para HU."""
+    return imagem_do_dataset(dicom.dcmread(arquivo, force=True))
+
+
+def decodifica_hu(arquivo):
+    """Lê o arquivo DICOM e converte os pixels para HU (float32)."""
+    return decodifica_ct(arquivo).hu()
+
+
+def chave_imagem(ds, hash_conteudo):
+    """Chave do cache de uma imagem: SOPInstanceUID (quando existe) e hash do conteúdo."""
+    sop = getattr(ds, "SOPInstanceUID", None)
+    return f"{sop}/{hash_conteudo}" if sop else hash_conteudo
+
+
+def carrega_hu(arquivo, cache=CACHE, chave=None, uso=None):
+    """Retorna a imagem (`ImagemCT`) do cache; decodifica apenas arquivos ainda não vistos.
+
+    O cache guarda os valores armazenados, com metade (ou um quarto) da memória
+    da imagem em float32; a conversão para HU é feita por quem usa a imagem.
+
+    `chave` evita recalcular o hash do conteúdo; com `uso`, a imagem fica fixada
+    no cache para a sessão.
+    """
+    if chave is None:
+        chave = chave_conteudo(arquivo)
+    img = cache.obter(chave)
+    if img is None:
+        # Cópia própria do conteúdo: a leitura antecipada roda em outra thread
+        # e não pode disputar a posição de leitura do arquivo original
+        if hasattr(arquivo, "getvalue"):
+            img = decodifica_ct(BytesIO(arquivo.getvalue()))
+        else:
+            arquivo.seek(0)
+            img = decodifica_ct(arquivo)
+        img.setflags(write=False)  # A mesma matriz é reaproveitada entre as reexecuções e as sessões
+        cache.inserir(chave, img)
+    if uso is not None:
+        cache.fixar(chave, uso)
+    return img
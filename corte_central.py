@@ -0,0 +1,76 @@
+import numpy as np
+
+from analise import detectar_centro_phantom, geometria_rois
+from estatisticas_roi import estatisticas_volume
+from imagem_ct import como_ct
+
+# Separa o phantom (água, acrílico) do ar ao redor
+LIMIAR_PHANTOM_HU = -500
+
+# Fração do raio do phantom a partir da qual o corte é considerado dentro do objeto simulador
+PRESENCA_MINIMA = 0.9
+
+# Passo da grade usada para medir a área do phantom em cada corte
+PASSO_AREA = 4
+
+# ---------------- Funções ----------------
+
+def pontua_cortes(volume, fator_raio=1.0):
+    """Pontua todos os cortes de um volume (n, h, w) de uma só vez.
+
+    Retorna um dicionário com o círculo do phantom, a presença (raio equivalente
+    da área acima de -500 HU dividido pelo raio do phantom), o raio equivalente e
+    a uniformidade de cada corte, além do índice do corte central sugerido.
+    """
+    volume = como_ct(volume)
+    n, h, w = volume.shape
+
+    # Círculo do phantom detectado uma única vez, na projeção de intensidade máxima da série
+    circulo = detectar_centro_phantom(volume.max(axis=0))
+    x_c, y_c, r_c = circulo
+
+    # Área ocupada pelo phantom dentro do círculo, medida numa grade reduzida
+    Y, X = np.ogrid[:h:PASSO_AREA, :w:PASSO_AREA]
+    dentro = (X - x_c) ** 2 + (Y - y_c) ** 2 <= (1.05 * r_c) ** 2
+    # Limiar convertido para os valores armazenados, em vez de converter o volume para HU
+    amostra = volume.bruta[:, ::PASSO_AREA, ::PASSO_AREA][:, dentro]
+    area = (amostra > volume.para_bruto(LIMIAR_PHANTOM_HU)).sum(axis=1) * PASSO_AREA ** 2
+    raio_equivalente = np.sqrt(area / np.pi)
+    presenca = raio_equivalente / max(r_c, 1)
+
+    # Uniformidade das cinco ROIs em todos os cortes
+    _, centers, radius_roi = geometria_rois(circulo, fator_raio)
+    medias, desvios = estatisticas_volume(volume, centers, int(radius_roi * 2))
+    uniformidade = np.abs(medias[:, 1:] - medias[:, :1]).max(axis=1)
+
+    pontuacao = {
+        "circulo": circulo,
+        "presenca": presenca,
+        "raio_equivalente": raio_equivalente,
+        "uniformidade": uniformidade,
+        "ct_central": medias[:, 0],
+        "ruido_central": desvios[:, 0] / 1000 * 100,
+    }
+    pontuacao["indice"] = escolhe_corte_central(presenca, uniformidade)
+    return pontuacao
+
+
+def escolhe_corte_central(presenca, uniformidade):
+    """Escolhe o corte central do objeto simulador.
+
+    Entre os cortes em que o phantom aparece inteiro, considera os próximos do meio
+    da extensão do objeto (±10%) e fica com o de menor diferença entre as ROIs.
+    """
+    presentes = np.flatnonzero(presenca >= PRESENCA_MINIMA)
+    if not len(presentes):
+        return int(np.argmax(presenca))
+
+    primeiro, ultimo = presentes[0], presentes[-1]
+    meio = (primeiro + ultimo) / 2
+    margem = max(1.0, (ultimo - primeiro) * 0.1)
+    candidatos = presentes[np.abs(presentes - meio) <= margem]
+    if not len(candidatos):
+        candidatos = presentes[[np.argmin(np.abs(presentes - meio))]]
+
+    uniformidade = np.nan_to_num(uniformidade[candidatos], nan=np.inf)
+    return int(candidatos[np.argmin(uniformidade)])
@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from cache_imagens import CACHE, chave_conteudo, decodifica_ct
+
+# Pools reaproveitados entre as chamadas, um por (modo, número de workers)
+_POOLS = {}
+_TRAVA = threading.Lock()
+
+
+# ---------------- Funções ----------------
+
+def numero_workers(n_workers=0):
+    """Número efetivo de workers; 0 (ou negativo) usa todos os núcleos."""
+    if n_workers and n_workers > 0:
+        return n_workers
+    return os.cpu_count() or 1
+
+
+def obtem_pool(modo, n_workers):
+    """Pool de processos (ou threads) compartilhado, criado na primeira chamada."""
+    with _TRAVA:
+        pool = _POOLS.get((modo, n_workers))
+        if pool is None:
+            if modo == "processos":
+                # "spawn" evita copiar por fork o estado das threads do servidor Streamlit
+                pool = ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                pool = ThreadPoolExecutor(n_workers, thread_name_prefix="decodificacao")
+            _POOLS[(modo, n_workers)] = pool
+        return pool
+
+
+def descarta_pool(modo, n_workers):
+    with _TRAVA:
+        _POOLS.pop((modo, n_workers), None)
+
+
+def _conteudo(arquivo):
+    if hasattr(arquivo, "getvalue"):
+        return arquivo.getvalue()
+    arquivo.seek(0)
+    return arquivo.read()
+
+
+def _decodifica_conteudo(conteudo):
+    return decodifica_ct(BytesIO(conteudo))
+
+
+def decodifica_serie(arquivos, n_workers=0, modo="processos", cache=CACHE, chaves=None):
+    """Decodifica vários arquivos DICOM em paralelo, mantendo a ordem original.
+
+    Retorna (imagens, erros): `imagens` é uma lista de (nome, `ImagemCT`) e
+    `erros` uma lista de (nome, exceção) no mesmo formato exibido com st.error.
+    `chaves` são as chaves do cache já calculadas para os arquivos, se houver.
+    """
+    n_workers = numero_workers(n_workers)
+    imagens = [None] * len(arquivos)
+    erros = []
+
+    # Arquivos já decodificados vêm direto do cache
+    pendentes = {}
+    for i, arquivo in enumerate(arquivos):
+        chave = chaves[i] if chaves is not None else chave_conteudo(arquivo)
+        img = cache.obter(chave)
+        if img is not None:
+            imagens[i] = img
+        else:
+            pendentes[i] = chave
+
+    if len(pendentes) > 1 and n_workers > 1:
+        pool = obtem_pool(modo, n_workers)
+        futuros = {i: pool.submit(_decodifica_conteudo, _conteudo(arquivos[i])) for i in pendentes}
+    else:
+        futuros = {}
+
+    for i, chave in pendentes.items():
+        try:
+            if i in futuros:
+                img = futuros[i].result()
+            else:
+                img = _decodifica_conteudo(_conteudo(arquivos[i]))
+        except BrokenProcessPool as e:
+            # Um worker morreu: o pool não pode mais ser usado
+            descarta_pool(modo, n_workers)
+            erros.append((arquivos[i].name, e))
+            continue
+        except Exception as e:
+            erros.append((arquivos[i].name, e))
+            continue
+        img.setflags(write=False)
+        cache.inserir(chave, img)
+        imagens[i] = img
+
+    resultado = [(arquivo.name, img) for arquivo, img in zip(arquivos, imagens) if img is not None]
+    return resultado, erros
@@ -1,181 +1,177 @@
-import numpy as np
-import pydicom as dicom
-import matplotlib.pyplot as plt
 import pandas as pd
 import streamlit as st
-import cv2
 import os
 import datetime
 from io import BytesIO
+from globais import carrega_ini, carrega_parametro
+from historico_doses import abre_historico
+from fila_tarefas import FILA, chave_tarefa
+from ingestao import expande_uploads, versao_arquivo
+from instrumentacao import cronometro
+from metadados import arquivos_da_pasta, le_registros, tabela_estudos
+from paginas import acompanha_tarefa
 
 # ---------------- Funções ----------------
 
-def plot_img(img, name, rois=None, radius=25, phantom_circle=None):
-    """Plota imagem em HU (sem normalização)."""
-    fig, ax = plt.subplots()
-    ax.imshow(img, cmap='gray')
-    if phantom_circle is not None:
-        x, y, r = phantom_circle
-        circ = plt.Circle((x, y), r, color='blue', fill=False, linestyle='--', linewidth=1.5)
-        ax.add_artist(circ)
-    if rois:
-        for c in rois:
-            ax.add_artist(plt.Circle(c, radius, color='red', fill=False, linewidth=1.5))
-    ax.axis('off')
-    ax.set_title(name, fontsize=10)
-    return fig
-    return rois
-
-def extrair_info_dicom(ds):
-    """Extrai informações principais do cabeçalho DICOM e formata a data do estudo para DD/MM/YYYY."""
-    def get(tag):
-        return getattr(ds, tag, "N/A")
-    
-    # Formatar a data do estudo (StudyDate) para o formato DD/MM/YYYY
-    study_date = get("StudyDate")
-    if study_date != "N/A":
-        try:
-            # Converte de YYYYMMDD para DD/MM/YYYY
-            study_date = datetime.datetime.strptime(study_date, "%Y%m%d").strftime("%d/%m/%Y")
-        except ValueError:
-            study_date = "Data inválida"  # Caso a conversão falhe, coloca um valor padrão
-    
-    info = {
-        "Paciente": str(get("PatientName")),
-        "ID do Paciente": str(get("PatientID")),
-        "Modalidade": str(get("Modality")),
-        "Data do Estudo": study_date,  # A data já estará no formato DD/MM/YYYY
-        "Descrição da Série": str(get("SeriesDescription")),
-        "kVp": str(get("KVP")),
-        "mAs": str(get("Exposure")),
-        "Fabricante": str(get("Manufacturer")),
-        "Modelo do Equipamento": str(get("ManufacturerModelName")),
-        "Tempo de Exposição": str(get("ExposureTime")),
-        "CTDIvol": str(get("CTDIvol")),
-        "DLP": str(get("DLP value")),
-        
-    }
-    
-    return pd.DataFrame(info.items(), columns=["Campo DICOM", "Valor"])
-
-# Função de exportação para Excel
-def app():
-    st.title("Metadados DICOM: Acompanhamento de doses")
-    st.write("Carregue uma imagem DICOM para visualizar os metadados.")
+def exporta_excel(df, nome_planilha):
+    """Planilha Excel (bytes) com o DataFrame."""
+    buffer_excel = BytesIO()
+    with pd.ExcelWriter(buffer_excel, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name=nome_planilha)
+    return buffer_excel.getvalue()
 
-    uploads = st.file_uploader("Escolha imagens DICOM", accept_multiple_files=True)
-    if not uploads:
-        st.warning("Nenhuma imagem selecionada!")
-        return
+def exporta_com_tempo(funcao, *args):
+    with cronometro("Doses: exportação para Excel"):
+        return funcao(*args)
 
-    imagens_dict = {}
-    metadados_dict = {}
+def le_registros_com_tempo(fontes, n_workers, informa=None):
+    with cronometro("Doses: leitura dos cabeçalhos"):
+        return le_registros(fontes, n_workers, informa)
 
-    for upload in uploads:
-        try:
-            ds = dicom.dcmread(upload, force=True)
-            img = ds.pixel_array.astype(np.float32)
+def app():
+    st.title("Metadados DICOM: Acompanhamento de doses")
+    st.write("Carregue imagens DICOM (ou informe uma pasta) para visualizar os metadados.")
 
-            # --- Conversão para HU ---
-            if hasattr(ds, "RescaleSlope") and hasattr(ds, "RescaleIntercept"):
-                img = img * float(ds.RescaleSlope) + float(ds.RescaleIntercept)
+    uploads = st.file_uploader("Escolha imagens DICOM (ou o arquivo ZIP exportado do PACS)", accept_multiple_files=True)
+    pasta = st.text_input("Ou informe uma pasta, um DICOMDIR ou um ZIP com imagens DICOM")
 
-            imagens_dict[upload.name] = img
-            metadados_dict[upload.name] = extrair_info_dicom(ds)
+    # Planilhas das versões anteriores (ou exportações do histórico) podem ser
+    # incorporadas ao histórico sem carregar imagens
+    with st.expander("📥 Importar histórico de uma planilha Excel"):
+        planilha = st.file_uploader("Planilha Excel de metadados ou do histórico de doses", type="xlsx")
+        if planilha is not None and st.button("📥 Importar registros da planilha"):
+            try:
+                novos, rejeitados = abre_historico(carrega_ini()[0]).importa_excel(planilha)
+                st.success(f"{novos} registro(s) importado(s) para o histórico.")
+                if rejeitados:
+                    st.warning(f"{rejeitados} coluna(s)/linha(s) da planilha sem nenhum campo reconhecido foram ignoradas.")
+            except Exception as e:
+                st.error(f"Erro ao importar a planilha: {e}")
+
+    # Arquivos ZIP são lidos entrada por entrada, sem extração
+    fontes = expande_uploads(uploads or [])
+    if pasta:
+        if os.path.basename(pasta).upper() == "DICOMDIR":
+            pasta = os.path.dirname(pasta)
+        if os.path.exists(pasta):
+            fontes += arquivos_da_pasta(pasta)
+        else:
+            st.error(f"Pasta não encontrada: {pasta}")
+    if not fontes:
+        st.warning("Nenhuma imagem selecionada!")
+        return
 
-        except Exception as e:
-            st.error(f"Erro ao ler {upload.name}: {e}")
-            continue
+    # Somente os cabeçalhos são lidos (os pixels nunca são decodificados), em
+    # segundo plano: a página acompanha o andamento sem ficar bloqueada
+    # Arquivos e ZIPs locais entram com a versão (mtime e tamanho): reescritos, são lidos de novo
+    identificacao = [(fonte, versao_arquivo(fonte)) if isinstance(fonte, str)
+                     else (getattr(fonte, "file_id", fonte.name), getattr(fonte, "versao", None))
+                     for fonte in fontes]
+    tarefa = FILA.submete(
+        chave_tarefa("cabecalhos", identificacao), le_registros_com_tempo,
+        fontes, int(carrega_parametro("decodificacao", "workers", 0)),
+        descricao=f"Cabeçalhos de {len(fontes)} arquivo(s)", modo="threads"
+    )
+    if not tarefa.pronta:
+        acompanha_tarefa(tarefa.chave, f"Lendo os cabeçalhos de {len(fontes)} arquivo(s)")
+        return
+    registros, erros = tarefa.resultado()
+    if erros:
+        with st.expander(f"⚠️ {len(erros)} arquivo(s) não puderam ser lidos"):
+            for nome, e in erros:
+                st.error(f"Erro ao ler {nome}: {e}")
 
-    if not imagens_dict:
+    if not registros:
         st.warning("Nenhuma imagem válida foi carregada.")
         return
 
-    nomes = list(imagens_dict.keys())
-    if "img_index" not in st.session_state:
-        st.session_state.img_index = 0
-
-    nome_escolhido = nomes[st.session_state.img_index]
-    img = imagens_dict[nome_escolhido]
-    st.info(f"Imagem selecionada: {nome_escolhido}")
-
     # ---------- Exibe METADADOS DICOM ----------
-    st.subheader("📋 Informações DICOM")
-    st.dataframe(metadados_dict[nome_escolhido])
+    st.subheader("📋 Informações DICOM por estudo")
+    with cronometro("Doses: tabela de estudos"):
+        df_estudos = tabela_estudos(registros)
+    st.info(f"{len(registros)} imagem(ns) em {len(df_estudos)} estudo(s)")
+    st.dataframe(df_estudos, column_config={
+        "Data do Estudo": st.column_config.DateColumn(format="DD/MM/YYYY")
+    })
 
     # ---------------------------
-    # Exportar / Atualizar Excel
+    # Exportar Excel
     # ---------------------------
 
-    st.subheader("💾 Exportar / Atualizar Excel")
+    st.subheader("💾 Exportar Excel")
 
-    opcao = st.radio(
-        "Escolha uma opção:",
-        ["Baixar novo arquivo Excel", "Atualizar arquivo Excel existente"]
+    st.download_button(
+        label="📊 Baixar nova tabela Excel",
+        data=lambda: exporta_com_tempo(exporta_excel, df_estudos, "Metadados_DICOM"),
+        file_name=f"metadados_dicom_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
 
-    if opcao == "Baixar novo arquivo Excel":
-        buffer_excel = BytesIO()
-        with pd.ExcelWriter(buffer_excel, engine="openpyxl") as writer:
-            # Antes de exportar, garantir que a data esteja formatada corretamente
-            metadados = metadados_dict[nome_escolhido]
-            # A data já está formatada no formato DD/MM/YYYY
-            metadados.to_excel(writer, index=False, sheet_name="Metadados_DICOM")
-        buffer_excel.seek(0)
-
-        st.download_button(
-            label="📊 Baixar nova tabela Excel",
-            data=buffer_excel,
-            file_name=f"metadados_dicom_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+    # ---------------------------
+    # Histórico de doses
+    # ---------------------------
 
-    elif opcao == "Atualizar arquivo Excel existente":
-        uploaded_excel = st.file_uploader("Selecione o arquivo Excel existente", type=["xlsx"])
-        if uploaded_excel:
-            try:
-                df_existente = pd.read_excel(uploaded_excel)
-
-                # Encontrar colunas com a data atual
-                data_teste = datetime.datetime.now().strftime("%d/%m/%Y")
-                colunas_data = [c for c in df_existente.columns if data_teste in c]
-
-                if not colunas_data:
-                    # Primeira coluna do dia, sem sufixo
-                    coluna_nova = f"Valor ({data_teste})"
-                else:
-                    # Gera o próximo índice incremental
-                    indices_existentes = []
-                    for c in colunas_data:
-                        try:
-                            parte = c.split("_")[-1].replace(")", "")
-                            indice = int(parte) if parte.isdigit() else 0
-                            indices_existentes.append(indice)
-                        except ValueError:
-                            indices_existentes.append(0)
-                    proximo_indice = max(indices_existentes) + 1
-                    coluna_nova = f"Valor ({data_teste}_{proximo_indice})"
-
-                # Adiciona a nova coluna ao Excel
-                df_atualizado = df_existente.merge(metadados_dict[nome_escolhido], on="Campo DICOM", how="outer")
-                df_atualizado = df_atualizado.rename(columns={coluna_nova: coluna_nova})
-
-                buffer_excel = BytesIO()
-                with pd.ExcelWriter(buffer_excel, engine="openpyxl") as writer:
-                    df_atualizado.to_excel(writer, index=False, sheet_name="Metadados_DICOM")
-                buffer_excel.seek(0)
-
-                st.success(f"✅ Excel atualizado")
-                st.download_button(
-                    label="📥 Baixar Excel atualizado",
-                    data=buffer_excel,
-                    file_name=f"{uploaded_excel.name.split('.')[0]}_atualizado.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+    st.subheader("🗄️ Histórico de doses")
+    pasta_csv = carrega_ini()[0]
+    historico = abre_historico(pasta_csv)
+
+    if st.button(f"➕ Registrar {len(registros)} imagem(ns) no histórico"):
+        with cronometro("Doses: registro no histórico"):
+            novos = historico.registrar(registros)
+        if novos:
+            st.success(f"✅ {novos} registro(s) adicionado(s) ao histórico")
+        else:
+            st.info("Essas imagens já estavam no histórico.")
+        sem_data = sum(registro["data_estudo"] is None for registro in registros)
+        if sem_data:
+            st.warning(f"{sem_data} imagem(ns) sem data do estudo: ficam no histórico, mas fora das medianas mensais.")
+
+    st.write(f"Registros no histórico: {historico.total()}")
+    st.download_button(
+        label="📥 Exportar histórico para Excel",
+        data=lambda: exporta_com_tempo(historico.exporta_excel),
+        file_name=f"historico_doses_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
 
-            except Exception as e:
-                st.error(f"Erro ao atualizar o Excel: {e}")
 
+    # ---------------------------
+    # Tendências das doses
+    # ---------------------------
+
+    st.subheader("📈 Tendências das doses")
+    col1, col2 = st.columns(2)
+    with col1:
+        desde = st.date_input("Estudos a partir de", value=datetime.date.today() - datetime.timedelta(days=730))
+    with col2:
+        nivel_referencia = st.number_input(
+            "Nível de referência de CTDIvol (mGy)",
+            min_value=0.1,
+            value=float(carrega_parametro("doses", "nivel_referencia_ctdivol", 25)),
+            step=1.0
+        )
+
+    with cronometro("Doses: mediana mensal do CTDIvol"):
+        medianas = historico.mediana_mensal_ctdivol(desde.isoformat())
+    if medianas.empty:
+        st.info("Ainda não há estudos com CTDIvol no histórico para o período.")
+        return
+
+    st.markdown("**Mediana mensal do CTDIvol por equipamento (mGy)**")
+    st.line_chart(medianas.pivot(index="mes", columns="equipamento", values="mediana_ctdivol"))
+
+    with cronometro("Doses: estudos acima do nível de referência"):
+        acima = historico.acima_do_nivel(nivel_referencia, desde.isoformat())
+    st.markdown(f"**Estudos acima do nível de referência ({len(acima)})**")
+    st.dataframe(acima.rename(columns={
+        "equipamento": "Equipamento",
+        "data_estudo": "Data do Estudo",
+        "study_instance_uid": "StudyInstanceUID",
+        "descricao_serie": "Descrição da Série",
+        "ctdivol": "CTDIvol médio",
+        "imagens": "Imagens",
+        "razao_nivel": "CTDIvol / referência",
+    }), column_config={"Data do Estudo": st.column_config.DateColumn(format="DD/MM/YYYY")})
 
 
 if __name__ == "__main__":
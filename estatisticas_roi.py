@@ -0,0 +1,166 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from imagem_ct import como_ct
+
+# Estatísticas de ROIs circulares por tabelas de somas acumuladas (imagens integrais).
+# Um círculo se decompõe em segmentos horizontais, então basta acumular as somas
+# ao longo das linhas: a soma de cada segmento sai de duas consultas à tabela.
+
+
+def segmentos_rois(forma, centros, tamanhos):
+    """Decompõe ROIs circulares em segmentos horizontais (linha, coluna inicial, coluna final).
+
+    `centros` é uma sequência de (x, y) e `tamanhos` o lado do recorte de cada ROI
+    (um valor para todas ou um por centro). A geometria é a mesma de `crop_rois`:
+    recorte quadrado a partir de (x - r, y - r), limitado às bordas da imagem, e
+    máscara circular centrada no recorte.
+
+    Retorna matrizes (nº de ROIs, nº de linhas) `linhas`, `xa`, `xb` e `valida`;
+    segmentos inválidos têm xb = xa - 1 (comprimento zero).
+    """
+    h_img, w_img = forma
+    centros = np.asarray(centros, dtype=np.int64).reshape(-1, 2)
+    tamanhos = np.broadcast_to(np.asarray(tamanhos, dtype=np.int64), (len(centros),))
+
+    r = tamanhos // 2
+    x0 = np.maximum(centros[:, 0] - r, 0)
+    y0 = np.maximum(centros[:, 1] - r, 0)
+    w = np.clip(np.minimum(tamanhos, w_img - x0), 0, None)
+    h = np.clip(np.minimum(tamanhos, h_img - y0), 0, None)
+    cx = x0 + w // 2
+    cy = y0 + h // 2
+    raio = np.minimum(r, np.minimum(h // 2, w // 2))
+
+    # Uma linha da matriz por ROI, uma coluna por deslocamento vertical dentro do círculo
+    dy = np.arange(-raio.max(initial=0), raio.max(initial=0) + 1)
+    linhas = cy[:, None] + dy[None, :]
+    resto = raio[:, None] ** 2 - dy[None, :] ** 2
+    valida = resto >= 0
+
+    # Meia largura de cada segmento: maior inteiro m com m² <= resto
+    meia = np.floor(np.sqrt(np.clip(resto, 0, None))).astype(np.int64)
+
+    xa = np.maximum(cx[:, None] - meia, x0[:, None])
+    xb = np.minimum(cx[:, None] + meia, (x0 + w - 1)[:, None])
+    valida &= (linhas >= y0[:, None]) & (linhas < (y0 + h)[:, None]) & (xb >= xa)
+
+    linhas = np.where(valida, linhas, 0)
+    xa = np.where(valida, xa, 0)
+    xb = np.where(valida, xb, -1)
+    return linhas, xa, xb, valida
+
+
+def indices_rois(forma, centros, tamanhos):
+    """Índices lineares dos pixels de cada ROI, concatenados, e o início de cada ROI.
+
+    Serve para reunir as mesmas ROIs em todos os cortes de um volume com uma
+    única indexação: `volume.reshape(n, -1)[:, indices]`.
+    """
+    linhas, xa, xb, _ = segmentos_rois(forma, centros, tamanhos)
+    comprimentos = (xb - xa + 1).ravel()
+    inicio_segmento = (linhas * forma[1] + xa).ravel()
+
+    # Expande cada segmento em seus pixels: início repetido + posição dentro do segmento
+    total = int(comprimentos.sum())
+    deslocamento = np.arange(total) - np.repeat(np.cumsum(comprimentos) - comprimentos, comprimentos)
+    indices = np.repeat(inicio_segmento, comprimentos) + deslocamento
+
+    contagens = comprimentos.reshape(linhas.shape).sum(axis=1)
+    inicios = np.concatenate(([0], np.cumsum(contagens)[:-1]))
+    return indices, inicios, contagens
+
+
+def estatisticas_volume(volume, centros, tamanhos):
+    """Média e desvio padrão (em HU) das mesmas ROIs em todos os cortes de um volume (n, h, w).
+
+    O volume pode estar em valores armazenados (`ImagemCT`): as estatísticas são
+    calculadas sobre eles e convertidas pela reta. Retorna matrizes (n, nº de ROIs)
+    de médias e desvios.
+    """
+    volume = como_ct(volume)
+    n = volume.shape[0]
+    indices, inicios, contagens = indices_rois(volume.shape[1:], centros, tamanhos)
+    pixels = volume.bruta.reshape(n, -1)[:, indices].astype(np.float64)
+
+    def somas(valores):
+        # Soma de cada ROI pela diferença das somas acumuladas (ROIs vazias somam zero)
+        acumulada = np.zeros((n, valores.shape[1] + 1))
+        np.cumsum(valores, axis=1, out=acumulada[:, 1:])
+        return acumulada[:, inicios + contagens] - acumulada[:, inicios]
+
+    # Médias por ROI; o desvio é calculado sobre os valores já centrados na média
+    with np.errstate(invalid="ignore", divide="ignore"):
+        medias = somas(pixels) / contagens
+        pixels -= np.repeat(medias, contagens, axis=1)
+        desvios = np.sqrt(somas(pixels * pixels) / contagens)
+    return volume.para_hu(medias), volume.inclinacao * desvios
+
+
+class TabelaIntegral:
+    """Somas acumuladas dos pixels e dos seus quadrados, calculadas uma única vez por corte.
+
+    Para uma `ImagemCT`, as somas são dos valores armazenados; as estatísticas
+    são convertidas para HU pela reta da imagem.
+    """
+
+    def __init__(self, img):
+        ct = como_ct(img)
+        self.reta = ct.reta()
+        img = np.asarray(ct.bruta, dtype=np.float64)
+        self.forma = img.shape
+
+        # Subtrair a média reduz o cancelamento numérico em soma(x²) - soma(x)²
+        self.referencia = float(img.mean())
+        centrada = img - self.referencia
+
+        h, w = img.shape
+        self.soma = np.zeros((h, w + 1))
+        self.soma_quadrados = np.zeros((h, w + 1))
+        np.cumsum(centrada, axis=1, out=self.soma[:, 1:])
+        np.cumsum(centrada * centrada, axis=1, out=self.soma_quadrados[:, 1:])
+
+    def estatisticas(self, centros, tamanhos):
+        """Média e desvio padrão (em HU) e nº de pixels de várias ROIs circulares em uma só chamada.
+
+        A geometria das ROIs é a de `segmentos_rois` (a mesma de `crop_rois`).
+        """
+        linhas, xa, xb, _ = segmentos_rois(self.forma, centros, tamanhos)
+
+        contagens = (xb - xa + 1).sum(axis=1)
+        s1 = (self.soma[linhas, xb + 1] - self.soma[linhas, xa]).sum(axis=1)
+        s2 = (self.soma_quadrados[linhas, xb + 1] - self.soma_quadrados[linhas, xa]).sum(axis=1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media_centrada = s1 / contagens
+            variancia = np.clip(s2 / contagens - media_centrada ** 2, 0, None)
+        inclinacao, intercepto = self.reta
+        media = inclinacao * (media_centrada + self.referencia) + intercepto
+        return media, inclinacao * np.sqrt(variancia), contagens
+
+
+# Tabelas dos últimos cortes analisados, reaproveitadas entre as reexecuções
+# (as imagens vêm do cache e são sempre os mesmos objetos)
+_TABELAS = OrderedDict()
+_TRAVA = threading.Lock()
+_MAX_TABELAS = 8
+
+
+def tabela_integral(img):
+    """Retorna a tabela integral do corte, calculando-a apenas na primeira vez."""
+    chave = id(img)
+    with _TRAVA:
+        item = _TABELAS.get(chave)
+        if item is not None and item[0]() is img:
+            _TABELAS.move_to_end(chave)
+            return item[1]
+
+    tabela = TabelaIntegral(img)
+    with _TRAVA:
+        _TABELAS[chave] = (weakref.ref(img), tabela)
+        while len(_TABELAS) > _MAX_TABELAS:
+            _TABELAS.popitem(last=False)
+    return tabela
@@ -0,0 +1,181 @@
+import hashlib
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+
+from decodificacao import descarta_pool, numero_workers, obtem_pool
+
+# Fila de tarefas em segundo plano para as páginas do app: o script do
+# Streamlit só submete o trabalho e consulta o andamento, sem ficar bloqueado.
+# As tarefas vivem no processo do servidor, portanto sobrevivem às reexecuções
+# (e às sessões); uma submissão com a mesma chave reaproveita a tarefa existente.
+
+# Tarefas concluídas mantidas em memória (as mais antigas são descartadas)
+MAXIMO_CONCLUIDAS = 32
+
+# ---------------- Funções ----------------
+
+def chave_tarefa(*partes):
+    """Chave curta e estável para uma submissão, a partir de valores convertidos em texto."""
+    return hashlib.blake2b(repr(partes).encode(), digest_size=16).hexdigest()
+
+
+def _executa(funcao, chave, andamento, args, kwargs):
+    """Executada no worker: repassa à função um `informa(etapa, fração)` que publica o andamento."""
+    ultimo = [None]
+
+    def informa(etapa, fracao=0.0):
+        # Publica só mudanças visíveis (1%), para não saturar o canal entre processos
+        atual = (etapa, round(fracao, 2))
+        if atual != ultimo[0]:
+            ultimo[0] = atual
+            andamento[chave] = atual
+
+    return funcao(*args, informa=informa, **kwargs)
+
+
+class Tarefa:
+    """Uma submissão à fila: estado, andamento e resultado."""
+
+    def __init__(self, chave, descricao, futuro, andamento):
+        self.chave = chave
+        self.descricao = descricao
+        self.inicio = time.time()
+        self.fim = None
+        self._futuro = futuro
+        self._andamento = andamento
+        futuro.add_done_callback(self._conclui)
+
+    def _conclui(self, _):
+        self.fim = time.time()
+
+    @property
+    def pronta(self):
+        return self._futuro.done()
+
+    @property
+    def falhou(self):
+        return self._futuro.done() and (self._futuro.cancelled() or self._futuro.exception() is not None)
+
+    @property
+    def estado(self):
+        if self._futuro.cancelled():
+            return "cancelada"
+        if self._futuro.done():
+            return "falhou" if self._futuro.exception() is not None else "concluída"
+        return "executando" if self._futuro.running() or self.chave in self._andamento else "na fila"
+
+    def andamento(self):
+        """(etapa, fração de 0 a 1) informados pela função; 1.0 quando a tarefa termina."""
+        if self._futuro.done():
+            return self.estado, 1.0
+        try:
+            return self._andamento.get(self.chave, (self.estado, 0.0))
+        except (OSError, EOFError):
+            return self.estado, 0.0  # Gerenciador encerrado (servidor sendo desligado)
+
+    def resultado(self):
+        """Resultado da função; repassa a exceção, se a tarefa falhou. Não bloqueia se a tarefa estiver pronta."""
+        return self._futuro.result()
+
+    def erro(self):
+        return self._futuro.exception() if self._futuro.done() and not self._futuro.cancelled() else None
+
+    def duracao(self):
+        return (self.fim or time.time()) - self.inicio
+
+
+class FilaTarefas:
+    """Fila local de tarefas executadas pelos pools compartilhados de `decodificacao`.
+
+    `modo="processos"` para trabalho de CPU (decodificação, análise das imagens),
+    cujos argumentos precisam ser serializáveis; `modo="threads"` para trabalho de
+    E/S, que pode receber os objetos de arquivo enviados pelo Streamlit.
+    """
+
+    def __init__(self, n_workers=0, maximo_concluidas=MAXIMO_CONCLUIDAS):
+        self.n_workers = n_workers
+        self.maximo_concluidas = maximo_concluidas
+        self._tarefas = OrderedDict()
+        self._trava = threading.Lock()
+        self._gerenciador = None
+        self._andamento = {}
+        self._andamento_processos = None
+
+    def _canal(self, modo):
+        # Processos publicam o andamento num dicionário compartilhado, criado no primeiro uso
+        if modo != "processos":
+            return self._andamento
+        if self._gerenciador is None:
+            gerenciador = multiprocessing.get_context("spawn").Manager()
+            self._andamento_processos = gerenciador.dict()
+            self._gerenciador = gerenciador
+        return self._andamento_processos
+
+    def submete(self, chave, funcao, *args, descricao="", modo="processos", **kwargs):
+        """Submete `funcao(*args, informa=..., **kwargs)`, ou devolve a tarefa já submetida com a mesma chave.
+
+        Tarefas que falharam são submetidas de novo.
+        """
+        with self._trava:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None and not tarefa.falhou:
+                self._tarefas.move_to_end(chave)
+                return tarefa
+
+            n_workers = numero_workers(self.n_workers)
+            try:
+                andamento = self._canal(modo)
+                futuro = obtem_pool(modo, n_workers).submit(_executa, funcao, chave, andamento, args, kwargs)
+            except (BrokenProcessPool, EOFError, OSError):
+                # Pool de processos indisponível (worker morto, processos não podem ser criados):
+                # a tarefa roda em threads e o pool é recriado na próxima submissão
+                descarta_pool(modo, n_workers)
+                modo = "threads"
+                andamento = self._canal(modo)
+                futuro = obtem_pool(modo, n_workers).submit(_executa, funcao, chave, andamento, args, kwargs)
+            futuro.add_done_callback(lambda f: self._verifica_pool(f, modo, n_workers))
+            tarefa = Tarefa(chave, descricao, futuro, andamento)
+            self._tarefas[chave] = tarefa
+            self._limpa()
+            return tarefa
+
+    @staticmethod
+    def _verifica_pool(futuro, modo, n_workers):
+        # Um worker morreu durante a tarefa: o pool não pode mais ser usado
+        if not futuro.cancelled() and isinstance(futuro.exception(), BrokenProcessPool):
+            descarta_pool(modo, n_workers)
+
+    def _limpa(self):
+        concluidas = [chave for chave, tarefa in self._tarefas.items() if tarefa.pronta]
+        for chave in concluidas[:max(0, len(concluidas) - self.maximo_concluidas)]:
+            del self._tarefas[chave]
+            self._andamento.pop(chave, None)
+            if self._gerenciador is not None:
+                self._andamento_processos.pop(chave, None)
+
+    def obtem(self, chave):
+        with self._trava:
+            return self._tarefas.get(chave)
+
+    def tabela(self):
+        """Uma linha por tarefa guardada, da mais recente para a mais antiga."""
+        with self._trava:
+            tarefas = list(self._tarefas.values())
+        linhas = []
+        for tarefa in reversed(tarefas):
+            etapa, fracao = tarefa.andamento()
+            linhas.append({
+                "Tarefa": tarefa.descricao or tarefa.chave,
+                "Estado": tarefa.estado,
+                "Etapa": etapa,
+                "Andamento (%)": 100 * fracao,
+                "Duração (s)": tarefa.duracao(),
+            })
+        return linhas
+
+
+# Instância única, compartilhada entre as sessões e as reexecuções do Streamlit
+FILA = FilaTarefas()
@@ -1,6 +1,4 @@
 import os
-import pandas as pd
-import streamlit as st
 from configparser import ConfigParser
 from datetime import datetime
 
@@ -46,6 +44,12 @@ def carrega_ini():
     return pasta_csv, pasta_indicadores, pasta_sala_equipamento, pasta_sala_imagens, pasta_raiz
 
 
+def carrega_parametro(section, key, padrao):
+    config = ConfigParser()
+    config.read("parametros.ini")
+    return config.get(section, key, fallback=str(padrao)).strip()
+
+
 def verifica_csv(pasta_csv):
     arquivo = os.path.join(pasta_csv, "Header.csv")
     if not os.path.isfile(arquivo):
@@ -66,6 +70,8 @@ def arruma_path(dirname):
 
 
 def cria_arquivos_resultados_analises(pasta_csv, pasta_sala_equipamento):
+    import pandas as pd  # Evita carregar o pandas na inicialização do app
+
     df = pd.read_csv(os.path.join(pasta_csv, "Header.csv"), sep=";")
     for i in df["id"]:
         arquivo_csv = os.path.join(pasta_sala_equipamento, f"{i}.csv")
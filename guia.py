@@ -113,9 +113,9 @@ def app():
             **Objetivo:** Avaliar a qualidade das imagens obtidas.
 
             1) No menu lateral, selecione a opção "Qualidade da Imagem".
-            2) Clique em "Browse files" para acessar os arquivos.
+            2) Clique em "Browse files" para acessar os arquivos ou, se o tomógrafo envia as imagens ao receptor DICOM, escolha a série recebida.
             3) Baixe as imagens adquiridas e escolha a imagem central das regiões analisadas.
-            4) Avalie os parâmetros de Uniformidade, Ruído e Resolução Espacial.
+            4) Avalie os parâmetros de Uniformidade, Ruído e Resolução Espacial (seção "Resolução espacial (MTF)").
             5) O sistema indicará, na parte inferior da tela, se a qualidade da imagem foi aprovada ou reprovada.
             6) Baixe o relatório do teste em PDF.
 
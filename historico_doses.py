@@ -0,0 +1,374 @@
+import datetime
+import hashlib
+import os
+import threading
+from collections.abc import Sequence
+from io import BytesIO
+
+import pandas as pd
+
+from banco import conecta
+
+# ---------------- Histórico de doses ----------------
+#
+# Uma linha por imagem registrada, gravada em um banco SQLite na pasta de CSVs.
+# O banco só recebe inserções; a planilha Excel é gerada apenas na exportação.
+
+NOME_BANCO = "historico_doses.sqlite"
+
+# (coluna no banco, tipo SQLite, rótulo exibido/exportado)
+COLUNAS = [
+    ("sop_instance_uid", "TEXT", "SOPInstanceUID"),
+    ("study_instance_uid", "TEXT", "StudyInstanceUID"),
+    ("series_instance_uid", "TEXT", "SeriesInstanceUID"),
+    ("arquivo", "TEXT", "Arquivo"),
+    ("registrado_em", "TEXT", "Registrado em"),
+    ("paciente", "TEXT", "Paciente"),
+    ("id_paciente", "TEXT", "ID do Paciente"),
+    ("modalidade", "TEXT", "Modalidade"),
+    ("data_estudo", "TEXT", "Data do Estudo"),
+    ("descricao_serie", "TEXT", "Descrição da Série"),
+    ("kvp", "REAL", "kVp"),
+    ("mas", "REAL", "mAs"),
+    ("fabricante", "TEXT", "Fabricante"),
+    ("modelo", "TEXT", "Modelo do Equipamento"),
+    ("estacao", "TEXT", "Estação"),
+    ("tempo_exposicao", "REAL", "Tempo de Exposição"),
+    ("ctdivol", "REAL", "CTDIvol"),
+    ("dlp", "REAL", "DLP"),
+]
+ROTULOS = {coluna: rotulo for coluna, _, rotulo in COLUNAS}
+
+# Colunas que identificam o equipamento nas consultas de tendência
+EQUIPAMENTO = ["fabricante", "modelo", "estacao"]
+
+# Tabelas de resumo para as consultas de tendência (equipamento vazio em vez de
+# NULL, para valer nas chaves):
+#   estudos:          uma linha por estudo, com o CTDIvol médio das imagens
+#   meses_pendentes:  (equipamento, mês) que receberam estudos desde o último cálculo
+#   medianas_mensais: mediana mensal do CTDIvol por equipamento
+# Estudos sem data ficam em `estudos`, mas fora das medianas mensais. O gatilho é
+# recriado a cada abertura, para que bancos antigos recebam a versão atual.
+_ESQUEMA_TENDENCIAS = """
+CREATE TABLE IF NOT EXISTS estudos (
+    chave TEXT PRIMARY KEY,
+    fabricante TEXT NOT NULL, modelo TEXT NOT NULL, estacao TEXT NOT NULL,
+    data_estudo TEXT, mes TEXT, descricao_serie TEXT,
+    soma_ctdivol REAL NOT NULL, imagens INTEGER NOT NULL, ctdivol REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS estudos_equipamento_mes ON estudos (fabricante, modelo, estacao, mes, ctdivol);
+CREATE INDEX IF NOT EXISTS estudos_ctdivol ON estudos (ctdivol);
+
+CREATE TABLE IF NOT EXISTS meses_pendentes (
+    fabricante TEXT, modelo TEXT, estacao TEXT, mes TEXT,
+    PRIMARY KEY (fabricante, modelo, estacao, mes)
+);
+
+CREATE TABLE IF NOT EXISTS medianas_mensais (
+    fabricante TEXT, modelo TEXT, estacao TEXT, mes TEXT,
+    mediana_ctdivol REAL, estudos INTEGER,
+    PRIMARY KEY (fabricante, modelo, estacao, mes)
+);
+
+DROP TRIGGER IF EXISTS doses_resumo;
+CREATE TRIGGER doses_resumo AFTER INSERT ON doses WHEN NEW.ctdivol IS NOT NULL
+BEGIN
+    INSERT INTO estudos VALUES (
+        COALESCE(NEW.study_instance_uid, NEW.sop_instance_uid, 'id:' || NEW.id),
+        COALESCE(NEW.fabricante, ''), COALESCE(NEW.modelo, ''), COALESCE(NEW.estacao, ''),
+        NEW.data_estudo, substr(NEW.data_estudo, 1, 7), NEW.descricao_serie,
+        NEW.ctdivol, 1, NEW.ctdivol
+    )
+    ON CONFLICT (chave) DO UPDATE SET
+        soma_ctdivol = soma_ctdivol + excluded.soma_ctdivol,
+        imagens = imagens + 1,
+        ctdivol = (soma_ctdivol + excluded.soma_ctdivol) / (imagens + 1);
+    INSERT OR IGNORE INTO meses_pendentes SELECT
+        COALESCE(NEW.fabricante, ''), COALESCE(NEW.modelo, ''), COALESCE(NEW.estacao, ''),
+        substr(NEW.data_estudo, 1, 7)
+    WHERE NEW.data_estudo IS NOT NULL;
+END;
+DELETE FROM meses_pendentes WHERE mes IS NULL;
+"""
+
+_PREENCHE_ESTUDOS = """
+INSERT INTO estudos
+SELECT COALESCE(study_instance_uid, sop_instance_uid, 'id:' || id),
+       COALESCE(fabricante, ''), COALESCE(modelo, ''), COALESCE(estacao, ''),
+       data_estudo, substr(data_estudo, 1, 7), descricao_serie,
+       SUM(ctdivol), COUNT(*), AVG(ctdivol)
+FROM doses WHERE ctdivol IS NOT NULL
+GROUP BY COALESCE(study_instance_uid, sop_instance_uid, 'id:' || id);
+INSERT OR IGNORE INTO meses_pendentes
+SELECT DISTINCT fabricante, modelo, estacao, mes FROM estudos WHERE mes IS NOT NULL;
+"""
+
+# DLP não é um atributo das imagens de TC: vem do relatório estruturado de dose
+# (RDSR, PS3.16 TID 10011), pelos códigos DCM do DLP total e do DLP de cada aquisição
+CODIGO_DLP_TOTAL = "113813"   # CT Dose Length Product Total
+CODIGO_DLP = "113838"         # DLP (de cada evento de irradiação)
+
+# Valores das planilhas antigas (um cabeçalho por coluna, "Campo DICOM" nas linhas)
+# que indicam um campo ausente
+_AUSENTES_PLANILHA = {"", "N/A", "Data inválida", "None", "nan", "NaT"}
+
+# ---------------- Funções ----------------
+
+def _texto(valor):
+    return None if valor is None or valor == "" else str(valor)
+
+def _numero(valor):
+    """Valor numérico do cabeçalho (DS/IS/US); None se ausente ou inválido."""
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, Sequence) and not isinstance(valor, str):
+        valor = valor[0] if len(valor) else None  # MultiValue: usa o primeiro valor
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+def dlp_relatorio(ds):
+    """DLP (mGy·cm) de um relatório estruturado de dose; None se o arquivo não é um RDSR com DLP.
+
+    Usa o DLP total acumulado do relatório; sem ele, a soma dos DLPs das aquisições.
+    """
+    total, eventos = None, []
+    pendentes = list(getattr(ds, "ContentSequence", []))
+    while pendentes:
+        item = pendentes.pop()
+        pendentes.extend(getattr(item, "ContentSequence", []))
+        conceito = getattr(item, "ConceptNameCodeSequence", None)
+        medida = getattr(item, "MeasuredValueSequence", None)
+        if not conceito or not medida:
+            continue
+        valor = _numero(getattr(medida[0], "NumericValue", None))
+        codigo = str(getattr(conceito[0], "CodeValue", ""))
+        if codigo == CODIGO_DLP_TOTAL:
+            total = valor
+        elif codigo == CODIGO_DLP and valor is not None:
+            eventos.append(valor)
+    if total is not None:
+        return total
+    return sum(eventos) if eventos else None
+
+def data_iso(study_date):
+    """Converte a StudyDate (YYYYMMDD) para YYYY-MM-DD; None se ausente ou inválida."""
+    try:
+        return datetime.datetime.strptime(str(study_date), "%Y%m%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+def _data_planilha(valor):
+    """Data de uma célula de planilha (data do Excel, DD/MM/YYYY ou ISO) em YYYY-MM-DD; None se inválida."""
+    if isinstance(valor, (datetime.date, pd.Timestamp)):
+        return valor.strftime("%Y-%m-%d")
+    for formato in ("%d/%m/%Y", "%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(str(valor).strip()[:10], formato).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+def registros_planilha(arquivo):
+    """Registros de dose de uma planilha Excel; retorna (registros, rejeitados).
+
+    Aceita a planilha das versões anteriores da página ("Campo DICOM" na primeira
+    coluna e uma coluna por imagem) e a exportação do histórico (uma linha por
+    imagem, com os rótulos de `COLUNAS`). Linhas sem nenhum campo reconhecido são
+    rejeitadas. Sem SOPInstanceUID, o registro recebe um identificador derivado do
+    conteúdo, para que importar a mesma planilha de novo não duplique linhas.
+    """
+    df = pd.read_excel(arquivo, engine="openpyxl", dtype=object)
+    if "Campo DICOM" in df.columns:
+        df = df.set_index("Campo DICOM").T
+    colunas = {rotulo: coluna for coluna, _, rotulo in COLUNAS}
+    tipos = {coluna: tipo for coluna, tipo, _ in COLUNAS}
+
+    registros, rejeitados = [], 0
+    for linha in df.to_dict("records"):
+        registro = {}
+        for rotulo, valor in linha.items():
+            coluna = colunas.get(str(rotulo).strip())
+            if coluna is None or valor is None or str(valor).strip() in _AUSENTES_PLANILHA:
+                continue
+            if coluna == "data_estudo":
+                registro[coluna] = _data_planilha(valor)
+            elif tipos[coluna] == "REAL":
+                registro[coluna] = _numero(valor)
+            else:
+                registro[coluna] = _texto(valor)
+        registro = {coluna: valor for coluna, valor in registro.items() if valor is not None}
+        if not registro:
+            rejeitados += 1
+            continue
+        if "sop_instance_uid" not in registro:
+            conteudo = repr(sorted(registro.items())).encode()
+            registro["sop_instance_uid"] = "planilha:" + hashlib.blake2b(conteudo, digest_size=10).hexdigest()
+        registros.append(registro)
+    return registros, rejeitados
+
+def nome_equipamento(df):
+    """Nome legível do equipamento: fabricante, modelo e estação (quando houver)."""
+    nome = (df["fabricante"] + " " + df["modelo"]).str.strip()
+    estacao = df["estacao"]
+    return (nome + estacao.where(estacao == "", " / " + estacao)).replace("", "N/A")
+
+def registro_dose(ds, arquivo=None):
+    """Registro tipado (números como float, data em ISO) de um cabeçalho DICOM."""
+    def get(tag):
+        return getattr(ds, tag, None)
+
+    return {
+        "sop_instance_uid": _texto(get("SOPInstanceUID")),
+        "study_instance_uid": _texto(get("StudyInstanceUID")),
+        "series_instance_uid": _texto(get("SeriesInstanceUID")),
+        "arquivo": arquivo,
+        "paciente": _texto(get("PatientName")),
+        "id_paciente": _texto(get("PatientID")),
+        "modalidade": _texto(get("Modality")),
+        "data_estudo": data_iso(get("StudyDate")),
+        "descricao_serie": _texto(get("SeriesDescription")),
+        "kvp": _numero(get("KVP")),
+        "mas": _numero(get("Exposure")),
+        "fabricante": _texto(get("Manufacturer")),
+        "modelo": _texto(get("ManufacturerModelName")),
+        "estacao": _texto(get("StationName")),
+        "tempo_exposicao": _numero(get("ExposureTime")),
+        "ctdivol": _numero(get("CTDIvol")),
+        "dlp": dlp_relatorio(ds),
+    }
+
+
+class HistoricoDoses:
+    """Histórico de doses em SQLite: inserção de custo constante e exportação sob demanda.
+
+    Imagens já registradas (mesmo SOPInstanceUID) são ignoradas, de modo que
+    registrar de novo a mesma série não duplica linhas.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._trava = threading.Lock()
+        with self._conecta() as conexao:
+            colunas = ", ".join(f"{coluna} {tipo}" for coluna, tipo, _ in COLUNAS)
+            conexao.execute(f"CREATE TABLE IF NOT EXISTS doses (id INTEGER PRIMARY KEY, {colunas})")
+            conexao.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS doses_sop ON doses (sop_instance_uid) "
+                "WHERE sop_instance_uid IS NOT NULL"
+            )
+            # Resumos para as consultas de tendência, mantidos a cada inserção
+            conexao.executescript(_ESQUEMA_TENDENCIAS)
+            if conexao.execute("SELECT NOT EXISTS (SELECT 1 FROM estudos)").fetchone()[0]:
+                conexao.executescript(_PREENCHE_ESTUDOS)  # Banco criado antes dos resumos
+
+    def _conecta(self):
+        return conecta(self.caminho)
+
+    def registrar(self, registros):
+        """Acrescenta os registros ao histórico; retorna quantos eram novos.
+
+        `registrado_em` é o instante da inserção, salvo se o registro já o traz
+        (importado de uma exportação do histórico).
+        """
+        colunas = [coluna for coluna, _, _ in COLUNAS]
+        sql = (f"INSERT OR IGNORE INTO doses ({', '.join(colunas)}) "
+               f"VALUES ({', '.join('?' * len(colunas))})")
+        with self._trava, self._conecta() as conexao:
+            agora = datetime.datetime.now().isoformat(timespec="seconds")
+            linhas = [[registro.get(c) for c in colunas] for registro in registros]
+            indice = colunas.index("registrado_em")
+            for linha in linhas:
+                linha[indice] = linha[indice] or agora
+            # rowcount não inclui as linhas alteradas pelo gatilho dos resumos
+            cursor = conexao.executemany(sql, linhas)
+            return max(cursor.rowcount, 0)
+
+    def importa_excel(self, arquivo):
+        """Importa uma planilha (formato antigo ou exportação do histórico); retorna (novos, rejeitados)."""
+        registros, rejeitados = registros_planilha(arquivo)
+        return self.registrar(registros), rejeitados
+
+    def total(self):
+        with self._conecta() as conexao:
+            return conexao.execute("SELECT COUNT(*) FROM doses").fetchone()[0]
+
+    def tabela(self):
+        """Histórico completo com os rótulos de exibição e a data do estudo como data."""
+        colunas = ", ".join(coluna for coluna, _, _ in COLUNAS)
+        with self._conecta() as conexao:
+            df = pd.read_sql_query(f"SELECT {colunas} FROM doses ORDER BY data_estudo, id", conexao)
+        df["data_estudo"] = pd.to_datetime(df["data_estudo"], errors="coerce")
+        reais = [coluna for coluna, tipo, _ in COLUNAS if tipo == "REAL"]
+        df[reais] = df[reais].astype(float)
+        return df.rename(columns=ROTULOS)
+
+    def _atualiza_medianas(self, conexao):
+        """Recalcula as medianas mensais apenas dos meses que receberam estudos."""
+        conexao.execute("""
+            INSERT OR REPLACE INTO medianas_mensais
+            WITH ordenados AS (
+                SELECT e.fabricante, e.modelo, e.estacao, e.mes, e.ctdivol,
+                       ROW_NUMBER() OVER (PARTITION BY e.fabricante, e.modelo, e.estacao, e.mes
+                                          ORDER BY e.ctdivol) AS ordem,
+                       COUNT(*) OVER (PARTITION BY e.fabricante, e.modelo, e.estacao, e.mes) AS n
+                FROM meses_pendentes p
+                JOIN estudos e USING (fabricante, modelo, estacao, mes)
+            )
+            SELECT fabricante, modelo, estacao, mes, AVG(ctdivol), MAX(n)
+            FROM ordenados
+            WHERE ordem IN ((n + 1) / 2, (n + 2) / 2)
+            GROUP BY fabricante, modelo, estacao, mes
+        """)
+        conexao.execute("DELETE FROM meses_pendentes")
+
+    def mediana_mensal_ctdivol(self, desde=None):
+        """Mediana mensal do CTDIvol por equipamento, sobre o CTDIvol médio de cada estudo.
+
+        `desde` (YYYY-MM-DD) limita o período consultado.
+        """
+        with self._trava, self._conecta() as conexao:
+            self._atualiza_medianas(conexao)
+            df = pd.read_sql_query(
+                "SELECT * FROM medianas_mensais WHERE mes >= ? ORDER BY fabricante, modelo, estacao, mes",
+                conexao, params=[(desde or "")[:7]]
+            )
+        df.insert(0, "equipamento", nome_equipamento(df))
+        return df.drop(columns=EQUIPAMENTO)
+
+    def acima_do_nivel(self, nivel_referencia, desde=None, limite=500):
+        """Estudos com CTDIvol médio acima do nível de referência, do maior para o menor."""
+        with self._conecta() as conexao:
+            df = pd.read_sql_query(
+                "SELECT fabricante, modelo, estacao, data_estudo, chave AS study_instance_uid, "
+                "descricao_serie, ctdivol, imagens FROM estudos "
+                "WHERE ctdivol > ? AND data_estudo >= ? ORDER BY ctdivol DESC LIMIT ?",
+                conexao, params=[nivel_referencia, desde or "", limite]
+            )
+        df.insert(0, "equipamento", nome_equipamento(df))
+        df["razao_nivel"] = df["ctdivol"] / nivel_referencia
+        df["data_estudo"] = pd.to_datetime(df["data_estudo"], errors="coerce")
+        return df.drop(columns=EQUIPAMENTO)
+
+    def exporta_excel(self):
+        """Planilha Excel (bytes) com todo o histórico."""
+        buffer_excel = BytesIO()
+        with pd.ExcelWriter(buffer_excel, engine="openpyxl") as writer:
+            self.tabela().to_excel(writer, index=False, sheet_name="Historico_Doses")
+        return buffer_excel.getvalue()
+
+
+# Uma instância por arquivo, compartilhada entre as sessões
+_HISTORICOS = {}
+_TRAVA_HISTORICOS = threading.Lock()
+
+
+def abre_historico(pasta_csv):
+    """Retorna o histórico de doses guardado na pasta de CSVs, criando o banco se necessário."""
+    caminho = os.path.join(pasta_csv, NOME_BANCO)
+    with _TRAVA_HISTORICOS:
+        historico = _HISTORICOS.get(caminho)
+        if historico is None:
+            os.makedirs(pasta_csv, exist_ok=True)
+            historico = _HISTORICOS[caminho] = HistoricoDoses(caminho)
+    return historico
@@ -1,12 +1,6 @@
-import pandas as pd
-from scipy.stats import skew, kurtosis
 import streamlit as st
-import time
 from globais import *
 
-# Layout
-st.set_page_config(layout="wide")
-
 def form_callback():
     pass    
 
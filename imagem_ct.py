@@ -0,0 +1,114 @@
+import numpy as np
+
+# Modelo das imagens de TC na memória: os valores armazenados no DICOM ficam no
+# tipo inteiro original (em geral 16 bits) junto com a reta de conversão para HU,
+# aplicada só onde é necessária. Estatísticas lineares (média, desvio, máximo,
+# limiares) são calculadas sobre os valores armazenados e convertidas depois.
+
+# ---------------- Imagem em valores armazenados ----------------
+
+class ImagemCT:
+    """Corte (h, w) ou volume (n, h, w) de TC: valores armazenados e a reta HU = inclinação × valor + intercepto.
+
+    `np.asarray(img)` devolve a imagem em HU (float32, como o antigo `decodifica_hu`);
+    indexar (`img[i]`, `img[y0:y1, x0:x1]`) devolve outra `ImagemCT` que compartilha
+    os valores armazenados, sem cópia.
+    """
+
+    def __init__(self, bruta, inclinacao=1.0, intercepto=0.0):
+        inclinacao, intercepto = float(inclinacao), float(intercepto)
+        if inclinacao <= 0:
+            # Reta decrescente (não ocorre em TC): a imagem é guardada já em HU
+            bruta = _aplica_reta(bruta, inclinacao, intercepto)
+            inclinacao, intercepto = 1.0, 0.0
+        self.bruta = bruta
+        self.inclinacao = inclinacao
+        self.intercepto = intercepto
+
+    # --- Conversão para HU ---
+    def hu(self):
+        """Imagem em HU (float32), calculada a cada chamada."""
+        return _aplica_reta(self.bruta, self.inclinacao, self.intercepto)
+
+    def __array__(self, dtype=None, copy=None):
+        hu = self.hu()
+        return hu if dtype is None else hu.astype(dtype, copy=False)
+
+    def para_hu(self, valor):
+        return self.inclinacao * valor + self.intercepto
+
+    def para_bruto(self, hu):
+        return (hu - self.intercepto) / self.inclinacao
+
+    # --- Interface de matriz ---
+    @property
+    def shape(self):
+        return self.bruta.shape
+
+    @property
+    def ndim(self):
+        return self.bruta.ndim
+
+    @property
+    def nbytes(self):
+        return self.bruta.nbytes
+
+    def __len__(self):
+        return len(self.bruta)
+
+    def __getitem__(self, indice):
+        return ImagemCT(self.bruta[indice], self.inclinacao, self.intercepto)
+
+    def max(self, axis=None):
+        """Máximo em HU; com `axis`, a projeção de intensidade máxima (como `ImagemCT`)."""
+        maximo = self.bruta.max(axis=axis)
+        if axis is None:
+            return self.para_hu(float(maximo))
+        return ImagemCT(maximo, self.inclinacao, self.intercepto)
+
+    def setflags(self, write):
+        self.bruta.setflags(write=write)
+
+    def reta(self):
+        return (self.inclinacao, self.intercepto)
+
+
+# ---------------- Funções ----------------
+
+def _aplica_reta(bruta, inclinacao, intercepto):
+    # Uma única matriz temporária; mesmas operações (e arredondamentos) em float32 de sempre
+    hu = bruta.astype(np.float32)
+    if inclinacao != 1:
+        hu *= np.float32(inclinacao)
+    if intercepto != 0:
+        hu += np.float32(intercepto)
+    return hu
+
+
+def como_ct(img):
+    """`ImagemCT` para uma imagem em valores armazenados ou uma matriz já em HU."""
+    if isinstance(img, ImagemCT):
+        return img
+    return ImagemCT(np.asarray(img))
+
+
+def imagem_do_dataset(ds):
+    """Pixels de um dataset DICOM no tipo armazenado, com a reta de conversão do cabeçalho."""
+    bruta = ds.pixel_array
+    if "RescaleSlope" in ds and "RescaleIntercept" in ds:
+        return ImagemCT(bruta, ds.RescaleSlope, ds.RescaleIntercept)
+    return ImagemCT(bruta)
+
+
+def empilha(imagens):
+    """Volume (n, h, w) a partir dos cortes.
+
+    Com a mesma reta e o mesmo tipo em todos os cortes (o caso comum numa série),
+    o volume continua em valores armazenados; caso contrário, é convertido para HU.
+    """
+    cortes = [como_ct(img) for img in imagens]
+    retas = {img.reta() for img in cortes}
+    tipos = {img.bruta.dtype for img in cortes}
+    if len(retas) == 1 and len(tipos) == 1:
+        return ImagemCT(np.stack([img.bruta for img in cortes]), *retas.pop())
+    return ImagemCT(np.stack([img.hu() for img in cortes]))
@@ -0,0 +1,235 @@
+import io
+import mmap
+import os
+import posixpath
+import struct
+import threading
+import zipfile
+from collections import OrderedDict
+
+import pydicom as dicom
+
+# Leitura de séries exportadas do PACS como ZIP ou DICOMDIR, sem extrair os
+# arquivos: cada entrada vira um objeto de arquivo com `.name`, aceito pelos
+# mesmos caminhos que os arquivos enviados pelo st.file_uploader.
+
+# Cabeçalho local de uma entrada do ZIP: assinatura, versão, flags, método,
+# hora, data, CRC, tamanhos, comprimento do nome e do campo extra
+_CABECALHO_LOCAL = struct.Struct("<4s5H3L2H")
+
+# ZIPs locais ficam abertos (ZipFile e mmap) enquanto não mudam no disco: reabrir
+# a cada reexecução da página acumularia handles e mapeamentos
+ZIPS_ABERTOS = 4
+
+_ZIPS = OrderedDict()  # (caminho absoluto, versão) -> (ZipFile, mmap, memoryview)
+_TRAVA_ZIPS = threading.Lock()
+
+# ---------------- Funções ----------------
+
+class EntradaZip(io.RawIOBase):
+    """Entrada de um ZIP lida sob demanda.
+
+    Entradas sem compressão (o caso comum em exportações de DICOM) são servidas
+    como fatias `memoryview` do arquivo ZIP, sem cópia; as comprimidas são
+    descomprimidas em fluxo, só quando lidas.
+    """
+
+    def __init__(self, arquivo_zip, info, buffer_zip=None, prefixo="", versao=None):
+        super().__init__()
+        self._zip = arquivo_zip
+        self._info = info
+        self._buffer = None
+        if buffer_zip is not None and info.compress_type == zipfile.ZIP_STORED:
+            inicio = info.header_offset + _CABECALHO_LOCAL.size
+            campos = _CABECALHO_LOCAL.unpack_from(buffer_zip, info.header_offset)
+            inicio += campos[-2] + campos[-1]
+            self._buffer = buffer_zip[inicio:inicio + info.file_size]
+        self._fluxo = None
+        self._posicao = 0
+        self.name = info.filename
+        self.file_id = f"{prefixo}/{info.filename}"  # Identifica a entrada na chave da série
+        self.versao = versao  # Versão do ZIP local (`versao_arquivo`); None se enviado
+        self.size = info.file_size
+
+    # --- Conteúdo completo (usado pelo cache e pela decodificação) ---
+    def getbuffer(self):
+        if self._buffer is not None:
+            return self._buffer
+        return memoryview(self._zip.read(self._info))
+
+    def getvalue(self):
+        if self._buffer is not None:
+            return self._buffer.tobytes()
+        return self._zip.read(self._info)
+
+    # --- Leitura sequencial (usada pelo pydicom) ---
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._posicao if self._buffer is not None else self._abre().tell()
+
+    def seek(self, posicao, referencia=io.SEEK_SET):
+        if self._buffer is None:
+            return self._abre().seek(posicao, referencia)
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._posicao, io.SEEK_END: len(self._buffer)}[referencia]
+        self._posicao = max(0, base + posicao)
+        return self._posicao
+
+    def read(self, tamanho=-1):
+        if self._buffer is None:
+            return self._abre().read(tamanho)
+        fim = len(self._buffer) if tamanho is None or tamanho < 0 else self._posicao + tamanho
+        dados = self._buffer[self._posicao:fim].tobytes()
+        self._posicao += len(dados)
+        return dados
+
+    def readinto(self, destino):
+        dados = self.read(len(destino))
+        destino[:len(dados)] = dados
+        return len(dados)
+
+    def _abre(self):
+        if self._fluxo is None:
+            self._fluxo = self._zip.open(self._info)
+        return self._fluxo
+
+    def close(self):
+        if self._fluxo is not None:
+            self._fluxo.close()
+            self._fluxo = None
+        super().close()
+
+
+def _referencias_dicomdir(ds):
+    """Caminhos (com "/") dos arquivos de imagem referenciados por um DICOMDIR, na ordem do diretório."""
+    caminhos = []
+    for registro in getattr(ds, "DirectoryRecordSequence", []):
+        referencia = getattr(registro, "ReferencedFileID", None)
+        if referencia is None or getattr(registro, "DirectoryRecordType", "") != "IMAGE":
+            continue
+        partes = [referencia] if isinstance(referencia, str) else list(referencia)
+        caminhos.append("/".join(str(parte) for parte in partes))
+    return caminhos
+
+
+def _eh_dicomdir(nome):
+    return posixpath.basename(nome).upper() == "DICOMDIR"
+
+
+def versao_arquivo(caminho):
+    """(mtime em ns, tamanho) do arquivo: muda quando ele é reescrito."""
+    info = os.stat(caminho)
+    return info.st_mtime_ns, info.st_size
+
+
+def _fecha_zip(aberto):
+    arquivo_zip, mapa, buffer_zip = aberto
+    arquivo_zip.close()
+    try:
+        buffer_zip.release()
+        mapa.close()
+    except BufferError:
+        pass  # Entradas ainda em uso: o mapeamento é liberado quando forem descartadas
+
+
+def _zip_local(caminho):
+    """(ZipFile, mmap, memoryview, versão) do ZIP local, reaproveitados enquanto o arquivo não muda."""
+    versao = versao_arquivo(caminho)
+    chave = (os.path.abspath(caminho), versao)
+    with _TRAVA_ZIPS:
+        aberto = _ZIPS.get(chave)
+        if aberto is None:
+            with open(caminho, "rb") as f:
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                aberto = (zipfile.ZipFile(caminho), mapa, memoryview(mapa))
+            except BaseException:
+                mapa.close()
+                raise
+            _ZIPS[chave] = aberto
+            # Versões anteriores do mesmo arquivo e os ZIPs usados há mais tempo são fechados
+            for antiga in [c for c in _ZIPS if c[0] == chave[0] and c != chave]:
+                _fecha_zip(_ZIPS.pop(antiga))
+            while len(_ZIPS) > ZIPS_ABERTOS:
+                _fecha_zip(_ZIPS.popitem(last=False)[1])
+        _ZIPS.move_to_end(chave)
+        return (*aberto, versao)
+
+
+def abre_zip(arquivo, prefixo=None):
+    """Entradas de imagem de um ZIP (objeto de arquivo ou caminho), sem extrair nada para o disco.
+
+    Se o ZIP contém um DICOMDIR, apenas as imagens referenciadas por ele são
+    usadas; caso contrário, todas as entradas que não são diretórios.
+    """
+    if isinstance(arquivo, (str, os.PathLike)):
+        # Arquivo local: mapeado em memória, as entradas sem compressão não são copiadas
+        arquivo_zip, _, buffer_zip, versao = _zip_local(arquivo)
+        prefixo = prefixo or os.fspath(arquivo)
+    else:
+        buffer_zip = arquivo.getbuffer() if hasattr(arquivo, "getbuffer") else None
+        arquivo_zip = zipfile.ZipFile(arquivo)
+        versao = None
+        prefixo = prefixo or getattr(arquivo, "file_id", getattr(arquivo, "name", "zip"))
+
+    infos = [info for info in arquivo_zip.infolist() if not info.is_dir()]
+    dicomdirs = [info for info in infos if _eh_dicomdir(info.filename)]
+    if dicomdirs:
+        # Nomes do DICOMDIR seguem a ISO 9660 (maiúsculas): comparação sem diferenciar caixa
+        por_nome = {info.filename.upper(): info for info in infos}
+        selecionadas = []
+        for info_dicomdir in dicomdirs:
+            pasta = posixpath.dirname(info_dicomdir.filename)
+            ds = dicom.dcmread(EntradaZip(arquivo_zip, info_dicomdir, buffer_zip), force=True)
+            for caminho in _referencias_dicomdir(ds):
+                info = por_nome.get(posixpath.join(pasta, caminho).upper())
+                if info is not None:
+                    selecionadas.append(info)
+        infos = selecionadas
+    return [EntradaZip(arquivo_zip, info, buffer_zip, prefixo, versao) for info in infos]
+
+
+def arquivos_dicomdir(caminho):
+    """Caminhos das imagens referenciadas por um DICOMDIR no disco, na ordem do diretório."""
+    ds = dicom.dcmread(caminho, force=True)
+    pasta = os.path.dirname(caminho)
+    return [os.path.join(pasta, *referencia.split("/")) for referencia in _referencias_dicomdir(ds)]
+
+
+def eh_zip(arquivo):
+    if isinstance(arquivo, (str, os.PathLike)):
+        return zipfile.is_zipfile(arquivo)
+    if not getattr(arquivo, "name", "").lower().endswith(".zip"):
+        return False
+    posicao = arquivo.tell()
+    try:
+        return zipfile.is_zipfile(arquivo)
+    finally:
+        arquivo.seek(posicao)
+
+
+def expande_uploads(uploads):
+    """Substitui cada ZIP enviado pelas suas entradas de imagem; os demais arquivos passam inalterados."""
+    arquivos = []
+    for upload in uploads:
+        if eh_zip(upload):
+            arquivos.extend(abre_zip(upload))
+        else:
+            arquivos.append(upload)
+    return arquivos
+
+
+def abre_arquivos(caminhos):
+    """Arquivos locais como objetos em memória com `.name`, no mesmo formato dos enviados pelo st.file_uploader."""
+    arquivos = []
+    for caminho in caminhos:
+        with open(caminho, "rb") as f:
+            arquivo = io.BytesIO(f.read())
+        arquivo.name = os.path.basename(caminho)
+        arquivo.file_id = caminho
+        arquivos.append(arquivo)
+    return arquivos
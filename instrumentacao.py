@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Tempos das etapas das páginas, sempre ativos e de custo desprezível: cada
+# medição é guardada em memória (últimas AMOSTRAS por etapa) e as novas são
+# exportadas em JSON lines e/ou no formato texto do Prometheus.
+
+AMOSTRAS = 500
+PERCENTIS = (50, 90, 99)
+
+# Rotação do JSON lines por tamanho: o arquivo atual passa a .1, o .1 a .2 e
+# assim por diante; o mais antigo é descartado
+LIMITE_JSONL_BYTES = 50 * 1024**2
+ARQUIVOS_JSONL = 5
+
+_TEMPOS = {}           # etapa -> deque com as últimas durações (s)
+_PENDENTES = []        # medições ainda não gravadas no JSON lines
+_TOTAIS = {}           # etapa -> (soma das durações, número de medições) desde o início do processo
+_TRAVA = threading.Lock()
+_TRAVA_ARQUIVO = threading.Lock()  # Gravação dos arquivos exportados (reexecuções simultâneas)
+
+# ---------------- Funções ----------------
+
+def registra(etapa, segundos):
+    """Registra uma medição da etapa."""
+    with _TRAVA:
+        _TEMPOS.setdefault(etapa, deque(maxlen=AMOSTRAS)).append(segundos)
+        soma, contagem = _TOTAIS.get(etapa, (0.0, 0))
+        _TOTAIS[etapa] = (soma + segundos, contagem + 1)
+        if len(_PENDENTES) < 100 * AMOSTRAS:  # Sem exportação, não cresce indefinidamente
+            _PENDENTES.append({"instante": time.time(), "etapa": etapa, "segundos": segundos})
+
+@contextmanager
+def cronometro(etapa):
+    """Mede a duração do bloco `with` e a registra como uma medição da etapa."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registra(etapa, time.perf_counter() - inicio)
+
+def tabela_tempos():
+    """Uma linha por etapa: última medição, percentis (ms) e número de amostras."""
+    with _TRAVA:
+        tempos = {etapa: np.array(valores) * 1000 for etapa, valores in _TEMPOS.items()}
+    linhas = []
+    for etapa, ms in tempos.items():
+        linha = {"Etapa": etapa, "Última (ms)": ms[-1]}
+        linha.update({f"p{p} (ms)": v for p, v in zip(PERCENTIS, np.percentile(ms, PERCENTIS))})
+        linha["Amostras"] = len(ms)
+        linhas.append(linha)
+    return linhas
+
+def _rotaciona(caminho, arquivos):
+    # atual -> .1 -> .2 -> ... -> .(arquivos - 1); o último é sobrescrito (descartado)
+    nomes = [caminho] + [f"{caminho}.{indice}" for indice in range(1, arquivos)]
+    for origem, destino in reversed(list(zip(nomes[:-1], nomes[1:]))):
+        if os.path.exists(origem):
+            os.replace(origem, destino)
+    if arquivos <= 1 and os.path.exists(caminho):
+        os.remove(caminho)
+
+def exporta_jsonl(caminho, limite_bytes=LIMITE_JSONL_BYTES, arquivos=ARQUIVOS_JSONL):
+    """Acrescenta ao arquivo as medições feitas desde a última exportação (uma por linha).
+
+    Quando o arquivo passa de `limite_bytes`, ele é rotacionado: ficam no máximo
+    `arquivos` arquivos (o atual e os anteriores .1, .2, ...).
+    """
+    with _TRAVA:
+        pendentes = _PENDENTES[:]
+        _PENDENTES.clear()
+    if not pendentes:
+        return
+    with _TRAVA_ARQUIVO:
+        try:
+            cheio = os.path.getsize(caminho) >= limite_bytes
+        except OSError:
+            cheio = False
+        if cheio:
+            _rotaciona(caminho, arquivos)
+        with open(caminho, "a", encoding="utf-8") as arquivo:
+            arquivo.writelines(json.dumps(m, ensure_ascii=False) + "\n" for m in pendentes)
+
+def _rotulo(texto):
+    return texto.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def exporta_prometheus(caminho):
+    """Grava o resumo das etapas no formato texto do Prometheus (coletor textfile do node_exporter)."""
+    with _TRAVA:
+        tempos = {etapa: np.array(valores) for etapa, valores in _TEMPOS.items()}
+        totais = dict(_TOTAIS)
+
+    linhas = [
+        "# HELP semanaltc_etapa_segundos Duração das etapas das páginas do SEMANAL TC.",
+        "# TYPE semanaltc_etapa_segundos summary",
+    ]
+    for etapa, valores in tempos.items():
+        rotulo = _rotulo(etapa)
+        for p, v in zip(PERCENTIS, np.percentile(valores, PERCENTIS)):
+            linhas.append(f'semanaltc_etapa_segundos{{etapa="{rotulo}",quantile="{p / 100}"}} {v:.6f}')
+        soma, contagem = totais[etapa]
+        linhas.append(f'semanaltc_etapa_segundos_sum{{etapa="{rotulo}"}} {soma:.6f}')
+        linhas.append(f'semanaltc_etapa_segundos_count{{etapa="{rotulo}"}} {contagem}')
+
+    # Troca atômica: o coletor nunca lê um arquivo pela metade. O temporário é
+    # único e a troca fica sob a trava, pois várias sessões exportam ao mesmo tempo
+    with _TRAVA_ARQUIVO:
+        descritor, temporario = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(caminho) or ".")
+        try:
+            with os.fdopen(descritor, "w", encoding="utf-8") as arquivo:
+                arquivo.write("\n".join(linhas) + "\n")
+            os.replace(temporario, caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+def exporta_indicadores(pasta, formato="ambos", limite_jsonl_bytes=LIMITE_JSONL_BYTES):
+    """Exporta os tempos para a pasta de indicadores: "jsonl", "prometheus", "ambos" ou "nenhum"."""
+    if formato in ("jsonl", "ambos"):
+        exporta_jsonl(os.path.join(pasta, "tempos_etapas.jsonl"), limite_jsonl_bytes)
+    if formato in ("prometheus", "ambos"):
+        exporta_prometheus(os.path.join(pasta, "tempos_etapas.prom"))
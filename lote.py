@@ -0,0 +1,239 @@
+"""Análise em lote dos testes semanais de TC, sem a interface do Streamlit.
+
+Percorre uma árvore de diretórios, agrupa os arquivos DICOM por série e grava
+uma linha por série com a avaliação de exatidão, ruído e uniformidade segundo
+a IN 93/2021.
+
+Uso:
+    python lote.py PASTA [-o resultados.csv|resultados.parquet] [-w WORKERS]
+                   [--material Água|Ar] [--fator-raio 1.0] [--corte automatico|meio]
+                   [--pdf relatorio.pdf]
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pydicom as dicom
+
+from analise import avalia_imagem, resultado_em_linha
+from cache_imagens import decodifica_ct
+from corte_central import PRESENCA_MINIMA, pontua_cortes
+from decodificacao import numero_workers
+from globais import carrega_parametro
+from imagem_ct import empilha
+from mtf import calcula_mtf
+from nps import calcula_nps, espacamento_pixel
+from relatorio import gera_relatorio_pdf, renderiza_estudos
+from serie_dicom import posicao_corte
+
+# ---------------- Funções ----------------
+
+def agrupa_series(pasta):
+    """Percorre a árvore de diretórios e agrupa os arquivos DICOM por SeriesInstanceUID."""
+    series = {}
+    for raiz, _, arquivos in os.walk(pasta):
+        for nome in sorted(arquivos):
+            caminho = os.path.join(raiz, nome)
+            try:
+                ds = dicom.dcmread(caminho, force=True, stop_before_pixels=True)
+            except Exception:
+                continue  # Arquivo que não é DICOM
+            if "Rows" not in ds:
+                continue  # DICOM sem imagem (DICOMDIR, relatórios de dose, ...)
+            uid = str(getattr(ds, "SeriesInstanceUID", raiz))
+            series.setdefault(uid, []).append((posicao_corte(ds), caminho, ds))
+
+    # Cortes de cada série em ordem de posição
+    for cortes in series.values():
+        cortes.sort(key=lambda corte: corte[0])
+    return series
+
+
+def info_serie(uid, cortes):
+    """Identificação da série a partir do cabeçalho do primeiro corte."""
+    ds = cortes[0][2]
+
+    def get(tag):
+        return str(getattr(ds, tag, "N/A"))
+
+    return {
+        "Pasta": os.path.dirname(cortes[0][1]),
+        "SeriesInstanceUID": uid,
+        "Data do Estudo": get("StudyDate"),
+        "Fabricante": get("Manufacturer"),
+        "Modelo do Equipamento": get("ManufacturerModelName"),
+        "Estação": get("StationName"),
+        "Descrição da Série": get("SeriesDescription"),
+        "Nº de imagens": len(cortes),
+    }
+
+
+def analisa_serie(caminhos, material="Água", fator_raio=1.0, corte="automatico", relatorio=False):
+    """Analisa o corte central de uma série (executado em um processo worker).
+
+    Retorna (linha, estudo); com `relatorio`, `estudo` traz o resultado, o NPS, a MTF
+    e a imagem anotada já renderizada no worker, prontos para `gera_relatorio_pdf`.
+    """
+    if corte == "automatico" and len(caminhos) > 1:
+        volume = empilha([decodifica_ct(caminho) for caminho in caminhos])
+        pontuacao = pontua_cortes(volume, fator_raio)
+        indice = pontuacao["indice"]
+        img = volume[indice]
+    else:
+        volume, pontuacao = None, None
+        indice = len(caminhos) // 2
+        img = decodifica_ct(caminhos[indice])
+    caminho = caminhos[indice]
+    resultado = avalia_imagem(img, fator_raio, material)
+    linha = {"Imagem analisada": os.path.basename(caminho)}
+    linha.update(resultado_em_linha(resultado))
+
+    estudo = None
+    if relatorio:
+        ds = dicom.dcmread(caminho, force=True, stop_before_pixels=True)
+        if volume is None:
+            volume, cortes = img, None
+        else:
+            cortes = cortes_com_phantom(pontuacao)
+        nps = calcula_nps(volume, resultado["circulo"], cortes, espacamento_pixel(ds))
+        mtf = calcula_mtf(volume, resultado["circulo"], cortes, espacamento_pixel(ds))
+        estudo = renderiza_estudos([{"resultado": resultado, "img": img, "nps": nps, "mtf": mtf}])[0]
+    return linha, estudo
+
+
+def cortes_com_phantom(pontuacao):
+    """Cortes usados no NPS e na MTF da série: todos em que o phantom aparece inteiro (ou o corte central)."""
+    cortes = np.flatnonzero(pontuacao["presenca"] >= PRESENCA_MINIMA)
+    return cortes if len(cortes) else [pontuacao["indice"]]
+
+
+def analisa_conteudos(conteudos, material="Água", fator_raio=1.0, informa=None):
+    """Análise automática de uma série enviada pela interface (executada em um processo worker).
+
+    `conteudos` são os bytes dos arquivos, na ordem da série; `informa(etapa, fração)`
+    recebe o andamento. Retorna a pontuação dos cortes, o índice do corte central,
+    o resultado da análise desse corte, o NPS (`nps.calcula_nps`) e a MTF
+    (`mtf.calcula_mtf`) da série e o estudo pronto para `gera_relatorio_pdf`.
+    """
+    if informa is None:
+        def informa(etapa, fracao=0.0):
+            pass
+
+    imagens = []
+    for i, conteudo in enumerate(conteudos):
+        informa("Decodificação", 0.7 * i / len(conteudos))
+        imagens.append(decodifica_ct(BytesIO(conteudo)))
+
+    informa("Escolha do corte central", 0.7)
+    volume = empilha(imagens)
+    if len(imagens) > 1:
+        pontuacao = pontua_cortes(volume, fator_raio)
+        indice = pontuacao["indice"]
+    else:
+        pontuacao, indice = None, 0
+    img = imagens[indice]
+
+    informa("Estatísticas das ROIs", 0.8)
+    resultado = avalia_imagem(img, fator_raio, material)
+
+    informa("Espectro de potência do ruído", 0.83)
+    ds = dicom.dcmread(BytesIO(conteudos[indice]), force=True, stop_before_pixels=True)
+    cortes = cortes_com_phantom(pontuacao) if pontuacao is not None else [indice]
+    nps = calcula_nps(volume, resultado["circulo"], cortes, espacamento_pixel(ds))
+
+    informa("Resolução espacial", 0.86)
+    mtf = calcula_mtf(volume, resultado["circulo"], cortes, espacamento_pixel(ds))
+
+    informa("Relatório", 0.9)
+    estudo = renderiza_estudos([{"resultado": resultado, "img": img, "nps": nps, "mtf": mtf}])[0]
+    return {"indice": indice, "pontuacao": pontuacao, "resultado": resultado, "nps": nps, "mtf": mtf,
+            "estudo": estudo}
+
+
+def analisa_pasta(pasta, n_workers=0, material="Água", fator_raio=1.0, corte="automatico", progresso=None,
+                  estudos=None):
+    """Analisa todas as séries de uma pasta em processos paralelos; retorna um DataFrame.
+
+    Se `estudos` for uma lista, recebe um estudo por série analisada, na ordem do DataFrame.
+    """
+    series = agrupa_series(pasta)
+    linhas = []
+    por_uid = {}
+    with ProcessPoolExecutor(numero_workers(n_workers)) as pool:
+        futuros = {
+            pool.submit(analisa_serie, [c[1] for c in cortes], material, fator_raio, corte,
+                        estudos is not None): uid
+            for uid, cortes in series.items()
+        }
+        for feitos, futuro in enumerate(as_completed(futuros), start=1):
+            uid = futuros[futuro]
+            linha = info_serie(uid, series[uid])
+            try:
+                resultado, estudo = futuro.result()
+                linha.update(resultado)
+                if estudo is not None:
+                    estudo["titulo"] = f"{linha['Estação']} - {linha['Data do Estudo']}"
+                    por_uid[uid] = estudo
+            except Exception as e:
+                linha["Erro"] = str(e)
+            linhas.append(linha)
+            if progresso is not None:
+                progresso(feitos, len(futuros), linha)
+
+    df = pd.DataFrame(linhas)
+    if not df.empty:
+        df = df.sort_values(["Pasta", "Data do Estudo", "SeriesInstanceUID"], ignore_index=True)
+    if estudos is not None:
+        estudos.extend(por_uid[uid] for uid in df.get("SeriesInstanceUID", []) if uid in por_uid)
+    return df
+
+
+def salva_resultados(df, saida):
+    if saida.lower().endswith(".parquet"):
+        df.to_parquet(saida, index=False)
+    else:
+        df.to_csv(saida, sep=";", index=False, encoding="utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análise em lote dos testes semanais de TC (IN 93/2021).")
+    parser.add_argument("pasta", help="Diretório com as séries DICOM (percorrido recursivamente)")
+    parser.add_argument("-o", "--saida", default="resultados_teste_semanal.csv",
+                        help="Arquivo de saída .csv ou .parquet")
+    parser.add_argument("-w", "--workers", type=int,
+                        default=int(carrega_parametro("decodificacao", "workers", 0)),
+                        help="Número de processos (0 = todos os núcleos)")
+    parser.add_argument("--material", choices=["Água", "Ar"], default="Água")
+    parser.add_argument("--fator-raio", type=float, default=1.0,
+                        help="Ajuste do raio externo do phantom (0.5 a 1.5)")
+    parser.add_argument("--corte", choices=["automatico", "meio"], default="automatico",
+                        help="Corte analisado: escolha automática do corte central ou o corte do meio da série")
+    parser.add_argument("--pdf", help="Grava também um relatório PDF com uma página por série")
+    args = parser.parse_args(argv)
+
+    def progresso(feitos, total, linha):
+        status = linha.get("Erro") or linha.get("Conforme IN 93/2021")
+        print(f"[{feitos}/{total}] {linha['Pasta']} ({linha['Descrição da Série']}): {status}")
+
+    estudos = [] if args.pdf else None
+    df = analisa_pasta(args.pasta, args.workers, args.material, args.fator_raio, args.corte, progresso, estudos)
+    if df.empty:
+        print(f"Nenhuma série DICOM encontrada em {args.pasta}", file=sys.stderr)
+        return 1
+
+    salva_resultados(df, args.saida)
+    print(f"{len(df)} séries gravadas em {args.saida}")
+
+    if args.pdf and estudos:
+        with open(args.pdf, "wb") as arquivo:
+            arquivo.write(gera_relatorio_pdf(estudos))
+        print(f"Relatório com {len(estudos)} páginas gravado em {args.pdf}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
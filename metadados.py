@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pydicom as dicom
+
+from decodificacao import numero_workers
+from historico_doses import COLUNAS, ROTULOS, registro_dose
+from ingestao import abre_zip, arquivos_dicomdir, eh_zip
+
+# Leitura somente dos cabeçalhos DICOM necessários para o acompanhamento de doses:
+# os pixels nunca são lidos e elementos grandes ficam adiados.
+
+TAGS_METADADOS = [
+    "SOPInstanceUID", "StudyInstanceUID", "SeriesInstanceUID",
+    "PatientName", "PatientID", "Modality", "StudyDate", "SeriesDescription",
+    "KVP", "Exposure", "ExposureTime", "CTDIvol",
+    "Manufacturer", "ManufacturerModelName", "StationName",
+    "ContentSequence",  # Relatórios estruturados de dose (RDSR): DLP
+]
+
+# Valores por estudo: médias das grandezas numéricas, primeiro valor dos textos
+_REAIS = [coluna for coluna, tipo, _ in COLUNAS if tipo == "REAL"]
+
+# ---------------- Funções ----------------
+
+def le_cabecalho(arquivo):
+    """Lê apenas as tags de `TAGS_METADADOS` de um arquivo (caminho ou objeto de arquivo)."""
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)
+    return dicom.dcmread(arquivo, force=True, stop_before_pixels=True,
+                         specific_tags=TAGS_METADADOS, defer_size="1 KB")
+
+def _registro(arquivo):
+    nome = arquivo if isinstance(arquivo, str) else arquivo.name
+    ds = le_cabecalho(arquivo)
+    if "SOPInstanceUID" not in ds and "Modality" not in ds:
+        raise ValueError("arquivo sem cabeçalho DICOM")
+    return registro_dose(ds, nome)
+
+def le_registros(arquivos, n_workers=0, informa=None):
+    """Registros de dose (um por arquivo) lidos em paralelo; retorna (registros, erros).
+
+    A leitura dos cabeçalhos é dominada por E/S, por isso usa threads. Se dado,
+    `informa(etapa, fração)` recebe o andamento (fila de tarefas).
+    """
+    registros, erros = [], []
+    with ThreadPoolExecutor(numero_workers(n_workers), thread_name_prefix="metadados") as pool:
+        for feitos, (arquivo, futuro) in enumerate(zip(arquivos, [pool.submit(_registro, a) for a in arquivos])):
+            if informa is not None:
+                informa("Leitura dos cabeçalhos", feitos / len(arquivos))
+            try:
+                registros.append(futuro.result())
+            except Exception as e:
+                erros.append((arquivo if isinstance(arquivo, str) else arquivo.name, e))
+    return registros, erros
+
+def arquivos_da_pasta(pasta):
+    """Arquivos de uma pasta, de um DICOMDIR ou de um ZIP.
+
+    Com um DICOMDIR na raiz, apenas as imagens referenciadas por ele; num ZIP,
+    as entradas são lidas sem extração. Caso contrário, todos os arquivos da
+    árvore de diretórios (os que não são DICOM são descartados pela leitura).
+    """
+    if os.path.isfile(pasta) and eh_zip(pasta):
+        return abre_zip(pasta)
+    dicomdir = os.path.join(pasta, "DICOMDIR")
+    if os.path.isfile(dicomdir):
+        return arquivos_dicomdir(dicomdir)
+    return [os.path.join(raiz, nome) for raiz, _, nomes in os.walk(pasta) for nome in sorted(nomes)]
+
+def tabela_estudos(registros):
+    """DataFrame com uma linha por estudo (StudyInstanceUID), a partir dos registros por imagem."""
+    df = pd.DataFrame(registros, columns=[coluna for coluna, _, _ in COLUNAS])
+    if df.empty:
+        return df.rename(columns=ROTULOS)
+
+    # Arquivos sem StudyInstanceUID formam um estudo cada
+    estudo = df["study_instance_uid"].fillna(df["arquivo"])
+    df[_REAIS] = df[_REAIS].astype(float)
+    agregacoes = {
+        coluna: ("mean" if coluna in _REAIS else "first")
+        for coluna in df.columns
+        if coluna not in ("sop_instance_uid", "series_instance_uid", "arquivo", "study_instance_uid", "registrado_em")
+    }
+    agregacoes["arquivo"] = "count"
+    estudos = df.groupby(estudo, sort=False).agg(agregacoes).rename(columns={"arquivo": "n_imagens"})
+    estudos = estudos.rename_axis("study_instance_uid").reset_index()
+    estudos["data_estudo"] = pd.to_datetime(estudos["data_estudo"], errors="coerce")
+    return estudos.rename(columns={**ROTULOS, "n_imagens": "Nº de imagens"})
@@ -0,0 +1,161 @@
+import numpy as np
+
+from analise import detectar_centro_phantom
+from imagem_ct import como_ct
+
+# Resolução espacial pela função de transferência de modulação (MTF) medida na
+# borda circular do objeto simulador. Os pixels em torno do perímetro inteiro
+# passam para coordenadas polares em relação ao centro do phantom e são
+# agrupados pela distância à borda em faixas de uma fração de pixel: a média de
+# cada faixa dá a função de espalhamento de borda (ESF) sobreamostrada. A
+# derivada da ESF é a função de espalhamento de linha (LSF), e o módulo da sua
+# FFT é a MTF. Todos os cortes de uma série são processados juntos, sem laço
+# em Python sobre os ângulos.
+
+# Faixas de distância por pixel na ESF
+SOBREAMOSTRAGEM_MTF = 10
+
+# Meia largura (em pixels) da faixa em torno da borda usada na ESF
+LARGURA_BORDA_MTF = 12
+
+# Margem (em pixels) além do raio detectado na busca do centro e do raio com precisão de subpixel
+MARGEM_CENTRO_MTF = 10
+
+# Cortes processados por vez (limita a memória em séries longas)
+BLOCO_CORTES_MTF = 32
+
+# Níveis da MTF informados no resultado
+NIVEIS_MTF = (0.5, 0.1)
+
+# Maior frequência informada (ciclos/pixel): a ESF sobreamostrada mede a MTF além
+# da frequência de Nyquist da imagem, onde bordas nítidas ainda estão acima de 10%
+FREQUENCIA_MAXIMA_MTF = 1.0
+
+# ---------------- Funções ----------------
+
+def _preenche_vazias(valores, validas):
+    """Interpolação linear, ao longo de cada linha, das faixas sem nenhum pixel."""
+    n, m = valores.shape
+    indices = np.broadcast_to(np.arange(m), (n, m))
+    anterior = np.maximum.accumulate(np.where(validas, indices, 0), axis=1)
+    proxima = np.minimum.accumulate(np.where(validas, indices, m - 1)[:, ::-1], axis=1)[:, ::-1]
+    linhas = np.arange(n)[:, None]
+    v_anterior, v_proxima = valores[linhas, anterior], valores[linhas, proxima]
+    peso = np.where(proxima > anterior, (indices - anterior) / np.maximum(proxima - anterior, 1), 0.0)
+    return np.where(validas, valores, v_anterior + peso * (v_proxima - v_anterior))
+
+
+def _cruzamentos(frequencias, mtf, nivel):
+    """Primeira frequência em que cada MTF (uma por linha) cai abaixo de `nivel`; NaN se não cai."""
+    abaixo = mtf < nivel
+    indice = np.argmax(abaixo, axis=1)
+    cruza = abaixo.any(axis=1) & (indice > 0)
+    i1 = np.maximum(indice, 1)
+    linhas = np.arange(len(mtf))
+    m0, m1 = mtf[linhas, i1 - 1], mtf[linhas, i1]
+    fracao = (m0 - nivel) / np.where(m0 > m1, m0 - m1, 1.0)
+    frequencia = frequencias[i1 - 1] + fracao * (frequencias[i1] - frequencias[i1 - 1])
+    return np.where(cruza, frequencia, np.nan)
+
+
+def calcula_mtf(volume, circulo=None, cortes=None, espacamento=None):
+    """MTF da borda do phantom em um corte (h, w) ou em cada corte de um volume (n, h, w).
+
+    `circulo` vem de `detectar_centro_phantom` (detectado na projeção de intensidade
+    máxima, se None); o centro e o raio são refinados em cada corte, com precisão
+    de subpixel, pelo centroide e pela área do phantom. Com `espacamento` (mm, de
+    `nps.espacamento_pixel`), as frequências saem em 1/mm; sem ele, em 1/pixel.
+
+    Retorna um dicionário com "frequencias", "mtf" (um corte por linha), "mtf50"
+    e "mtf10" por corte, "distancias" e "esf" (distância à borda em pixels), os
+    índices dos cortes e a unidade.
+    """
+    volume = como_ct(volume)
+    bruta = volume.bruta if volume.ndim == 3 else volume.bruta[None]
+    cortes = np.arange(len(bruta)) if cortes is None else np.asarray(cortes, dtype=np.int64)
+    if circulo is None:
+        circulo = detectar_centro_phantom(volume.max(axis=0) if volume.ndim == 3 else volume)
+    x_c, y_c, r_c = circulo
+    h, w = bruta.shape[1:]
+
+    # Janela quadrada em torno do phantom: centroide (phantom inteiro) e faixa da borda
+    x0, y0 = max(int(x_c - r_c - MARGEM_CENTRO_MTF), 0), max(int(y_c - r_c - MARGEM_CENTRO_MTF), 0)
+    x1, y1 = min(int(x_c + r_c + MARGEM_CENTRO_MTF) + 1, w), min(int(y_c + r_c + MARGEM_CENTRO_MTF) + 1, h)
+    Y, X = np.mgrid[y0:y1, x0:x1]
+    distancia = np.hypot(X - x_c, Y - y_c)
+    no_disco = distancia <= r_c + MARGEM_CENTRO_MTF
+    na_borda = np.abs(distancia - r_c) <= LARGURA_BORDA_MTF + MARGEM_CENTRO_MTF
+    x_disco, y_disco = X[no_disco].astype(np.float64), Y[no_disco].astype(np.float64)
+    x_borda, y_borda = X[na_borda].astype(np.float64), Y[na_borda].astype(np.float64)
+
+    n_faixas = 2 * LARGURA_BORDA_MTF * SOBREAMOSTRAGEM_MTF
+    esfs, validas = [], []
+    for inicio in range(0, len(cortes), BLOCO_CORTES_MTF):
+        janela = bruta[cortes[inicio:inicio + BLOCO_CORTES_MTF], y0:y1, x0:x1].astype(np.float32)
+        n = len(janela)
+        disco, borda = janela[:, no_disco], janela[:, na_borda]
+
+        # Níveis do ar e do phantom em cada corte; o phantom vira uma máscara contínua de 0 a 1
+        fundo, topo = np.percentile(borda, [5, 95], axis=1)
+        escala = np.where(topo > fundo, topo - fundo, 1.0)
+        peso = np.clip((disco - fundo[:, None]) / escala[:, None], 0, 1)
+
+        # Centro (centroide) e raio (área) com precisão de subpixel
+        area = peso.sum(axis=1)
+        cx = peso @ x_disco / np.maximum(area, 1e-12)
+        cy = peso @ y_disco / np.maximum(area, 1e-12)
+        raio = np.sqrt(area / np.pi)
+
+        # Distância de cada pixel da faixa à borda, em coordenadas polares do próprio corte
+        u = np.hypot(x_borda[None, :] - cx[:, None], y_borda[None, :] - cy[:, None]) - raio[:, None]
+        faixa = np.floor((u + LARGURA_BORDA_MTF) * SOBREAMOSTRAGEM_MTF).astype(np.int64)
+        dentro = (faixa >= 0) & (faixa < n_faixas)
+        # Uma única contagem para todos os cortes do bloco: cada corte ocupa n_faixas posições
+        posicao = (np.arange(n)[:, None] * n_faixas + faixa)[dentro]
+        soma = np.bincount(posicao, weights=borda[dentro].astype(np.float64), minlength=n * n_faixas)
+        contagem = np.bincount(posicao, minlength=n * n_faixas)
+        esf = (soma / np.maximum(contagem, 1)).reshape(n, n_faixas)
+        esfs.append(esf)
+        validas.append(contagem.reshape(n, n_faixas) > 0)
+
+    distancias = (np.arange(n_faixas) + 0.5) / SOBREAMOSTRAGEM_MTF - LARGURA_BORDA_MTF
+    if not esfs:
+        esf = np.empty((0, n_faixas))
+    else:
+        esf = _preenche_vazias(np.concatenate(esfs), np.concatenate(validas))
+    esf = volume.para_hu(esf)
+
+    # LSF: derivada da ESF (que cai do phantom para o ar), com janela de Hann contra o ruído longe da borda
+    lsf = -np.gradient(esf, axis=1) * np.hanning(n_faixas)
+    espectro = np.abs(np.fft.rfft(lsf, axis=1))
+    mtf = espectro / np.where(espectro[:, :1] > 0, espectro[:, :1], 1.0)
+
+    unidade = "mm" if espacamento is not None else "px"
+    pixel = max(espacamento) if espacamento is not None else 1.0
+    frequencias = np.fft.rfftfreq(n_faixas, 1 / SOBREAMOSTRAGEM_MTF)
+    informadas = frequencias <= FREQUENCIA_MAXIMA_MTF + 1e-9
+    frequencias, mtf = frequencias[informadas] / pixel, mtf[:, informadas]
+
+    resultado = {
+        "frequencias": frequencias,
+        "mtf": mtf,
+        "distancias": distancias,
+        "esf": esf,
+        "cortes": cortes,
+        "unidade": unidade,
+    }
+    for nivel in NIVEIS_MTF:
+        resultado[f"mtf{round(nivel * 100)}"] = _cruzamentos(frequencias, mtf, nivel)
+    return resultado
+
+
+def resumo_mtf(mtf):
+    """Linhas (grandeza, valor) para exibir ou imprimir o resultado de `calcula_mtf` (média dos cortes)."""
+    unidade = mtf["unidade"]
+    linhas = []
+    for nivel in NIVEIS_MTF:
+        valores = mtf[f"mtf{round(nivel * 100)}"]
+        media = float(np.nanmean(valores)) if np.isfinite(valores).any() else float("nan")
+        linhas.append((f"MTF{round(nivel * 100)} (1/{unidade})", media))
+    linhas.append(("Cortes", len(mtf["cortes"])))
+    return linhas
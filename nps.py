@@ -0,0 +1,138 @@
+import numpy as np
+
+from imagem_ct import como_ct
+
+# Espectro de potência do ruído (NPS) na região uniforme do objeto simulador de
+# água: o desvio padrão das ROIs não distingue a textura do ruído, que muda com
+# o filtro de reconstrução. Muitas ROIs quadradas, de vários cortes, são
+# empilhadas numa única matriz e passam juntas pela remoção de tendência e pela
+# FFT, sem laço em Python sobre as ROIs.
+
+# Lado (em pixels) das ROIs quadradas usadas no NPS
+LADO_ROI_NPS = 64
+
+# As ROIs ficam inteiras dentro desta fração do raio do phantom, longe da borda
+FRACAO_RAIO_NPS = 0.8
+
+# Cortes processados por vez (limita a memória da pilha de ROIs em séries longas)
+BLOCO_CORTES_NPS = 32
+
+# ---------------- Funções ----------------
+
+def espacamento_pixel(ds):
+    """(linhas, colunas) em mm, do PixelSpacing do cabeçalho; None se o cabeçalho não informa."""
+    espacamento = getattr(ds, "PixelSpacing", None)
+    if not espacamento or len(espacamento) < 2:
+        return None
+    return float(espacamento[0]), float(espacamento[1])
+
+
+def posicoes_rois_nps(circulo, forma, lado=LADO_ROI_NPS, fracao_raio=FRACAO_RAIO_NPS):
+    """Cantos superiores esquerdos (x0, y0) de uma grade de ROIs quadradas sem sobreposição.
+
+    A grade é centrada no phantom e só mantém as ROIs com os quatro cantos dentro
+    de `fracao_raio` × raio e dentro da imagem. Retorna uma matriz (k, 2).
+    """
+    x_c, y_c, r_c = circulo
+    h, w = forma
+    limite = fracao_raio * r_c
+    n = int(np.ceil(limite / lado)) + 1
+    passos = np.arange(-n, n + 1)
+    x0 = (x_c - lado // 2 + passos * lado)[None, :].repeat(len(passos), axis=0).ravel()
+    y0 = (y_c - lado // 2 + passos * lado)[:, None].repeat(len(passos), axis=1).ravel()
+
+    # Canto mais distante do centro de cada ROI
+    dx = np.maximum(np.abs(x0 - x_c), np.abs(x0 + lado - x_c))
+    dy = np.maximum(np.abs(y0 - y_c), np.abs(y0 + lado - y_c))
+    dentro = (dx ** 2 + dy ** 2 <= limite ** 2) & (x0 >= 0) & (y0 >= 0) & (x0 + lado <= w) & (y0 + lado <= h)
+    return np.stack([x0[dentro], y0[dentro]], axis=1)
+
+
+def _base_tendencia(lado):
+    # Polinômio de 2º grau em x e y: a projeção dos pixels de cada ROI sobre ele é a tendência
+    y, x = np.mgrid[:lado, :lado] / (lado - 1) - 0.5
+    base = np.stack([np.ones_like(x), x, y, x * x, x * y, y * y], axis=-1).reshape(lado * lado, -1)
+    return base, np.linalg.pinv(base)
+
+
+def calcula_nps(volume, circulo, cortes=None, espacamento=None, lado=LADO_ROI_NPS,
+                fracao_raio=FRACAO_RAIO_NPS):
+    """NPS 2D e radial de um corte (h, w) ou de um volume (n, h, w).
+
+    As ROIs da grade de `posicoes_rois_nps` são recortadas em todos os `cortes`
+    (todos, se None), têm removida a tendência de 2º grau e o espectro médio é
+    calculado por uma FFT em lote. Com `espacamento` (mm, de `espacamento_pixel`),
+    as frequências saem em 1/mm e o NPS em HU²·mm²; sem ele, em pixels.
+
+    Retorna None se nenhuma ROI cabe no phantom; caso contrário, um dicionário com
+    "nps_2d" (centrado na frequência zero), "frequencias" e "nps_radial",
+    "variancia" (integral do NPS, em HU²), "frequencia_media", "frequencia_pico",
+    o número de ROIs e de cortes, o lado das ROIs e a unidade.
+    """
+    volume = como_ct(volume)
+    bruta = volume.bruta if volume.ndim == 3 else volume.bruta[None]
+    cortes = np.arange(len(bruta)) if cortes is None else np.asarray(cortes, dtype=np.int64)
+    cantos = posicoes_rois_nps(circulo, bruta.shape[1:], lado, fracao_raio)
+    if not len(cantos) or not len(cortes):
+        return None
+
+    unidade = "mm" if espacamento is not None else "px"
+    dy_mm, dx_mm = espacamento if espacamento is not None else (1.0, 1.0)
+
+    # Índices (ROI, linha) e (ROI, coluna) para recortar todas as ROIs de uma vez
+    linhas = cantos[:, 1, None] + np.arange(lado)
+    colunas = cantos[:, 0, None] + np.arange(lado)
+    base, pseudo_inversa = _base_tendencia(lado)
+
+    soma = np.zeros((lado, lado))
+    for inicio in range(0, len(cortes), BLOCO_CORTES_NPS):
+        bloco = bruta[cortes[inicio:inicio + BLOCO_CORTES_NPS]]
+        # (cortes, ROIs, lado, lado) em valores armazenados, achatado em (ROIs, pixels)
+        rois = bloco[:, linhas[:, :, None], colunas[:, None, :]].astype(np.float64)
+        rois = rois.reshape(-1, lado * lado)
+        rois -= (rois @ pseudo_inversa.T) @ base.T
+        espectro = np.fft.fft2(rois.reshape(-1, lado, lado))
+        soma += (espectro.real ** 2 + espectro.imag ** 2).sum(axis=0)
+
+    n_rois = len(cantos) * len(cortes)
+    # Reta para HU: o intercepto some com a tendência, a inclinação escala a potência
+    nps_2d = np.fft.fftshift(soma / n_rois) * (volume.inclinacao ** 2 * dx_mm * dy_mm / (lado * lado))
+
+    fy = np.fft.fftshift(np.fft.fftfreq(lado, dy_mm))
+    fx = np.fft.fftshift(np.fft.fftfreq(lado, dx_mm))
+    raio_freq = np.hypot(fx[None, :], fy[:, None])
+    passo = 1 / (lado * max(dx_mm, dy_mm))
+    faixa = np.rint(raio_freq / passo).astype(np.int64).ravel()
+    contagem = np.bincount(faixa)
+    nps_radial = np.bincount(faixa, weights=nps_2d.ravel()) / np.maximum(contagem, 1)
+    frequencias = np.arange(len(nps_radial)) * passo
+
+    # Só até a frequência de Nyquist, em que a média radial ainda cobre o círculo inteiro
+    nyquist = 0.5 / max(dx_mm, dy_mm)
+    ate_nyquist = frequencias <= nyquist + 1e-9
+    frequencias, nps_radial = frequencias[ate_nyquist], nps_radial[ate_nyquist]
+
+    return {
+        "nps_2d": nps_2d,
+        "frequencias": frequencias,
+        "nps_radial": nps_radial,
+        "variancia": float(nps_2d.sum() * (fx[1] - fx[0]) * (fy[1] - fy[0])),
+        "frequencia_media": float((frequencias * nps_radial).sum() / max(nps_radial.sum(), 1e-12)),
+        "frequencia_pico": float(frequencias[1:][np.argmax(nps_radial[1:])]) if len(frequencias) > 1 else 0.0,
+        "n_rois": int(n_rois),
+        "n_cortes": int(len(cortes)),
+        "lado_roi": int(lado),
+        "unidade": unidade,
+    }
+
+
+def resumo_nps(nps):
+    """Linhas (grandeza, valor) para exibir ou imprimir o resultado de `calcula_nps`."""
+    unidade = nps["unidade"]
+    return [
+        ("Ruído pelo NPS (HU)", float(np.sqrt(nps["variancia"]))),
+        (f"Frequência média (1/{unidade})", nps["frequencia_media"]),
+        (f"Frequência de pico (1/{unidade})", nps["frequencia_pico"]),
+        ("ROIs (cortes)", f"{nps['n_rois']} ({nps['n_cortes']})"),
+        ("Lado das ROIs (px)", nps["lado_roi"]),
+    ]
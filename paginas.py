@@ -0,0 +1,136 @@
+import importlib
+import importlib.abc
+import sys
+import threading
+import time
+
+from instrumentacao import cronometro
+
+# Registro das páginas do app: cada módulo só é importado na primeira vez em
+# que a página é aberta, e o custo da importação fica registrado.
+
+PAGINAS = {
+    "Página Inicial": "homepage",
+    "Guia de Usuário": "guia",
+    "Qualidade da Imagem": "avaliar_teste_tc",
+    "Registros dos Testes": "registro",
+    "Acompanhamento das Doses": "dicom",
+    # "Painéis": "paineis",
+}
+
+# Intervalo de atualização das barras de andamento das tarefas em segundo plano
+INTERVALO_ANDAMENTO_S = 1.0
+
+# Módulo -> segundos gastos na primeira importação (inclusivo: conta os submódulos).
+# Vale para as páginas e para as bibliotecas importadas depois deste módulo,
+# inclusive as carregadas só dentro das funções que as usam (cv2, reportlab...)
+TEMPOS_IMPORTACAO = {}
+
+_TRAVA = threading.Lock()
+
+# ---------------- Funções ----------------
+
+class _CronometroImportacao(importlib.abc.MetaPathFinder):
+    """Primeiro da `sys.meta_path`: mede a execução de cada módulo importado pela primeira vez.
+
+    Não localiza nada: repassa a busca aos demais localizadores e só envolve o
+    `exec_module` do carregador do próprio módulo, sem trocar o `__import__`.
+    """
+
+    _local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "buscando", False):
+            return None
+        self._local.buscando = True
+        try:
+            for localizador in sys.meta_path:
+                if localizador is self or not hasattr(localizador, "find_spec"):
+                    continue
+                spec = localizador.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.buscando = False
+
+        carregador = spec.loader
+        # Carregadores de módulos embutidos e congelados são classes compartilhadas: não são medidos
+        if carregador is None or isinstance(carregador, type) or not hasattr(carregador, "exec_module"):
+            return spec
+        executa = carregador.exec_module
+
+        def exec_module_cronometrado(modulo):
+            inicio = time.perf_counter()
+            try:
+                executa(modulo)
+            finally:
+                TEMPOS_IMPORTACAO.setdefault(fullname, time.perf_counter() - inicio)
+
+        try:
+            carregador.exec_module = exec_module_cronometrado
+        except AttributeError:  # Carregador sem atributos de instância
+            pass
+        return spec
+
+def instala_cronometro_importacao():
+    """Coloca o medidor de importações no início da `sys.meta_path` (uma única vez por processo)."""
+    with _TRAVA:
+        if not any(isinstance(localizador, _CronometroImportacao) for localizador in sys.meta_path):
+            sys.meta_path.insert(0, _CronometroImportacao())
+
+def carrega_pagina(nome):
+    """Importa o módulo da página (uma única vez por processo), medindo o custo da importação.
+
+    O tempo da página inclui os módulos que ela carrega pela primeira vez; o de
+    cada um deles fica registrado pelo medidor de `instala_cronometro_importacao`.
+    """
+    modulo = PAGINAS[nome]
+    if modulo in sys.modules:
+        return sys.modules[modulo]
+
+    with _TRAVA:
+        if modulo in sys.modules:
+            return sys.modules[modulo]
+        inicio = time.perf_counter()
+        pagina = importlib.import_module(modulo)
+        TEMPOS_IMPORTACAO[modulo] = time.perf_counter() - inicio
+        return pagina
+
+def executa_pagina(nome):
+    """Carrega e executa a página, registrando o tempo da execução (rerun)."""
+    with cronometro(f"Página: {nome}"):
+        carrega_pagina(nome).app()
+
+def relatorio_importacao(minimo_ms=1.0):
+    """Linhas (módulo, ms) das importações mais caras, da maior para a menor.
+
+    Os tempos são inclusivos: o de um pacote conta os submódulos e dependências
+    que ele importou pela primeira vez.
+    """
+    linhas = [(modulo, segundos * 1000) for modulo, segundos in TEMPOS_IMPORTACAO.items()
+              if segundos * 1000 >= minimo_ms]
+    return sorted(linhas, key=lambda linha: linha[1], reverse=True)
+
+def acompanha_tarefa(chave, texto):
+    """Barra de andamento de uma tarefa da fila, atualizada sem reexecutar a página inteira.
+
+    Quando a tarefa termina, a página é reexecutada para usar o resultado.
+    """
+    import streamlit as st
+    from fila_tarefas import FILA
+
+    @st.fragment(run_every=INTERVALO_ANDAMENTO_S)
+    def andamento():
+        tarefa = FILA.obtem(chave)
+        if tarefa is None:
+            return
+        if tarefa.pronta:
+            st.rerun()
+        etapa, fracao = tarefa.andamento()
+        st.progress(fracao, text=f"{texto}: {etapa}")
+
+    andamento()
+
+instala_cronometro_importacao()
@@ -0,0 +1,341 @@
+"""Receptor DICOM (Storage SCP) para os testes semanais de TC.
+
+Recebe as imagens enviadas pelo tomógrafo ou pelo PACS (C-STORE), grava cada
+instância em uma pasta por série (SeriesInstanceUID) dentro de
+`pasta_sala_imagens/Recebidas` e, quando a série termina de chegar, a analisa
+com o mesmo motor da página "Qualidade da Imagem" (corte central, exatidão,
+ruído e uniformidade). As séries recebidas e os resultados aparecem na página,
+sem precisar baixar e enviar os arquivos de novo.
+
+Cada associação é atendida em uma thread própria e a análise roda em processos
+separados, de modo que envios simultâneos não bloqueiam a recepção nem o app.
+
+Uso:
+    python receptor_dicom.py [--porta 11112] [--ae-title SEMANALTC] [-w WORKERS]
+    python receptor_dicom.py --envia PASTA [--host 127.0.0.1]   (SCU local, para testes)
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from globais import carrega_ini, carrega_parametro
+
+SUBPASTA_RECEBIDAS = "Recebidas"
+ARQUIVO_SERIE = "serie.json"            # Gravado quando a série termina de chegar
+ARQUIVO_RESULTADO = "resultado.json"    # Gravado quando a análise automática termina
+
+# Status do C-STORE (PS3.4 B.2.3)
+STATUS_SUCESSO = 0x0000
+STATUS_SEM_RECURSOS = 0xA700
+STATUS_NAO_PROCESSADO = 0xC000
+
+# UID DICOM (PS3.5 9.1): componentes numéricos separados por pontos, até 64 caracteres.
+# Os UIDs recebidos viram nomes de pasta e de arquivo, então nada além disso é aceito
+# (nem "..", nem separadores de caminho)
+_UID_VALIDO = re.compile(r"[0-9]+(\.[0-9]+)*")
+
+# ---------------- Funções ----------------
+
+def pasta_recebidas(pasta_sala_imagens=None):
+    """Pasta onde o receptor grava as séries (uma subpasta por SeriesInstanceUID)."""
+    if pasta_sala_imagens is None:
+        _, _, _, pasta_sala_imagens, _ = carrega_ini()
+    return os.path.join(pasta_sala_imagens, SUBPASTA_RECEBIDAS)
+
+
+def _grava_json(caminho, dados):
+    # Troca atômica: o app nunca lê um arquivo pela metade
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False, indent=1, default=str)
+    os.replace(temporario, caminho)
+
+
+def _le_json(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+class ReceptorDicom:
+    """Storage SCP: grava as instâncias recebidas por série e enfileira as séries concluídas.
+
+    Uma série é considerada concluída quando nenhuma associação aberta está
+    enviando imagens dela e nenhuma instância nova chegou há `espera_s`
+    segundos. Se a mesma série for reenviada depois, ela volta a ser enfileirada.
+    """
+
+    def __init__(self, pasta, ae_title="SEMANALTC", porta=11112, espera_s=10.0):
+        self.pasta = pasta
+        self.ae_title = ae_title
+        self.porta = porta
+        self.espera_s = espera_s
+        self.concluidas = queue.Queue()  # dict de cada série concluída (conteúdo do serie.json)
+
+        self._series = {}       # SeriesInstanceUID -> {"ultima": instante, "imagens": set de SOPInstanceUID}
+        self._associacoes = {}  # id da associação -> SeriesInstanceUIDs recebidos nela
+        self._trava = threading.Lock()
+        self._parar = threading.Event()
+        self._servidor = None
+        self._monitor = None
+
+    # --- Eventos do pynetdicom (uma thread por associação) ---
+    def _ao_armazenar(self, event):
+        try:
+            ds = event.dataset
+            serie = str(ds.SeriesInstanceUID)
+            sop = str(event.request.AffectedSOPInstanceUID)
+        except Exception:
+            return STATUS_NAO_PROCESSADO
+
+        destino = self._destino(serie, sop)
+        if destino is None:
+            return STATUS_NAO_PROCESSADO
+        pasta_serie = os.path.dirname(destino)
+        try:
+            os.makedirs(pasta_serie, exist_ok=True)
+            # Bytes como recebidos (com o cabeçalho de arquivo), sem recodificar o dataset
+            temporario = f"{destino}.{threading.get_ident()}.tmp"
+            with open(temporario, "wb") as arquivo:
+                arquivo.write(event.encoded_dataset(include_meta=True))
+            os.replace(temporario, destino)
+        except OSError:
+            return STATUS_SEM_RECURSOS
+
+        with self._trava:
+            estado = self._series.setdefault(serie, {"ultima": 0.0, "imagens": set()})
+            estado["ultima"] = time.monotonic()
+            estado["imagens"].add(sop)
+            self._associacoes.setdefault(id(event.assoc), set()).add(serie)
+        return STATUS_SUCESSO
+
+    def _destino(self, serie, sop):
+        """Caminho do arquivo da instância, ou None se os UIDs enviados não são válidos."""
+        if not all(len(uid) <= 64 and _UID_VALIDO.fullmatch(uid) for uid in (serie, sop)):
+            return None
+        raiz = os.path.realpath(self.pasta)
+        destino = os.path.realpath(os.path.join(raiz, serie, f"{sop}.dcm"))
+        if os.path.commonpath([raiz, destino]) != raiz:
+            return None
+        return destino
+
+    def _ao_encerrar(self, event):
+        with self._trava:
+            for serie in self._associacoes.pop(id(event.assoc), ()):
+                if serie in self._series:
+                    self._series[serie]["ultima"] = time.monotonic()
+
+    # --- Conclusão das séries ---
+    def verifica_concluidas(self):
+        """Enfileira as séries sem novas instâncias há `espera_s` segundos; retorna quantas."""
+        agora = time.monotonic()
+        with self._trava:
+            abertas = set().union(*self._associacoes.values()) if self._associacoes else set()
+            prontas = [serie for serie, estado in self._series.items()
+                       if serie not in abertas and agora - estado["ultima"] >= self.espera_s]
+            imagens = {serie: len(self._series.pop(serie)["imagens"]) for serie in prontas}
+
+        for serie in prontas:
+            pasta_serie = os.path.join(self.pasta, serie)
+            info = {
+                "SeriesInstanceUID": serie,
+                "Pasta": pasta_serie,
+                "Imagens recebidas": imagens[serie],
+                "Nº de imagens": len([n for n in os.listdir(pasta_serie) if n.endswith(".dcm")]),
+                "Concluída em": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            _grava_json(os.path.join(pasta_serie, ARQUIVO_SERIE), info)
+            self.concluidas.put(info)
+        return len(prontas)
+
+    def _monitora(self):
+        while not self._parar.wait(min(1.0, self.espera_s / 2)):
+            self.verifica_concluidas()
+
+    # --- Ciclo de vida ---
+    @property
+    def ativo(self):
+        return self._servidor is not None
+
+    def inicia(self):
+        """Abre a porta e passa a aceitar associações, sem bloquear a thread atual."""
+        from pynetdicom import AE, ALL_TRANSFER_SYNTAXES, AllStoragePresentationContexts, evt
+        from pynetdicom.sop_class import Verification
+
+        os.makedirs(self.pasta, exist_ok=True)
+        ae = AE(ae_title=self.ae_title)
+        # Aceita também as sintaxes comprimidas (JPEG, JPEG 2000, RLE) enviadas pelo PACS
+        for contexto in AllStoragePresentationContexts:
+            ae.add_supported_context(contexto.abstract_syntax, ALL_TRANSFER_SYNTAXES)
+        ae.add_supported_context(Verification)
+        ae.maximum_associations = 32
+
+        eventos = [
+            (evt.EVT_C_STORE, self._ao_armazenar),
+            (evt.EVT_RELEASED, self._ao_encerrar),
+            (evt.EVT_ABORTED, self._ao_encerrar),
+        ]
+        self._servidor = ae.start_server(("0.0.0.0", self.porta), block=False, evt_handlers=eventos)
+        self._parar.clear()
+        self._monitor = threading.Thread(target=self._monitora, name="receptor-monitor", daemon=True)
+        self._monitor.start()
+        return self
+
+    def para(self):
+        """Fecha a porta; as séries ainda em espera são enfileiradas imediatamente."""
+        self._parar.set()
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor = None
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+        self.espera_s = 0
+        self.verifica_concluidas()
+
+
+def envia_serie(caminhos, host="127.0.0.1", porta=11112, ae_title="SEMANALTC", ae_title_origem="SCU_TESTE"):
+    """SCU local: envia os arquivos por C-STORE, como faria o tomógrafo. Retorna os status, na ordem."""
+    import pydicom as dicom
+    from pynetdicom import AE, StoragePresentationContexts
+
+    cabecalhos = [dicom.dcmread(caminho, stop_before_pixels=True) for caminho in caminhos]
+    ae = AE(ae_title=ae_title_origem)
+    contextos = {(str(ds.SOPClassUID), str(ds.file_meta.TransferSyntaxUID)) for ds in cabecalhos}
+    if len(contextos) <= 128:
+        for sop_class, sintaxe in contextos:
+            ae.add_requested_context(sop_class, sintaxe)
+    else:
+        ae.requested_contexts = StoragePresentationContexts[:128]
+
+    assoc = ae.associate(host, porta, ae_title=ae_title)
+    if not assoc.is_established:
+        raise ConnectionError(f"Associação com {ae_title}@{host}:{porta} recusada")
+    status = []
+    try:
+        for caminho in caminhos:
+            resposta = assoc.send_c_store(caminho)
+            status.append(getattr(resposta, "Status", None))
+    finally:
+        assoc.release()
+    return status
+
+
+def series_recebidas(pasta):
+    """Séries concluídas na pasta do receptor, da mais recente para a mais antiga.
+
+    Cada item é o conteúdo do serie.json, com o resultado da análise automática
+    (ou None, se ainda não terminou) em "Resultado".
+    """
+    if not os.path.isdir(pasta):
+        return []
+    series = []
+    for nome in os.listdir(pasta):
+        info = _le_json(os.path.join(pasta, nome, ARQUIVO_SERIE))
+        if info is None:
+            continue
+        info["Pasta"] = os.path.join(pasta, nome)
+        info["Resultado"] = _le_json(os.path.join(pasta, nome, ARQUIVO_RESULTADO))
+        series.append(info)
+    return sorted(series, key=lambda info: info["Concluída em"], reverse=True)
+
+
+def arquivos_serie(pasta_serie):
+    """Arquivos DICOM de uma série recebida."""
+    return [os.path.join(pasta_serie, nome) for nome in sorted(os.listdir(pasta_serie)) if nome.endswith(".dcm")]
+
+
+def analisa_concluidas(receptor, n_workers=0, material="Água", fator_raio=1.0, corte="automatico",
+                       saida_csv=None, progresso=None):
+    """Analisa cada série concluída em um processo separado, até o receptor parar e a fila esvaziar.
+
+    O resultado de cada série vai para o resultado.json da pasta dela e,
+    opcionalmente, é acrescentado a `saida_csv`.
+    """
+    import pandas as pd
+
+    from decodificacao import numero_workers
+    from lote import agrupa_series, analisa_serie, info_serie
+
+    def conclui(uid, cortes, futuro):
+        linha = info_serie(uid, cortes)
+        try:
+            resultado, _ = futuro.result()
+            linha.update(resultado)
+        except Exception as e:
+            linha["Erro"] = str(e)
+        _grava_json(os.path.join(os.path.dirname(cortes[0][1]), ARQUIVO_RESULTADO), linha)
+        if saida_csv:
+            df = pd.DataFrame([linha])
+            df.to_csv(saida_csv, sep=";", index=False, encoding="utf-8", mode="a",
+                      header=not os.path.isfile(saida_csv))
+        if progresso is not None:
+            progresso(linha)
+
+    with ProcessPoolExecutor(numero_workers(n_workers)) as pool:
+        while receptor.ativo or not receptor.concluidas.empty():
+            try:
+                info = receptor.concluidas.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            for uid, cortes in agrupa_series(info["Pasta"]).items():
+                futuro = pool.submit(analisa_serie, [c[1] for c in cortes], material, fator_raio, corte)
+                futuro.add_done_callback(lambda f, uid=uid, cortes=cortes: conclui(uid, cortes, f))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receptor DICOM (Storage SCP) dos testes semanais de TC.")
+    parser.add_argument("--ae-title", default=carrega_parametro("receptor", "ae_title", "SEMANALTC"))
+    parser.add_argument("--porta", type=int, default=int(carrega_parametro("receptor", "porta", 11112)))
+    parser.add_argument("--espera", type=float, default=float(carrega_parametro("receptor", "espera_s", 10)),
+                        help="Segundos sem novas imagens para considerar a série concluída")
+    parser.add_argument("-w", "--workers", type=int,
+                        default=int(carrega_parametro("decodificacao", "workers", 0)),
+                        help="Processos da análise automática (0 = todos os núcleos)")
+    parser.add_argument("--material", choices=["Água", "Ar"], default="Água")
+    parser.add_argument("--envia", metavar="PASTA", help="Em vez de receber, envia a pasta por C-STORE (teste)")
+    parser.add_argument("--host", default="127.0.0.1", help="Destino do --envia")
+    args = parser.parse_args(argv)
+
+    if args.envia:
+        caminhos = [os.path.join(raiz, nome) for raiz, _, nomes in os.walk(args.envia) for nome in sorted(nomes)]
+        status = envia_serie(caminhos, args.host, args.porta, args.ae_title)
+        falhas = sum(1 for s in status if s != STATUS_SUCESSO)
+        print(f"{len(status) - falhas} de {len(status)} arquivos enviados para {args.ae_title}@{args.host}:{args.porta}")
+        return 1 if falhas else 0
+
+    pasta_csv, _, _, pasta_sala_imagens, _ = carrega_ini()
+    receptor = ReceptorDicom(pasta_recebidas(pasta_sala_imagens), args.ae_title, args.porta, args.espera).inicia()
+    print(f"Recebendo em {args.ae_title}:{args.porta}; séries gravadas em {receptor.pasta} (Ctrl+C para sair)")
+
+    def progresso(linha):
+        status = linha.get("Erro") or linha.get("Conforme IN 93/2021")
+        print(f"{linha['SeriesInstanceUID']} ({linha['Descrição da Série']}, {linha['Nº de imagens']} imagens): {status}")
+
+    analise = threading.Thread(
+        target=analisa_concluidas,
+        args=(receptor, args.workers, args.material),
+        kwargs={"saida_csv": os.path.join(pasta_csv, "resultados_recebidos.csv"), "progresso": progresso},
+    )
+    analise.start()
+    try:
+        while analise.is_alive():
+            analise.join(0.5)
+    except KeyboardInterrupt:
+        print("Encerrando...")
+    finally:
+        receptor.para()
+        analise.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,15 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime
-from io import BytesIO
-import openpyxl
+from datetime import datetime, timedelta
+from globais import carrega_ini
+from registro_testes import abre_registro
+
+REGISTROS_POR_PAGINA = 50
 
 def app():
     st.title("Registro do Teste Semanal")
 
-    # Inicializando tabela no session_state para persistência
-    colunas = ["Data", "Horário", "Realizado por"]
-    if "tabela_tomografia" not in st.session_state:
-        st.session_state.tabela_tomografia = pd.DataFrame(columns=colunas)
+    # Registros gravados em disco (pasta de CSVs), preservados entre as sessões
+    registro = abre_registro(carrega_ini()[0])
 
     st.markdown("### Adicionar novo registro")
 
@@ -23,64 +22,44 @@ def app():
         submitted = st.form_submit_button("Adicionar registro")
 
         if submitted:
-            nova_linha = {
-                "Data": data.strftime("%d/%m/%Y"),
-                "Horário": horario.strftime("%H:%M:%S"),
-                "Realizado por": realizado_por
-            }
-            st.session_state.tabela_tomografia = pd.concat(
-                [st.session_state.tabela_tomografia, pd.DataFrame([nova_linha])],
-                ignore_index=True
-            )
-            st.success("Registro adicionado!")
+            if registro.adicionar([(data, horario, realizado_por)]):
+                st.success("Registro adicionado!")
+            else:
+                st.info("Esse registro já existe.")
 
     # Exibir tabela de registros
     st.markdown("### Tabela de registros")
-    st.dataframe(st.session_state.tabela_tomografia)
-
-    # ---------------- OPÇÃO PARA CARREGAR OU CRIAR NOVO ARQUIVO ----------------
-    st.markdown("### Abrir arquivo Excel existente ou criar um novo")
-
-    uploaded_file = st.file_uploader("Escolha um arquivo Excel existente", type="xlsx")
-
-    if uploaded_file is not None:
-        # Carregar o arquivo Excel
-        df_existing = pd.read_excel(uploaded_file, engine="openpyxl")
-
-        # Atualizar com os novos registros
-        if not st.session_state.tabela_tomografia.empty:
-            df_updated = pd.concat([df_existing, st.session_state.tabela_tomografia], ignore_index=True)
-
-            # Converter DataFrame atualizado em Excel
-            buffer = BytesIO()
-            with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-                df_updated.to_excel(writer, index=False, sheet_name="Registros")
-            buffer.seek(0)
-
-            # Botão para salvar o arquivo atualizado
-            st.download_button(
-                label="💾 Baixar arquivo Excel atualizado",
-                data=buffer,
-                file_name=f"registro_teste_semanal_atualizado_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-        else:
-            st.info("Nenhum novo registro disponível para atualizar.")
-
-    else:
-        st.info("Nenhum arquivo carregado. Criando um novo arquivo...")
-
-        # Caso o usuário não tenha carregado um arquivo, criamos um novo arquivo Excel
-        if not st.session_state.tabela_tomografia.empty:
-            buffer = BytesIO()
-            with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-                st.session_state.tabela_tomografia.to_excel(writer, index=False, sheet_name="Registros")
-            buffer.seek(0)
 
-            # Botão para criar e salvar o novo arquivo Excel
-            st.download_button(
-                label="💾 Criar novo arquivo Excel",
-                data=buffer,
-                file_name=f"registro_teste_semanal_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+    col1, col2 = st.columns(2)
+    with col1:
+        inicio = st.date_input("De", value=datetime.today() - timedelta(days=365))
+    with col2:
+        fim = st.date_input("Até", value=datetime.today())
+
+    total = registro.total(inicio, fim)
+    paginas = max(1, -(-total // REGISTROS_POR_PAGINA))
+    pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, value=1)
+    st.dataframe(registro.pagina(inicio, fim, pagina, REGISTROS_POR_PAGINA))
+    st.caption(f"{total} registro(s) no período")
+
+    # ---------------- EXPORTAR OU IMPORTAR EXCEL ----------------
+    st.markdown("### Exportar ou importar arquivo Excel")
+
+    # A planilha só é gerada quando o botão é clicado
+    st.download_button(
+        label="💾 Baixar registros do período em Excel",
+        data=lambda: registro.exporta_excel(inicio, fim),
+        file_name=f"registro_teste_semanal_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+    # Planilhas antigas podem ser incorporadas ao registro (registros repetidos são ignorados)
+    uploaded_file = st.file_uploader("Importar um arquivo Excel existente", type="xlsx")
+    if uploaded_file is not None and st.button("📥 Importar registros da planilha"):
+        try:
+            novos, rejeitados = registro.importa_excel(uploaded_file)
+            st.success(f"{novos} registro(s) importado(s)!")
+            if rejeitados:
+                st.warning(f"{rejeitados} linha(s) sem data ou horário válidos não foram importadas.")
+        except Exception as e:
+            st.error(f"Erro ao importar a planilha: {e}")
@@ -0,0 +1,156 @@
+import datetime
+import os
+import threading
+from io import BytesIO
+
+import pandas as pd
+
+from banco import conecta
+
+# ---------------- Registro dos testes semanais ----------------
+#
+# Uma linha por teste realizado, gravada em um banco SQLite na pasta de CSVs.
+# A planilha Excel é gerada apenas na exportação.
+
+NOME_BANCO = "registro_testes.sqlite"
+
+COLUNAS = ["Data", "Horário", "Realizado por"]
+
+# ---------------- Funções ----------------
+
+def _data_celula(valor):
+    """Data de uma célula de planilha: data do Excel, DD/MM/YYYY ou ISO; None se inválida.
+
+    O formato DD/MM/YYYY da planilha original é tentado primeiro e o ISO (células
+    de data lidas como texto) antes da leitura genérica com o dia primeiro, que
+    inverteria dia e mês em "2024-05-03".
+    """
+    if pd.isna(valor):
+        return None
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    texto = str(valor).strip()
+    for formato in ("%d/%m/%Y", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    data = pd.to_datetime(texto, dayfirst=True, errors="coerce")
+    return None if pd.isna(data) else data.date()
+
+def _horario_celula(valor):
+    """Horário de uma célula de planilha: hora do Excel (ou fração do dia), HH:MM:SS ou HH:MM; None se inválido."""
+    if pd.isna(valor):
+        return None
+    if isinstance(valor, datetime.datetime):
+        return valor.time()
+    if isinstance(valor, datetime.time):
+        return valor
+    if isinstance(valor, (int, float)) and 0 <= valor < 1:
+        segundos = round(valor * 86400)
+        return datetime.time(segundos // 3600, segundos // 60 % 60, segundos % 60)
+    texto = str(valor).strip()
+    for formato in ("%H:%M:%S", "%H:%M", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(texto, formato).time()
+        except ValueError:
+            continue
+    return None
+
+class RegistroTestes:
+    """Registro dos testes em SQLite: inserção de custo constante e leitura paginada por data.
+
+    A data é guardada em ISO (YYYY-MM-DD) para ordenar e filtrar pelo índice; a
+    exibição e a exportação usam DD/MM/YYYY, como a planilha original.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._trava = threading.Lock()
+        with conecta(caminho) as conexao:
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS registros ("
+                "id INTEGER PRIMARY KEY, data TEXT NOT NULL, horario TEXT NOT NULL, "
+                "realizado_por TEXT NOT NULL, registrado_em TEXT, "
+                "UNIQUE (data, horario, realizado_por))"
+            )
+
+    def adicionar(self, registros):
+        """Acrescenta registros (data, horário, realizado por); repetidos são ignorados.
+
+        `data` é um `datetime.date` e `horario` um `datetime.time`. Retorna quantos eram novos.
+        """
+        agora = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._trava, conecta(self.caminho) as conexao:
+            cursor = conexao.executemany(
+                "INSERT OR IGNORE INTO registros (data, horario, realizado_por, registrado_em) "
+                "VALUES (?, ?, ?, ?)",
+                [(data.isoformat(), horario.strftime("%H:%M:%S"), realizado_por, agora)
+                 for data, horario, realizado_por in registros]
+            )
+            return max(cursor.rowcount, 0)
+
+    def _filtro(self, inicio, fim):
+        return "WHERE data BETWEEN ? AND ?", [
+            inicio.isoformat() if inicio else "0000-00-00",
+            fim.isoformat() if fim else "9999-99-99",
+        ]
+
+    def total(self, inicio=None, fim=None):
+        filtro, parametros = self._filtro(inicio, fim)
+        with conecta(self.caminho) as conexao:
+            return conexao.execute(f"SELECT COUNT(*) FROM registros {filtro}", parametros).fetchone()[0]
+
+    def pagina(self, inicio=None, fim=None, numero=1, tamanho=50):
+        """Registros do período, dos mais recentes para os mais antigos, uma página por vez."""
+        filtro, parametros = self._filtro(inicio, fim)
+        limite = [tamanho, (numero - 1) * tamanho] if tamanho else [-1, 0]
+        with conecta(self.caminho) as conexao:
+            df = pd.read_sql_query(
+                f"SELECT data, horario, realizado_por FROM registros {filtro} "
+                f"ORDER BY data DESC, horario DESC LIMIT ? OFFSET ?",
+                conexao, params=parametros + limite
+            )
+        df["data"] = pd.to_datetime(df["data"]).dt.strftime("%d/%m/%Y")
+        df.columns = COLUNAS
+        return df
+
+    def exporta_excel(self, inicio=None, fim=None):
+        """Planilha Excel (bytes) com todos os registros do período."""
+        buffer = BytesIO()
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            self.pagina(inicio, fim, tamanho=None).to_excel(writer, index=False, sheet_name="Registros")
+        return buffer.getvalue()
+
+    def importa_excel(self, arquivo):
+        """Importa uma planilha no formato antigo (Data, Horário, Realizado por).
+
+        Datas e horários podem estar como texto ou como valores de data e hora do
+        Excel. Retorna (novos, rejeitados): linhas sem data ou horário válidos são
+        contadas como rejeitadas.
+        """
+        df = pd.read_excel(arquivo, engine="openpyxl", dtype=object)
+        datas = df["Data"].map(_data_celula)
+        horarios = df["Horário"].map(_horario_celula)
+        validos = datas.notna() & horarios.notna()
+        realizado_por = df["Realizado por"][validos].fillna("").astype(str)
+        novos = self.adicionar(zip(datas[validos], horarios[validos], realizado_por))
+        return novos, int((~validos).sum())
+
+
+# Uma instância por arquivo, compartilhada entre as sessões
+_REGISTROS = {}
+_TRAVA_REGISTROS = threading.Lock()
+
+
+def abre_registro(pasta_csv):
+    """Retorna o registro dos testes guardado na pasta de CSVs, criando o banco se necessário."""
+    caminho = os.path.join(pasta_csv, NOME_BANCO)
+    with _TRAVA_REGISTROS:
+        registro = _REGISTROS.get(caminho)
+        if registro is None:
+            os.makedirs(pasta_csv, exist_ok=True)
+            registro = _REGISTROS[caminho] = RegistroTestes(caminho)
+    return registro
@@ -0,0 +1,192 @@
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+
+from analise import tabelas_resultado
+from decodificacao import descarta_pool, numero_workers, obtem_pool
+from mtf import resumo_mtf
+from nps import resumo_nps
+from renderizacao import renderiza_img
+
+# Relatórios em PDF gerados inteiramente em memória, com um estudo por página.
+#
+# Cada estudo é um dicionário com:
+#   "titulo":    identificação do estudo (imagem, sala, série...)
+#   "resultado": resultado de `analise.avalia_imagem`
+#   "imagem":    imagem anotada já codificada (PNG ou JPEG), ou
+#   "img":       imagem em HU, renderizada em paralelo no pool de processos
+#   "nps":       (opcional) resultado de `nps.calcula_nps`, desenhado ao lado da imagem
+#   "mtf":       (opcional) resultado de `mtf.calcula_mtf`, desenhado ao lado das tabelas
+
+# ---------------- Funções ----------------
+
+def _renderiza_estudo(img, resultado):
+    x_c, y_c, _ = resultado["circulo"]
+    # JPEG é embutido no PDF sem recompressão, o que deixa a montagem das páginas rápida
+    return renderiza_img(
+        img,
+        rois=resultado["centers"],
+        radius=resultado["radius_roi"],
+        phantom_circle=(x_c, y_c, resultado["r_c_ajustado"]),
+        formato="jpg"
+    )
+
+def renderiza_estudos(estudos, n_workers=0):
+    """Renderiza, em paralelo, as imagens dos estudos que ainda não têm imagem codificada."""
+    pendentes = [estudo for estudo in estudos if not estudo.get("imagem")]
+    if not pendentes:
+        return estudos
+
+    n_workers = numero_workers(n_workers)
+    imagens = None
+    if len(pendentes) > 1 and n_workers > 1:
+        pool = obtem_pool("processos", n_workers)
+        try:
+            imagens = list(pool.map(_renderiza_estudo, [e["img"] for e in pendentes],
+                                    [e["resultado"] for e in pendentes]))
+        except BrokenProcessPool:
+            # Um worker morreu: descarta o pool e renderiza no processo atual
+            descarta_pool("processos", n_workers)
+    if imagens is None:
+        imagens = [_renderiza_estudo(e["img"], e["resultado"]) for e in pendentes]
+
+    for estudo, imagem in zip(pendentes, imagens):
+        estudo["imagem"] = imagem
+        estudo.pop("img", None)  # A matriz em HU não é mais necessária
+    return estudos
+
+def desenhar_tabela(c, df, titulo, y_pos):
+    """Desenha uma tabela formatada a partir de um DataFrame."""
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(30, y_pos + 20, titulo)
+    c.setFont("Helvetica", 9)
+
+    # Formatar os valores para garantir que apareçam com 2 casas decimais
+    # Verificar se o valor é numérico antes de aplicar a formatação
+    data = [df.columns.tolist()] + [
+        [f'{value:.2f}' if isinstance(value, (int, float)) else value for value in row]
+        for row in df.values.tolist()
+    ]
+
+    tabela = Table(data, colWidths=[80, 100, 100, 80])
+
+    tabela.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONT', (0, 1), (-1, -1), 'Helvetica'),
+        ('TEXTCOLOR', (-1, 1), (-1, -1), colors.black),
+    ]))
+
+    tabela.wrapOn(c, 30, y_pos)
+    tabela.drawOn(c, 30, y_pos)
+
+def desenhar_grafico(c, titulo, abscissas, valores, rotulo_x, rotulo_y, resumo, x, y, largura, altura,
+                     maximo_y=None):
+    """Desenha uma curva com eixos e, logo abaixo, as linhas (grandeza, valor) do resumo.
+
+    (x, y) é o canto inferior esquerdo do gráfico; sem `maximo_y`, a escala vai até o maior valor.
+    """
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(x, y + altura + 12, titulo)
+
+    # Eixos e curva, escalados para a caixa do gráfico
+    c.setLineWidth(0.5)
+    c.line(x, y, x + largura, y)
+    c.line(x, y, x, y + altura)
+    maximo_x = max(float(abscissas[-1]), 1e-12)
+    maximo_y = max(float(maximo_y if maximo_y is not None else valores.max()), 1e-12)
+    pontos = [(x + largura * a / maximo_x, y + altura * min(v, maximo_y) / maximo_y)
+              for a, v in zip(abscissas, valores)]
+    c.setLineWidth(1)
+    c.lines([(*a, *b) for a, b in zip(pontos[:-1], pontos[1:])])
+
+    c.setFont("Helvetica", 7)
+    c.drawString(x, y - 9, "0")
+    c.drawRightString(x + largura, y - 9, f"{maximo_x:.2f} {rotulo_x}")
+    c.drawString(x, y + altura + 2, f"máx. {maximo_y:.3g} {rotulo_y}")
+
+    c.setFont("Helvetica", 8)
+    y_texto = y - 24
+    for grandeza, valor in resumo:
+        texto = f"{valor:.3f}" if isinstance(valor, float) else str(valor)
+        c.drawString(x, y_texto, f"{grandeza}: {texto}")
+        y_texto -= 11
+
+def desenhar_nps(c, nps, x, y, largura, altura):
+    """NPS radial e resumo (de `nps.calcula_nps`)."""
+    unidade = nps["unidade"]
+    desenhar_grafico(c, "Espectro de potência do ruído (NPS)", nps["frequencias"], nps["nps_radial"],
+                     f"1/{unidade}", f"HU²·{unidade}²", resumo_nps(nps), x, y, largura, altura)
+
+def desenhar_mtf(c, mtf, x, y, largura, altura):
+    """MTF média dos cortes e resumo (de `mtf.calcula_mtf`)."""
+    if not len(mtf["mtf"]):
+        return
+    desenhar_grafico(c, "Resolução espacial (MTF)", mtf["frequencias"], mtf["mtf"].mean(axis=0),
+                     f"1/{mtf['unidade']}", "", resumo_mtf(mtf), x, y, largura, altura, maximo_y=1.0)
+
+def desenhar_pagina(c, estudo, data_hora):
+    """Desenha a página de um estudo: cabeçalho, imagem, parecer e tabelas."""
+    from reportlab.lib.utils import ImageReader
+
+    resultado = estudo["resultado"]
+
+    # Cabeçalho e data
+    c.setFont("Helvetica-Bold", 13)
+    c.drawString(30, 760, "Relatório do Teste Semanal de Tomografia Computadorizada")
+    c.setFont("Helvetica", 10)
+    c.drawString(30, 745, f"Data e hora: {data_hora}")
+    c.line(30, 740, 580, 740)
+
+    # Imagem anotada, direto da memória
+    c.drawImage(ImageReader(BytesIO(estudo["imagem"])), 60, 420, width=300, height=300)
+
+    # Identificação e parecer ao lado da imagem
+    c.setFont("Helvetica", 10)
+    c.drawString(380, 700, str(estudo.get("titulo", ""))[:40])
+    c.drawString(380, 685, f"Material: {resultado['material']}")
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(380, 670, "Conforme IN 93/2021" if resultado["conforme"] else "Fora de conformidade")
+
+    if estudo.get("nps") is not None:
+        desenhar_nps(c, estudo["nps"], 385, 500, 180, 120)
+    if estudo.get("mtf") is not None:
+        desenhar_mtf(c, estudo["mtf"], 415, 270, 150, 100)
+
+    # --- Inserir tabelas no PDF ---
+    resultados_exatidao, resultados_ruido, resultados_uniformidade = tabelas_resultado(resultado)
+    y_pos = 260
+    desenhar_tabela(c, resultados_exatidao, "", y_pos + 30)
+
+    y_pos -= 120
+    desenhar_tabela(c, resultados_ruido, "", y_pos + 30)
+
+    y_pos -= 100
+    desenhar_tabela(c, resultados_uniformidade, "", y_pos + 30)
+
+    # Rodapé
+    c.setFont("Helvetica-Oblique", 8)
+    c.drawString(30, 30, "Gerado automaticamente pelo aplicativo SEMANAL TC")
+
+def gera_relatorio_pdf(estudos, n_workers=0):
+    """Gera um único PDF (bytes) com uma página por estudo, sem arquivos temporários."""
+    # reportlab só é carregado quando um relatório é gerado
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    renderiza_estudos(estudos, n_workers)
+
+    buffer_pdf = BytesIO()
+    c = canvas.Canvas(buffer_pdf, pagesize=letter)
+    data_hora = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    for estudo in estudos:
+        desenhar_pagina(c, estudo, data_hora)
+        c.showPage()
+    c.save()
+    return buffer_pdf.getvalue()
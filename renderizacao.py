@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import cv2
+
+from imagem_ct import ImagemCT, como_ct
+
+# Renderização das imagens para exibição: janela em NumPy, anotações com cv2 e
+# imagem codificada (PNG/WebP) guardada em cache pela imagem e pela geometria.
+
+# Cores em BGR (ordem usada pelo cv2)
+COR_PHANTOM = (255, 0, 0)     # Azul
+COR_ROI = (0, 0, 255)         # Vermelho
+COR_ROTULO = (255, 255, 255)  # Branco
+
+ROTULOS_ROIS = ['1', '2', '3', '4', '5']  # Centro, 3h, 6h, 9h, 12h
+
+_RENDERIZADAS = OrderedDict()
+_TRAVA = threading.Lock()
+_MAX_RENDERIZADAS = 64
+
+# ---------------- Funções ----------------
+
+def janela_para_uint8(img, janela=None):
+    """Converte a imagem em HU para 8 bits.
+
+    `janela` é (centro, largura) em HU; sem janela, usa o mínimo e o máximo da
+    imagem, como o `imshow` do matplotlib. Uma `ImagemCT` é janelada direto nos
+    valores armazenados: a reta para HU entra na escala, sem a matriz em HU.
+    """
+    if isinstance(img, ImagemCT):
+        bruta, inclinacao = img.bruta, img.inclinacao
+    else:
+        bruta, inclinacao = img, 1.0
+    if janela is None:
+        minimo, maximo = float(bruta.min()), float(bruta.max())
+        escala = 255 / (maximo - minimo) if maximo > minimo else 0.0
+    else:
+        centro, largura = janela
+        minimo, maximo = centro - largura / 2, centro + largura / 2
+        escala = inclinacao * 255 / (maximo - minimo) if maximo > minimo else 0.0
+        if isinstance(img, ImagemCT):
+            minimo = img.para_bruto(minimo)
+    return np.clip((bruta - minimo) * escala, 0, 255).astype(np.uint8)
+
+def _circulo_tracejado(img, centro, raio, cor, espessura, passo=10):
+    # cv2 não desenha círculos tracejados: um arco a cada `passo` graus
+    for inicio in range(0, 360, passo):
+        cv2.ellipse(img, centro, (raio, raio), 0, inicio, inicio + passo / 2, cor, espessura, cv2.LINE_AA)
+
+def desenha_anotacoes(img8, rois=None, radius=25, phantom_circle=None):
+    """Desenha o círculo do phantom (tracejado), as ROIs e seus números sobre a imagem de 8 bits."""
+    rgb = cv2.cvtColor(img8, cv2.COLOR_GRAY2BGR)
+    espessura = max(1, round(min(img8.shape) / 400))
+
+    if phantom_circle is not None:
+        x, y, r = (int(v) for v in phantom_circle)
+        _circulo_tracejado(rgb, (x, y), r, COR_PHANTOM, espessura)
+
+    if rois:
+        escala_fonte = min(img8.shape) / 700
+        for rotulo, (x, y) in zip(ROTULOS_ROIS, rois):
+            x, y = int(x), int(y)
+            cv2.circle(rgb, (x, y), int(radius), COR_ROI, espessura, cv2.LINE_AA)
+            (w, h), _ = cv2.getTextSize(rotulo, cv2.FONT_HERSHEY_SIMPLEX, escala_fonte, espessura)
+            cv2.putText(rgb, rotulo, (x - w // 2, y + h // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                        escala_fonte, COR_ROTULO, espessura, cv2.LINE_AA)
+    return rgb
+
+def renderiza_img(img, rois=None, radius=25, phantom_circle=None, janela=None, formato="png"):
+    """Imagem anotada codificada em PNG, WebP ou JPEG (bytes), reaproveitada do cache quando possível."""
+    img = como_ct(img)
+    bruta = np.ascontiguousarray(img.bruta)
+    geometria = (
+        tuple((int(x), int(y)) for x, y in rois) if rois else None,
+        int(radius),
+        tuple(int(v) for v in phantom_circle) if phantom_circle is not None else None,
+        janela,
+        formato,
+    )
+    chave = (bruta.shape, bruta.dtype.str, img.reta(), hashlib.sha256(bruta).digest(), geometria)
+    with _TRAVA:
+        if chave in _RENDERIZADAS:
+            _RENDERIZADAS.move_to_end(chave)
+            return _RENDERIZADAS[chave]
+
+    rgb = desenha_anotacoes(janela_para_uint8(img, janela), rois, radius, phantom_circle)
+    parametros = {
+        "png": [cv2.IMWRITE_PNG_COMPRESSION, 1],
+        "webp": [cv2.IMWRITE_WEBP_QUALITY, 90],
+        "jpg": [cv2.IMWRITE_JPEG_QUALITY, 92],
+    }[formato]
+    ok, codificada = cv2.imencode(f".{formato}", rgb, parametros)
+    if not ok:
+        raise ValueError(f"Não foi possível codificar a imagem em {formato}")
+    codificada = codificada.tobytes()
+
+    with _TRAVA:
+        _RENDERIZADAS[chave] = codificada
+        while len(_RENDERIZADAS) > _MAX_RENDERIZADAS:
+            _RENDERIZADAS.popitem(last=False)
+    return codificada
@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pydicom as dicom
+
+from cache_imagens import CACHE, carrega_hu, chave_conteudo, chave_imagem
+from decodificacao import decodifica_serie
+from imagem_ct import empilha
+
+# Threads usadas para decodificar antecipadamente as imagens vizinhas
+_EXECUTOR_PREFETCH = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+
+
+def posicao_corte(ds):
+    """Chave de ordenação de um corte: posição z do paciente e, na falta dela, o número da instância."""
+    try:
+        z = float(ds.ImagePositionPatient[2])
+    except (AttributeError, IndexError, TypeError, ValueError):
+        z = float("inf")
+    return (z, int(getattr(ds, "InstanceNumber", 0) or 0))
+
+
+class SerieDicom:
+    """Série DICOM: cabeçalhos lidos na criação, pixels decodificados somente quando pedidos."""
+
+    def __init__(self, arquivos, cache=CACHE, vizinhos=1, cache_disco=None, uso=None):
+        self.cache = cache
+        self.vizinhos = vizinhos
+        self.cache_disco = cache_disco
+        self.uso = uso  # UsoCache da sessão: as imagens vistas ficam fixadas no cache compartilhado
+        self.arquivos = []
+        self.cabecalhos = []
+        self.erros = []  # (nome do arquivo, exceção), para exibir como st.error
+        self._pendentes = {}
+
+        cortes = []
+        for arquivo in arquivos:
+            try:
+                ds = dicom.dcmread(arquivo, force=True, stop_before_pixels=True)
+                arquivo.seek(0)
+            except Exception as e:
+                self.erros.append((arquivo.name, e))
+                continue
+            cortes.append((posicao_corte(ds), arquivo, ds))
+
+        # Cortes em ordem de posição, independente da ordem de seleção dos arquivos
+        cortes.sort(key=lambda corte: corte[0])
+        self.arquivos = [arquivo for _, arquivo, _ in cortes]
+        self.cabecalhos = [ds for _, _, ds in cortes]
+
+        self.nomes = [arquivo.name for arquivo in self.arquivos]
+
+        # Hash do conteúdo calculado uma única vez por arquivo; a chave do cache de
+        # imagens inclui o SOPInstanceUID, a do cache em disco só o conteúdo
+        self.hashes = [chave_conteudo(arquivo) for arquivo in self.arquivos]
+        self.chaves = [chave_imagem(ds, h) for ds, h in zip(self.cabecalhos, self.hashes)]
+
+        # Série já analisada antes: o volume é reaberto do disco por mmap
+        self._volume_disco = None
+        self._fatias = {}
+        if cache_disco is not None and self.arquivos:
+            self.chave_disco = cache_disco.chave(
+                getattr(self.cabecalhos[0], "SeriesInstanceUID", ""),
+                self.hashes
+            )
+            self._volume_disco = cache_disco.obter(self.chave_disco)
+
+    def __len__(self):
+        return len(self.arquivos)
+
+    def imagem(self, indice):
+        """Imagem (`ImagemCT`) da posição `indice`; inicia a leitura antecipada das vizinhas."""
+        if self._volume_disco is not None:
+            # Sempre o mesmo objeto por corte, para aproveitar os caches por imagem
+            if indice not in self._fatias:
+                self._fatias[indice] = self._volume_disco[indice]
+            return self._fatias[indice]
+
+        futuro = self._pendentes.pop(indice, None)
+        if futuro is not None:
+            img = futuro.result()
+        else:
+            img = carrega_hu(self.arquivos[indice], self.cache, self.chaves[indice], self.uso)
+        self.prefetch(indice)
+        return img
+
+    def prefetch(self, indice):
+        """Decodifica em segundo plano as imagens adjacentes a `indice`."""
+        # Descarta pedidos antigos que ficaram longe da posição atual
+        for i in list(self._pendentes):
+            if abs(i - indice) > self.vizinhos:
+                self._pendentes.pop(i).cancel()
+
+        for i in range(indice - self.vizinhos, indice + self.vizinhos + 1):
+            if i == indice or not 0 <= i < len(self) or i in self._pendentes:
+                continue
+            self._pendentes[i] = _EXECUTOR_PREFETCH.submit(
+                carrega_hu, self.arquivos[i], self.cache, self.chaves[i], self.uso
+            )
+
+    def decodifica_todas(self, n_workers=0, modo="processos"):
+        """Decodifica a série inteira em paralelo (exportação, análise em lote).
+
+        Retorna (imagens, erros) na ordem da série, como `decodifica_serie`.
+        """
+        return decodifica_serie(self.arquivos, n_workers, modo, self.cache, self.chaves)
+
+    def volume(self, n_workers=0, modo="processos"):
+        """Empilha a série inteira em um volume contíguo (n, h, w), em valores armazenados (`ImagemCT`).
+
+        Retorna (volume, erros); o volume é None se algum corte não puder ser lido,
+        para que os índices continuem correspondendo aos de `nomes`. Com cache em
+        disco, o volume é gravado na primeira vez e depois reaberto por mmap.
+        """
+        if self._volume_disco is not None:
+            return self._volume_disco, []
+
+        imagens, erros = self.decodifica_todas(n_workers, modo)
+        if erros:
+            return None, erros
+        try:
+            volume = empilha([img for _, img in imagens])
+        except ValueError as e:
+            return None, [("série", e)]
+
+        if self.cache_disco is not None:
+            self.cache_disco.gravar(self.chave_disco, volume)
+            self._volume_disco = self.cache_disco.obter(self.chave_disco)
+            if self._volume_disco is not None:
+                return self._volume_disco, erros
+        return volume, erros
@@ -1,24 +1,20 @@
-import homepage
-import avaliar_teste_tc
-import guia
-#import paineis
-import dicom
-import registro
+import sys
+import time
+inicio_execucao = time.perf_counter()
+
 import streamlit as st
 from globais import *
 from configparser import ConfigParser
+# As páginas são importadas só quando abertas
+from paginas import PAGINAS, executa_pagina, relatorio_importacao
+from instrumentacao import exporta_indicadores, registra, tabela_tempos
+
+# Layout (precisa ser o primeiro comando do Streamlit)
+st.set_page_config(layout="wide")
 
 config = ConfigParser()
 config.read("parametros.ini")
 
-
-PAGES = {"Página Inicial": homepage,
-         "Guia de Usuário": guia,
-         "Qualidade da Imagem": avaliar_teste_tc,
-         "Registros dos Testes": registro,
-         "Acompanhamento das Doses": dicom,
-         }
-
 criar_pasta_raiz()
 verifica_pastas()
 pasta_csv, pasta_indicadores, pasta_sala_equipamento, pasta_sala_imagens, pasta_raiz = carrega_ini()
@@ -38,7 +34,7 @@ with col3:
 
 st.sidebar.header("Navegação")
 
-selection = st.sidebar.radio("", list(PAGES.keys()))
+selection = st.sidebar.radio("", list(PAGINAS.keys()))
 st.sidebar.write("---")
 
 
@@ -51,5 +47,34 @@ with c2:
 with c3:
     st.write("")
 
-page = PAGES[selection]
-page.app()
\ No newline at end of file
+executa_pagina(selection)
+
+registra("Execução completa", time.perf_counter() - inicio_execucao)
+
+# Tempos das etapas (última medição e percentis) e custo das importações
+with st.sidebar.expander("⏱️ Tempos das etapas"):
+    st.dataframe(tabela_tempos(), hide_index=True, column_config={
+        coluna: st.column_config.NumberColumn(format="%.1f")
+        for coluna in ("Última (ms)", "p50 (ms)", "p90 (ms)", "p99 (ms)")
+    })
+    st.table([
+        {"Módulo": modulo, "Importação (ms)": round(ms)}
+        for modulo, ms in relatorio_importacao(minimo_ms=20)
+    ])
+
+# Tarefas em segundo plano (a fila só é importada pelas páginas que a usam)
+if "fila_tarefas" in sys.modules:
+    tarefas = sys.modules["fila_tarefas"].FILA.tabela()
+    if tarefas:
+        with st.sidebar.expander("🗂️ Tarefas em segundo plano"):
+            st.dataframe(tarefas, hide_index=True, column_config={
+                "Andamento (%)": st.column_config.ProgressColumn(min_value=0, max_value=100, format="%.0f%%"),
+                "Duração (s)": st.column_config.NumberColumn(format="%.1f"),
+            })
+
+# Arquivos para acompanhar a latência no servidor (pasta de indicadores)
+exporta_indicadores(
+    pasta_indicadores,
+    carrega_parametro("instrumentacao", "formato", "ambos"),
+    float(carrega_parametro("instrumentacao", "jsonl_mb", 50)) * 1024**2,
+)
@@ -0,0 +1,65 @@
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+import pydicom as dicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_imagens import CacheImagens, chave_conteudo  # noqa: E402
+from decodificacao import decodifica_serie  # noqa: E402
+
+
+def arquivo_dicom(valor, nome):
+    """Corte de TC 8x8 com todos os valores armazenados iguais a `valor`, como objeto de arquivo com `.name`."""
+    meta = FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    meta.MediaStorageSOPClassUID = CTImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = CTImageStorage
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Rows, ds.Columns = 8, 8
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 16, 15
+    ds.PixelRepresentation = 0
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.RescaleSlope, ds.RescaleIntercept = 1, -1024
+    ds.PixelData = np.full((8, 8), valor, dtype=np.uint16).tobytes()
+    arquivo = BytesIO()
+    dicom.dcmwrite(arquivo, ds, enforce_file_format=True)
+    arquivo.name = nome
+    return arquivo
+
+
+def serie():
+    return [arquivo_dicom(1024 + i, f"img{i}.dcm") for i in range(3)]
+
+
+def confere(imagens, erros, arquivos):
+    assert erros == []
+    assert [nome for nome, _ in imagens] == [arquivo.name for arquivo in arquivos]
+    for i, (_, img) in enumerate(imagens):
+        assert np.all(np.asarray(img) == i)
+
+
+def test_decodifica_serie_sem_chaves():
+    arquivos = serie()
+    confere(*decodifica_serie(arquivos, n_workers=1, cache=CacheImagens(1024**2)), arquivos)
+
+
+def test_decodifica_serie_com_chaves():
+    arquivos = serie()
+    cache = CacheImagens(1024**2)
+    chaves = [f"chave{i}" for i in range(len(arquivos))]
+    confere(*decodifica_serie(arquivos, n_workers=1, cache=cache, chaves=chaves), arquivos)
+    # As imagens ficam no cache sob as chaves informadas, não sob o hash do conteúdo
+    assert all(cache.obter(chave) is not None for chave in chaves)
+    assert cache.obter(chave_conteudo(arquivos[0])) is None
+
+    # Segunda chamada: tudo vem do cache
+    confere(*decodifica_serie(arquivos, n_workers=1, cache=cache, chaves=chaves), arquivos)